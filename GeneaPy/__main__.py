@@ -0,0 +1,5 @@
+import sys
+
+from GeneaPy.geneapy import cli
+
+sys.exit(cli())
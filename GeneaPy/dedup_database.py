@@ -0,0 +1,65 @@
+import argparse
+import logging
+import os
+
+import pandas as pd
+
+from GeneaPy.modules import metrics
+from GeneaPy.modules.dedup import deduplicate
+
+logging.basicConfig(
+    filename="dedup_database.error.log", format="%(asctime)s:%(levelname)s:%(message)s"
+)
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        description="Merge the duplicate primers of a primer database, i.e. the "
+        "same pair under another name, with F and R swapped or reverse "
+        "complemented, or with the same Primer_Range, and write the remaining "
+        "primers sorted by amplicon position with a table of the merged names."
+    )
+    parser.add_argument(
+        "-d", "--database", type=str, required=True, help="primer database file"
+    )
+    parser.add_argument(
+        "-o", "--output", type=str, required=True, help="deduplicated database file"
+    )
+    parser.add_argument(
+        "-a",
+        "--aliases",
+        type=str,
+        help="file to write each merged primer and the primer it was merged "
+        "into (default=output with an _aliases suffix)",
+    )
+    parser.add_argument(
+        "--metrics",
+        type=str,
+        help="write stage timings and counters to this file at the end of the run, "
+        "as JSON if it ends in .json and Prometheus text otherwise",
+    )
+    return parser
+
+
+def aliases_path(output):
+    root, ext = os.path.splitext(output)
+    return "{}_aliases{}".format(root, ext or ".txt")
+
+
+def cli():
+    parser = get_parser()
+    args = vars(parser.parse_args())
+    with metrics.timer("database_load"):
+        db = pd.read_csv(args["database"], delimiter="\t", dtype=str, keep_default_na=False)
+    with metrics.timer("deduplicate"):
+        unique, aliases = deduplicate(db)
+    unique.to_csv(args["output"], sep="\t", index=False)
+    aliases.to_csv(args["aliases"] or aliases_path(args["output"]), sep="\t", index=False)
+    metrics.count("primers_merged", len(aliases))
+    print("Kept {} of {} primers, {} merged".format(len(unique), len(db), len(aliases)))
+    if args["metrics"]:
+        metrics.write(args["metrics"])
+
+
+if __name__ == "__main__":
+    cli()
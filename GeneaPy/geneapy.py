@@ -0,0 +1,188 @@
+""" Run any GeneaPy script as a subcommand, or several as jobs of a manifest.
+
+    python3 -m GeneaPy primer_finder --database primers.txt --variant 15:48787400
+    python3 -m GeneaPy run manifest.yaml
+
+A subcommand's module is only imported when it is run, so e.g. get_seq
+does not pay for importing pandas or pyensembl. A manifest lists jobs
+which run one after another in this process, so the genome FASTA
+handles, Ensembl releases and UCSC HTTP session opened by one job are
+reused by the next:
+
+    jobs:
+      - name: hg19 primers
+        command: primer_finder
+        args: {database: primers.txt, input: variants.txt, output: found.txt}
+      - command: get_seq
+        args: ["15:48787400", "--upstream", "10", "--downstream", "10"]
+
+args is either a list of command line arguments or a mapping of option
+names to values, where true adds a flag and a list gives several values.
+Manifests ending in .json are read as JSON, anything else as YAML.
+
+Each job starts with its own metrics, warning filters and log file
+(<command>.error.log, as when its script is run on its own), so nothing
+a job records or configures carries over to the next.
+"""
+import importlib
+import json
+import logging
+import sys
+import time
+import warnings
+
+from GeneaPy.modules import metrics
+
+COMMANDS = {
+    "get_seq": ("GeneaPy.get_seq", "scrape the DNA sequence of a position or range"),
+    "get_locus_metadata": (
+        "GeneaPy.get_locus_metadata",
+        "gene, transcript and exon metadata of genomic positions",
+    ),
+    "unknown_primer": (
+        "GeneaPy.unknown_primer",
+        "amplicon and metadata of primer pairs via in-silico PCR",
+    ),
+    "primer_finder": ("GeneaPy.primer_finder", "find primers covering variants"),
+    "off_target": ("GeneaPy.off_target", "find off-target primer binding sites"),
+    "index_gtf": ("GeneaPy.index_gtf", "build an annotation index from a GTF"),
+    "dedup_database": (
+        "GeneaPy.dedup_database",
+        "merge the duplicate primers of a primer database",
+    ),
+    "reannotate_database": (
+        "GeneaPy.reannotate_database",
+        "refresh the gene and exon columns of a primer database",
+    ),
+}
+
+
+def usage():
+    lines = ["usage: geneapy <command> [args...]", "", "commands:"]
+    for name, (_, description) in COMMANDS.items():
+        lines.append("  {:<20}{}".format(name, description))
+    lines.append("  {:<20}{}".format("run", "run the jobs of a JSON or YAML manifest"))
+    return "\n".join(lines)
+
+
+def run_command(command, argv):
+    """ Import the module of a command and run its cli with argv."""
+    if command not in COMMANDS:
+        raise ValueError("unknown command {}\n{}".format(command, usage()))
+    module = importlib.import_module(COMMANDS[command][0])
+    saved = sys.argv
+    sys.argv = ["geneapy {}".format(command)] + [str(a) for a in argv]
+    try:
+        module.cli()
+    finally:
+        sys.argv = saved
+
+
+def run_job(command, argv):
+    """ Run a command as a manifest job, restoring the warning filters and
+        root log handlers of this process afterwards.
+    """
+    metrics.reset()
+    root = logging.getLogger()
+    handlers = root.handlers[:]
+    # the script's own basicConfig only applies when it is first imported
+    handler = logging.FileHandler("{}.error.log".format(command), delay=True)
+    handler.setFormatter(logging.Formatter("%(asctime)s:%(levelname)s:%(message)s"))
+    root.handlers = [handler]
+    try:
+        with warnings.catch_warnings():
+            run_command(command, argv)
+    finally:
+        root.handlers = handlers
+        handler.close()
+
+
+def job_argv(args):
+    """ Convert the args of a manifest job to command line arguments."""
+    if args is None:
+        return []
+    if isinstance(args, (list, tuple)):
+        return [str(a) for a in args]
+    argv = []
+    for name, value in args.items():
+        option = "--{}".format(name)
+        if value is True:
+            argv.append(option)
+        elif value is False or value is None:
+            continue
+        elif isinstance(value, (list, tuple)):
+            argv += [option] + [str(v) for v in value]
+        else:
+            argv += [option, str(value)]
+    return argv
+
+
+def read_manifest(path):
+    """ Return the list of jobs in a JSON or YAML manifest."""
+    with open(path) as f:
+        if path.endswith(".json"):
+            manifest = json.load(f)
+        else:
+            try:
+                import yaml
+            except ImportError:
+                raise ImportError("PyYAML is required to read YAML manifests")
+            manifest = yaml.safe_load(f)
+    jobs = manifest.get("jobs") if isinstance(manifest, dict) else manifest
+    if not isinstance(jobs, list):
+        raise ValueError("{} does not hold a list of jobs".format(path))
+    return jobs
+
+
+def run_manifest(path):
+    """ Run every job of a manifest, carrying on past failed jobs.
+
+    Returns:
+        list of dicts with the name, command, status and seconds of each job
+    """
+    results = []
+    for number, job in enumerate(read_manifest(path), 1):
+        name = job.get("name", "job {}".format(number))
+        start = time.time()
+        status = "ok"
+        try:
+            run_job(job["command"], job_argv(job.get("args")))
+        except SystemExit as e:
+            # argparse exits on invalid arguments
+            status = "ok" if not e.code else "failed: exit {}".format(e.code)
+        except Exception as e:
+            status = "failed: {}: {}".format(type(e).__name__, e)
+        results.append(
+            {
+                "name": name,
+                "command": job.get("command"),
+                "status": status,
+                "seconds": round(time.time() - start, 3),
+            }
+        )
+        print(
+            "{name}\t{command}\t{status}\t{seconds}s".format(**results[-1]), file=sys.stderr
+        )
+    return results
+
+
+def cli(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] in ("-h", "--help"):
+        print(usage())
+        return 0
+    if argv[0] == "run":
+        if len(argv) != 2:
+            print("usage: geneapy run manifest.(yaml|json)", file=sys.stderr)
+            return 2
+        results = run_manifest(argv[1])
+        return int(any(r["status"] != "ok" for r in results))
+    if argv[0] not in COMMANDS:
+        print("geneapy: unknown command {}\n{}".format(argv[0], usage()), file=sys.stderr)
+        return 2
+    run_command(argv[0], argv[1:])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(cli())
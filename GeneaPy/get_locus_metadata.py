@@ -1,31 +1,152 @@
 import argparse
+import logging
+import multiprocessing
+import os
+import sys
 
-import modules.custom_exceptions as ex
-from modules.metadata import LocusMetaData
+import GeneaPy.modules.custom_exceptions as ex
+from GeneaPy.modules import bgzf_fasta, metrics, sequence_index
+from GeneaPy.modules.interval_index import sweep_overlaps
+from GeneaPy.modules.liftover import strip_chr
+from GeneaPy.modules.metadata import LocusMetaData, open_annotation
 
+# positions of each worker process are annotated with these LocusMetaData
+# arguments, set by init_worker
+SETTINGS = {}
+CHUNK_SIZE = 64
+BED_HEADER = (
+    "Interval",
+    "Name",
+    "Gene",
+    "Gene ID",
+    "Transcript",
+    "Transcript ID",
+    "Type",
+    "Exon ID",
+    "Exon",
+    "Intron",
+    "Feature Range",
+    "Overlap",
+)
+HGVS_HEADER = (
+    "Query",
+    "Gene",
+    "Transcript",
+    "Transcript ID",
+    "Type",
+    "Exon",
+    "Intron",
+    "HGVS",
+)
 
-def output_all_metadata(infile, flank, outfile, hg, genome=None, gene_list=[]):
+
+def output_all_metadata(
+    infile, flank, outfile, hg, genome=None, gene_list=[], annotation=None, workers=1
+):
     """ Parse the metadata for all genomic positions
         detailed within infile and write to outfile
+
+    With workers > 1 the positions are annotated by a pool of processes,
+    see shared_genome for how they read the genome. Only an annotation
+    index is shared between the workers, without one each loads its own
+    pyensembl release. The metrics each worker records are sent back with
+    its results and added to those of this process.
     """
+    if workers > 1 and genome and not os.path.isdir(genome):
+        genome = shared_genome(genome)
+    if workers > 1 and not annotation:
+        logging.warning("Without an annotation index each worker loads its own Ensembl release")
+    settings = {
+        "hg_version": hg,
+        "flank": flank,
+        "genome": genome,
+        "gene_list": gene_list,
+        "annotation": annotation,
+    }
     with open(outfile, "w") as out:
         write_header(out)
         with open(infile, "r") as f:
-            for line in f:
+            positions = (line.rstrip("\n") for line in f)
+            if workers > 1:
+                pool = multiprocessing.Pool(
+                    workers, initializer=init_pool_worker, initargs=(settings,)
+                )
                 try:
-                    position = line.rstrip("\n")
-                    data = LocusMetaData.from_position(
-                        genomic_position=position,
-                        hg_version=hg,
-                        flank=flank,
-                        genome=genome,
-                        gene_list=gene_list,
-                    )
-                    data_tuple = restructure_metadata(data)
-                    out.write("\t".join(data_tuple) + "\n")
-                except ex.NoGene as e:
-                    print("ERROR: {}".format(e))
-                    continue
+                    results = pool.imap(annotate_in_worker, positions, CHUNK_SIZE)
+                    write_results(out, merge_worker_metrics(results))
+                finally:
+                    pool.close()
+                    pool.join()
+            else:
+                init_worker(settings)
+                write_results(out, map(annotate_position, positions))
+
+
+def shared_genome(genome):
+    """ Return the genome for worker processes to open. A FASTA is written
+        to a sequence index, which the workers map read-only so they share
+        one copy in memory. A bgzipped FASTA is returned as it is, after
+        writing its indexes, as each worker only holds its own block cache
+        of it. The FASTA itself is returned if its sequence index cannot be
+        written, e.g. to a read-only directory without GENEAPY_CACHE_DIR.
+    """
+    if genome.endswith(".gz"):
+        bgzf_fasta.BgzfFasta(genome).close()
+        return genome
+    try:
+        return sequence_index.build(genome)
+    except OSError as e:
+        logging.warning("Cannot write the sequence index of {}: {}".format(genome, e))
+        return genome
+
+
+def init_worker(settings):
+    SETTINGS.clear()
+    SETTINGS.update(settings)
+
+
+def init_pool_worker(settings):
+    # drop the metrics inherited from the parent, which already has them
+    metrics.reset()
+    init_worker(settings)
+
+
+def annotate_in_worker(position):
+    """ annotate_position in a worker process, also returning the metrics
+        recorded annotating the position.
+    """
+    return annotate_position(position) + (metrics.drain(),)
+
+
+def merge_worker_metrics(results):
+    """ Add the metrics of each result of annotate_in_worker to this
+        process's and yield the result as annotate_position returns it.
+    """
+    for data_tuple, error, drained in results:
+        metrics.merge(drained)
+        yield data_tuple, error
+
+
+def annotate_position(position):
+    """ Return the output fields of a position, or the type and message
+        of the NoGene error raised annotating it.
+    """
+    try:
+        data = LocusMetaData.from_position(genomic_position=position, **SETTINGS)
+        return restructure_metadata(data), None
+    except ex.NoGene as e:
+        return None, (type(e).__name__, str(e))
+
+
+def write_results(out, results):
+    """ Write the output fields of each position in input order."""
+    for data_tuple, error in results:
+        if error:
+            metrics.count("exceptions", type=error[0])
+            print("ERROR: {}".format(error[1]))
+            continue
+        with metrics.timer("write"):
+            out.write("\t".join(data_tuple) + "\n")
 
 
 def write_header(out):
@@ -46,6 +167,124 @@ def write_header(out):
     out.write("\t".join(header) + "\n")
 
 
+def output_hgvs(positions, out, annotation):
+    """ Write the exon or intron number and HGVS c. coordinate of each
+        position in every transcript overlapping it, one row per transcript.
+
+    Args:
+        positions: iterable of genomic positions e.g. chr15:48733918
+        out: file object to write to
+        annotation: annotation index directory (or AnnotationIndex)
+    """
+    index = open_annotation(annotation)
+    out.write("\t".join(HGVS_HEADER) + "\n")
+    for position in positions:
+        contig, locus = position.strip().lower().replace("chr", "").split(":")
+        with metrics.timer("annotation_lookup"):
+            coordinates = index.transcript_coordinates(contig, int(locus))
+        if not coordinates:
+            error = ex.NoGene(contig, locus)
+            metrics.count_exception(error)
+            print("ERROR: {}".format(error), file=sys.stderr)
+            continue
+        with metrics.timer("write"):
+            for c in coordinates:
+                row = (
+                    "chr{}:{}".format(contig, locus),
+                    c.gene_name or "-",
+                    c.transcript_name or "-",
+                    c.transcript_id,
+                    c.biotype or "-",
+                    c.number if c.exon else "-",
+                    "-" if c.exon else c.number,
+                    "{}:{}".format(c.transcript_id, c.hgvs),
+                )
+                out.write("\t".join(row) + "\n")
+
+
+def read_bed(bed):
+    """ Return the intervals of a BED file by contig, as 1-based
+        (start, end, name) tuples with inclusive ends.
+    """
+    intervals = {}
+    with open(bed) as f:
+        for line in f:
+            if not line.strip() or line.startswith(("#", "track", "browser")):
+                continue
+            fields = line.rstrip("\n").split("\t")
+            name = fields[3] if len(fields) > 3 else ""
+            interval = (int(fields[1]) + 1, int(fields[2]), name)
+            intervals.setdefault(strip_chr(fields[0]), []).append(interval)
+    return intervals
+
+
+def output_bed_metadata(bed, outfile, annotation):
+    """ Write every gene, transcript and exon or intron overlapping each
+        interval of a BED file to outfile.
+
+    The intervals of each contig are swept in order of start against the
+    exons and introns of the annotation index, and the rows of each
+    interval are written as soon as it is swept. Intervals overlapping no
+    transcript are written with "-" in place of the annotation.
+    """
+    index = open_annotation(annotation)
+    with open(outfile, "w") as out:
+        out.write("\t".join(BED_HEADER) + "\n")
+        for contig, intervals in read_bed(bed).items():
+            metrics.count("intervals", len(intervals))
+            for lines in contig_bed_rows(index, contig, intervals):
+                with metrics.timer("write"):
+                    out.writelines("\t".join(line) + "\n" for line in lines)
+
+
+def contig_bed_rows(index, contig, intervals):
+    """ Yield the output rows of each interval of a contig, in order of start."""
+    starts, ends, names = zip(*intervals)
+    features = index.features(contig)
+    transcripts = decoded(index.table(contig, "transcripts"))
+    genes = decoded(index.table(contig, "genes"))
+    for query, rows in sweep_overlaps(starts, ends, features["start"], features["end"]):
+        start, end = starts[query], ends[query]
+        interval = ("chr{}:{}-{}".format(contig, start, end), names[query])
+        lines = []
+        for row in rows:
+            transcript = features["transcript"][row]
+            gene = transcripts["gene"][transcript]
+            exon = features["exon"][row]
+            number = "{}/{}".format(features["number"][row], features["total"][row])
+            feature_start, feature_end = int(features["start"][row]), int(features["end"][row])
+            lines.append(
+                interval
+                + (
+                    genes["gene_name"][gene] if gene >= 0 else "-",
+                    genes["gene_id"][gene] if gene >= 0 else "-",
+                    transcripts["transcript_name"][transcript],
+                    transcripts["transcript_id"][transcript],
+                    transcripts["transcript_biotype"][transcript],
+                    features["exon_id"][row].decode() if exon else "N/A",
+                    number if exon else "-",
+                    "-" if exon else number,
+                    "{}:{}-{}".format(contig, feature_start, feature_end),
+                    str(min(end, feature_end) - max(start, feature_start) + 1),
+                )
+            )
+        yield lines or [interval + ("-",) * (len(BED_HEADER) - 2)]
+
+
+def decoded(table):
+    """ Return the columns of an annotation index table as lists, with
+        text decoded to str.
+    """
+    if not len(table):
+        return {}
+    return {
+        name: [v.decode() for v in table[name].tolist()]
+        if table.dtype[name].kind == "S"
+        else table[name].tolist()
+        for name in table.dtype.names
+    }
+
+
 def restructure_metadata(data):
     query = "chr{}:{}".format(data.contig, data.position)
     gene_location = "{}:{}-{}".format(data.gene.contig, data.gene.start, data.gene.end)
@@ -72,6 +311,13 @@ def get_parser():
         description="Scrape a genomic positions meta-data from Ensembl"
     )
     parser.add_argument("-i", "--input", type=str, help="file with genomic positions")
+    parser.add_argument(
+        "-b",
+        "--bed",
+        type=str,
+        help="BED file of intervals to report every overlapping gene, transcript and "
+        "exon/intron of, requires --annotation",
+    )
     parser.add_argument("-p", "--position", type=str, help="genomic position")
     parser.add_argument(
         "-hg",
@@ -98,13 +344,56 @@ def get_parser():
         "-g", "--genome", type=str, help="path to genome FASTA file", default=None
     )
     parser.add_argument("-o", "--output", type=str, help="name of output file")
+    parser.add_argument(
+        "-a",
+        "--annotation",
+        type=str,
+        help="annotation index built by index_gtf to use instead of pyensembl",
+        default=None,
+    )
+    parser.add_argument(
+        "--hgvs",
+        action="store_true",
+        help="report the exon/intron number and HGVS c. coordinate of --position or "
+        "--input in every overlapping transcript, requires --annotation",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        help="processes annotating --input, sharing one memory-mapped copy of the "
+        "--annotation index and --genome, so use with --annotation (default=1)",
+        default=1,
+    )
+    parser.add_argument(
+        "--metrics",
+        type=str,
+        help="write stage timings and counters to this file at the end of the run, "
+        "as JSON if it ends in .json and Prometheus text otherwise",
+    )
     return parser
 
 
 def cli():
     parser = get_parser()
     args = vars(parser.parse_args())
-    if args["input"]:
+    if args["bed"]:
+        if not (args["annotation"] and args["output"]):
+            parser.error("--bed requires --annotation and --output")
+        output_bed_metadata(args["bed"], args["output"], args["annotation"])
+    elif args["hgvs"]:
+        if not args["annotation"]:
+            parser.error("--hgvs requires --annotation")
+        positions = open(args["input"]) if args["input"] else [args["position"]]
+        out = open(args["output"], "w") if args["output"] else sys.stdout
+        try:
+            output_hgvs(positions, out, args["annotation"])
+        finally:
+            if args["input"]:
+                positions.close()
+            if args["output"]:
+                out.close()
+    elif args["input"]:
         output_all_metadata(
             args["input"],
             args["flank"],
@@ -112,6 +401,8 @@ def cli():
             args["genome_version"],
             args["genome"],
             args["gene_list"],
+            args["annotation"],
+            args["workers"],
         )
     else:
         data = LocusMetaData.from_position(
@@ -120,8 +411,11 @@ def cli():
             gene_list=args["gene_list"],
             flank=args["flank"],
             genome=args["genome"],
+            annotation=args["annotation"],
         )
         print(data)
+    if args["metrics"]:
+        metrics.write(args["metrics"])
 
 
 if __name__ == "__main__":
@@ -1,13 +1,16 @@
 import argparse
+import functools
+import os
 import re
 import sys
 import textwrap
 import time
 
 import bs4
-import requests
 
 import GeneaPy.modules.custom_exceptions as ex
+from GeneaPy.modules import bgzf_fasta, metrics, ucsc
+from GeneaPy.modules.sequence_index import SequenceIndex
 from GeneaPy.modules.common import correct_hg_version
 
 if not sys.platform == "cygwin":
@@ -29,7 +32,8 @@ def get_seq(
     Args:
         location: genomic position ('1:10000') or genomic range ('1:10000-10100')
         hg_version: human genome version
-        genome: path to genome FASTA file
+        genome: path to genome FASTA file, bgzipped FASTA (.fa.gz) or
+                sequence index directory
         upstream: bases upstream from location
         downstream: bases downstream from location
         header: give the sequence a FASTA header
@@ -45,10 +49,11 @@ def get_seq(
     """
     hg_version = correct_hg_version(hg_version)
     seq_range = create_region(location, upstream, downstream)
-    if genome:
-        seq = get_sequence_locally(seq_range, genome)
-    else:
-        seq = get_sequence(seq_range, hg_version)
+    with metrics.timer("sequence_fetch", source="local" if genome else "das"):
+        if genome:
+            seq = get_sequence_locally(seq_range, genome)
+        else:
+            seq = get_sequence(seq_range, hg_version)
     # capatilise location base if it is a position
     if "-" not in location:
         seq = upper_pos(seq, upstream, downstream)
@@ -82,17 +87,18 @@ def get_sequence(seq_range, hg_version):
 
         http://www.biodas.org/documents/spec-1.53.html
     """
-    req = requests.get(
+    req = ucsc.get(
         "http://genome.ucsc.edu/cgi-bin/das/"
         + hg_version
         + "/dna?segment="
         + seq_range.replace("-", ",")
     )
     req.raise_for_status()
-    url = bs4.BeautifulSoup(req.text, features="xml").prettify()
-    search = re.findall(r"[tacg{5}].*", url)
-    seqs = [s for s in search if not s.strip("tacg")]
-    seq = "".join(seqs)
+    with metrics.timer("xml_parse"):
+        url = bs4.BeautifulSoup(req.text, features="xml").prettify()
+        search = re.findall(r"[tacg{5}].*", url)
+        seqs = [s for s in search if not s.strip("tacg")]
+        seq = "".join(seqs)
     if not seq:
         raise ex.NoSequence(seq_range)
     return seq
@@ -104,12 +110,25 @@ def get_sequence_locally(seq_range, genome_path):
     """
     chrom, start, end = tuple(re.split(r"[:,]", seq_range))
     chrom = "".join(("chr", chrom))
-    genome = pysam.FastaFile(genome_path)
+    genome = open_fasta(genome_path)
     # -1 is required otherwise the first base is missing, no idea why
     seq = genome.fetch(chrom, int(start) - 1, int(end))
     return seq
 
 
+@functools.lru_cache(maxsize=8)
+def open_fasta(genome_path):
+    """ Open a genome FASTA file, bgzipped FASTA or sequence index shared
+        between processes once and reuse the handle for later queries.
+    """
+    if os.path.isdir(genome_path):
+        return SequenceIndex(genome_path)
+    if genome_path.endswith(".gz"):
+        # decompressed blocks are cached across every query of the genome
+        return bgzf_fasta.BgzfFasta(genome_path)
+    return pysam.FastaFile(genome_path)
+
+
 def upper_pos(seq, upstream, downstream):
     """ Capatilise the position of interest in the sequence."""
     before = seq[:upstream]
@@ -145,12 +164,26 @@ def get_parser():
         help="number of base downstream from genomic position",
     )
     parser.add_argument("-r", "--header", action="store_true", help="fasta like header")
+    parser.add_argument(
+        "--block_cache",
+        type=int,
+        help="decompressed blocks of a bgzipped --genome to keep in memory "
+        "(default={})".format(bgzf_fasta.SETTINGS["cache_blocks"]),
+    )
+    parser.add_argument(
+        "--metrics",
+        type=str,
+        help="write stage timings and counters to this file at the end of the run, "
+        "as JSON if it ends in .json and Prometheus text otherwise",
+    )
     return parser
 
 
 def cli():
     parser = get_parser()
     args = vars(parser.parse_args())
+    if args["block_cache"] is not None:
+        bgzf_fasta.SETTINGS["cache_blocks"] = args["block_cache"]
     seq = get_seq(
         args["query"],
         args["genome_version"],
@@ -160,6 +193,8 @@ def cli():
         args["header"],
     )
     print(seq)
+    if args["metrics"]:
+        metrics.write(args["metrics"])
 
 
 if __name__ == "__main__":
@@ -0,0 +1,46 @@
+import argparse
+import logging
+
+from GeneaPy.modules import metrics
+from GeneaPy.modules.annotation_index import build_index
+
+logging.basicConfig(
+    filename="index_gtf.error.log", format="%(asctime)s:%(levelname)s:%(message)s"
+)
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        description="Stream an Ensembl or GENCODE GTF into an annotation index "
+        "which get_locus_metadata can use instead of pyensembl."
+    )
+    parser.add_argument(
+        "-g", "--gtf", type=str, required=True, help="GTF file, gzipped if it ends in .gz"
+    )
+    parser.add_argument(
+        "-o", "--output", type=str, required=True, help="directory to write the index to"
+    )
+    parser.add_argument(
+        "-n", "--name", type=str, help="release name of the index (default=GTF file name)"
+    )
+    parser.add_argument(
+        "--metrics",
+        type=str,
+        help="write stage timings and counters to this file at the end of the run, "
+        "as JSON if it ends in .json and Prometheus text otherwise",
+    )
+    return parser
+
+
+def cli():
+    parser = get_parser()
+    args = vars(parser.parse_args())
+    with metrics.timer("index_build"):
+        index = build_index(args["gtf"], args["output"], args["name"])
+    print("Indexed {} contigs of {} in {}".format(len(index.contigs), index.release, index.path))
+    if args["metrics"]:
+        metrics.write(args["metrics"])
+
+
+if __name__ == "__main__":
+    cli()
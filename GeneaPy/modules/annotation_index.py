@@ -0,0 +1,645 @@
+""" Annotate positions from GeneaPy's own index of a GTF instead of a
+    pyensembl database.
+
+build_index streams an Ensembl or GENCODE GTF (plain or gzipped) once,
+keeping only its gene, transcript, exon and coding records, spooling them
+to one file per contig so only a single contig is ever held in memory.
+Each contig is then written as sorted, memory-mappable structured arrays:
+
+    <index>/meta.json           release name, source and contigs
+    <index>/names.npy           gene name -> contig and row, sorted by name
+    <index>/transcript_ids.npy  transcript id -> contig and row, sorted by id
+    <index>/<contig>/genes.npy, transcripts.npy, exons.npy
+
+AnnotationIndex answers the queries pyensembl_wrappers makes of a
+pyensembl Genome (genes and transcripts at a locus, genes by name,
+transcripts by id) with binary searches, loading a contig's arrays on
+first use.
+
+Each exon also records its spliced offset, the cumulative length of the
+exons before it in its transcript, and each transcript the offsets of
+its first and last coding bases. The HGVS c. coordinate of a position is
+then a binary search of its transcript's exons plus arithmetic.
+"""
+import collections
+import gzip
+import json
+import logging
+import os
+import re
+import shutil
+
+import numpy as np
+import pandas as pd
+from pyensembl import Exon, Gene, Transcript
+
+from GeneaPy.modules.interval_index import SPAN, sweep_overlaps
+from GeneaPy.modules.liftover import strip_chr
+
+FORMAT = 2
+TABLES = ("gene", "transcript", "exon")
+CODING = ("CDS", "start_codon", "stop_codon")
+FEATURES = TABLES + CODING
+ATTRIBUTES = {
+    "gene_id": ("gene_id",),
+    "gene_name": ("gene_name",),
+    "gene_biotype": ("gene_biotype", "gene_type"),
+    "transcript_id": ("transcript_id",),
+    "transcript_name": ("transcript_name",),
+    "transcript_biotype": ("transcript_biotype", "transcript_type"),
+    "exon_id": ("exon_id",),
+}
+COLUMNS = ["feature", "start", "end", "strand"] + list(ATTRIBUTES)
+ATTRIBUTE = re.compile(r'(\w+) "([^"]*)"')
+TranscriptCoordinate = collections.namedtuple(
+    "TranscriptCoordinate",
+    ["transcript_id", "transcript_name", "biotype", "gene_name", "exon", "number", "hgvs"],
+)
+
+
+def parse_attributes(field):
+    """ Return the attributes of a GTF line that the index keeps."""
+    found = dict(ATTRIBUTE.findall(field))
+    values = []
+    for names in ATTRIBUTES.values():
+        values.append(next((found[n] for n in names if n in found), ""))
+    return values
+
+
+def spool_gtf(gtf, directory):
+    """ Split the gene, transcript and exon records of a GTF into one
+        tab separated file per contig.
+
+    Returns:
+        list of the contigs in the order they were first seen
+    """
+    opener = gzip.open if gtf.endswith(".gz") else open
+    spools = {}
+    try:
+        with opener(gtf, "rt") as f:
+            for line in f:
+                if line.startswith("#"):
+                    continue
+                fields = line.rstrip("\n").split("\t")
+                if len(fields) < 9 or fields[2] not in FEATURES:
+                    continue
+                contig = strip_chr(fields[0])
+                if contig not in spools:
+                    path = os.path.join(directory, "{}.spool".format(len(spools)))
+                    spools[contig] = open(path, "w")
+                record = [fields[2], fields[3], fields[4], fields[6]]
+                spools[contig].write("\t".join(record + parse_attributes(fields[8])) + "\n")
+    finally:
+        for spool in spools.values():
+            spool.close()
+    return list(spools)
+
+
+def spans(records, key, columns):
+    """ Return one row per key value of records spanning its records'
+        start to end, taking the other columns from its first record.
+    """
+    if records.empty:
+        return pd.DataFrame(columns=["start", "end"] + columns)
+    grouped = records.groupby(key, sort=False)
+    found = grouped[columns].first()
+    found["start"] = grouped["start"].min()
+    found["end"] = grouped["end"].max()
+    return found.reset_index()
+
+
+def text(values):
+    """ Return strings as a compact fixed width bytes array."""
+    values = np.asarray(values, dtype=object).astype(str)
+    width = max((len(v) for v in values), default=1)
+    return np.array([v.encode() for v in values], dtype="S{}".format(max(width, 1)))
+
+
+def table(df, strings, integers):
+    """ Return the columns of df as a structured array."""
+    dtypes = []
+    columns = {}
+    for c in strings:
+        columns[c] = text(df[c].values)
+        dtypes.append((c, columns[c].dtype))
+    for c in integers:
+        columns[c] = df[c].values.astype(np.int64)
+        dtypes.append((c, np.int64))
+    array = np.zeros(len(df), dtype=dtypes)
+    for c, values in columns.items():
+        array[c] = values
+    return array
+
+
+def index_contig(records):
+    """ Build the gene, transcript and exon tables of one contig.
+
+    Genes and transcripts missing their own GTF record are spanned from
+    their transcripts or exons. Exons are grouped by transcript in the
+    order of transcription, so exon n of a transcript is row
+    first_exon + n - 1.
+
+    Transcripts with coding records (CDS, start and stop codons) record
+    the spliced offsets of their first and last coding bases, and -1
+    otherwise.
+    """
+    records = records[records.gene_id != ""]
+    exons = records[records.feature == "exon"]
+    transcripts = records[records.feature == "transcript"]
+    unrecorded = exons[~exons.transcript_id.isin(transcripts.transcript_id)]
+    transcripts = pd.concat([transcripts, unrecorded])
+    transcripts = spans(
+        transcripts[transcripts.transcript_id != ""],
+        "transcript_id",
+        ["transcript_name", "transcript_biotype", "strand", "gene_id"],
+    )
+    genes = records[records.feature == "gene"]
+    unrecorded = records[~records.gene_id.isin(genes.gene_id)]
+    genes = spans(pd.concat([genes, unrecorded]), "gene_id", ["gene_name", "gene_biotype", "strand"])
+
+    genes = genes.sort_values(["start", "end"]).reset_index(drop=True)
+    gene_rows = pd.Series(np.arange(len(genes)), index=genes.gene_id.values)
+    transcripts = transcripts.sort_values(["start", "end"]).reset_index(drop=True)
+    transcripts["gene"] = gene_rows.reindex(transcripts.gene_id.values).fillna(-1).values
+
+    exons = exons.drop_duplicates(["transcript_id", "start", "end"])
+    transcript_rows = pd.Series(
+        np.arange(len(transcripts)), index=transcripts.transcript_id.values
+    )
+    exons = exons.assign(transcript=transcript_rows.reindex(exons.transcript_id.values).values)
+    exons = exons[exons.transcript.notnull()]
+    # transcription order: ascending on the + strand, descending on the -
+    direction = np.where(exons.strand.values == "-", -1, 1)
+    order = np.lexsort((exons.start.values * direction, exons.transcript.values))
+    exons = exons.iloc[order].reset_index(drop=True)
+    exons["transcript"] = exons.transcript.astype(np.int64)
+    counts = np.bincount(exons.transcript.values, minlength=len(transcripts))
+    transcripts["exons"] = counts
+    transcripts["first_exon"] = np.cumsum(counts) - counts
+    # prefix sums of the exon lengths give the spliced offset of each exon
+    lengths = (exons.end - exons.start + 1).values
+    before = np.cumsum(lengths) - lengths
+    exons["offset"] = before - before[transcripts.first_exon.values[exons.transcript.values]]
+
+    coding = records[records.feature.isin(CODING)].groupby("transcript_id")
+    coding = pd.DataFrame({"start": coding.start.min(), "end": coding.end.max()})
+    coding = coding.reindex(transcripts.transcript_id.values)
+    minus = transcripts.strand.values == "-"
+    first_base = np.where(minus, coding.end.values, coding.start.values)
+    last_base = np.where(minus, coding.start.values, coding.end.values)
+    transcripts["coding_first"] = spliced_offsets(exons, first_base)
+    transcripts["coding_last"] = spliced_offsets(exons, last_base)
+
+    return (
+        table(genes, ["gene_id", "gene_name", "gene_biotype", "strand"], ["start", "end"]),
+        table(
+            transcripts,
+            ["transcript_id", "transcript_name", "transcript_biotype", "strand"],
+            ["start", "end", "gene", "first_exon", "exons", "coding_first", "coding_last"],
+        ),
+        table(exons, ["exon_id"], ["start", "end", "transcript", "offset"]),
+    )
+
+
+def spliced_offsets(exons, positions):
+    """ Return the spliced offset of one genomic position per transcript,
+        or -1 where it is missing or not within an exon of the transcript.
+
+    Args:
+        exons: exons in transcription order with transcript rows and offsets
+        positions: position of each transcript, NaN where missing
+    """
+    offsets = np.full(len(positions), -1, dtype=np.int64)
+    position = np.asarray(positions, dtype=float)[exons.transcript.values]
+    within = (exons.start.values <= position) & (position <= exons.end.values)
+    exons = exons[within]
+    position = position[within].astype(np.int64)
+    # distance into the exon in the direction of transcription
+    into = np.where(
+        exons.strand.values == "-", exons.end.values - position, position - exons.start.values
+    )
+    offsets[exons.transcript.values] = exons.offset.values + into
+    return offsets
+
+
+def hgvs_coordinate(offset, coding_first, coding_last):
+    """ Return the HGVS c. coordinate of a spliced offset, or n. for a
+        transcript without a coding region.
+    """
+    if coding_first < 0:
+        return "n.{}".format(offset + 1)
+    if offset < coding_first:
+        return "c.-{}".format(coding_first - offset)
+    if offset > coding_last:
+        return "c.*{}".format(offset - coding_last)
+    return "c.{}".format(offset - coding_first + 1)
+
+
+def build_index(gtf, output, name=None):
+    """ Stream a GTF into an annotation index directory.
+
+    Args:
+        gtf: path to a GTF file, gzipped if it ends in .gz
+        output: directory to write the index to, replacing any index there
+        name: release name reported for the index (default=GTF file name)
+
+    Returns:
+        the AnnotationIndex written
+    """
+    if os.path.exists(os.path.join(output, "meta.json")):
+        shutil.rmtree(output)
+    spool = os.path.join(output, "spool")
+    os.makedirs(spool)
+    try:
+        contigs = spool_gtf(gtf, spool)
+        names = []
+        transcript_ids = []
+        for number, contig in enumerate(contigs):
+            records = pd.read_csv(
+                os.path.join(spool, "{}.spool".format(number)),
+                sep="\t",
+                header=None,
+                names=COLUMNS,
+                dtype=str,
+                keep_default_na=False,
+            )
+            records["start"] = records.start.astype(np.int64)
+            records["end"] = records.end.astype(np.int64)
+            genes, transcripts, exons = index_contig(records)
+            os.makedirs(os.path.join(output, str(number)))
+            for label, array in zip(TABLES, (genes, transcripts, exons)):
+                np.save(os.path.join(output, str(number), label + "s.npy"), array)
+            names.append(
+                pd.DataFrame(
+                    {"key": genes["gene_name"], "contig": number, "row": np.arange(len(genes))}
+                )
+            )
+            transcript_ids.append(
+                pd.DataFrame(
+                    {
+                        "key": transcripts["transcript_id"],
+                        "contig": number,
+                        "row": np.arange(len(transcripts)),
+                    }
+                )
+            )
+            logging.info("indexed {} genes on contig {}".format(len(genes), contig))
+    finally:
+        shutil.rmtree(spool)
+    for label, frames in (("names", names), ("transcript_ids", transcript_ids)):
+        keys = pd.concat(frames) if frames else pd.DataFrame(columns=["key", "contig", "row"])
+        keys = keys.sort_values(["key", "contig", "row"], kind="mergesort")
+        array = np.zeros(
+            len(keys),
+            dtype=[("key", text(keys.key.values).dtype), ("contig", np.int64), ("row", np.int64)],
+        )
+        array["key"] = keys.key.values
+        array["contig"] = keys.contig.values
+        array["row"] = keys.row.values
+        np.save(os.path.join(output, label + ".npy"), array)
+    meta = {
+        "format": FORMAT,
+        "release": name or os.path.basename(gtf).split(".gtf")[0],
+        "source": os.path.abspath(gtf),
+        "contigs": contigs,
+    }
+    with open(os.path.join(output, "meta.json"), "w") as f:
+        json.dump(meta, f, indent=2)
+    return AnnotationIndex(output)
+
+
+class IndexedGene(Gene):
+    """ A pyensembl Gene whose transcripts come from an AnnotationIndex."""
+
+    def __init__(self, index, contig, row):
+        record = index.table(contig, "genes")[row]
+        Gene.__init__(
+            self,
+            gene_id=record["gene_id"].decode(),
+            gene_name=record["gene_name"].decode(),
+            contig=contig,
+            start=record["start"],
+            end=record["end"],
+            strand=record["strand"].decode(),
+            biotype=record["gene_biotype"].decode(),
+            genome=index,
+        )
+        self.row = row
+
+    @property
+    def transcripts(self):
+        rows = np.flatnonzero(self.genome.table(self.contig, "transcripts")["gene"] == self.row)
+        return [IndexedTranscript(self.genome, self.contig, row) for row in rows]
+
+    @property
+    def exons(self):
+        return [exon for transcript in self.transcripts for exon in transcript.exons]
+
+
+class IndexedTranscript(Transcript):
+    """ A pyensembl Transcript whose gene and exons come from an AnnotationIndex."""
+
+    def __init__(self, index, contig, row):
+        self.record = index.table(contig, "transcripts")[row]
+        genes = index.table(contig, "genes")
+        gene = self.record["gene"]
+        Transcript.__init__(
+            self,
+            transcript_id=self.record["transcript_id"].decode(),
+            transcript_name=self.record["transcript_name"].decode(),
+            contig=contig,
+            start=self.record["start"],
+            end=self.record["end"],
+            strand=self.record["strand"].decode(),
+            biotype=self.record["transcript_biotype"].decode(),
+            gene_id=genes[gene]["gene_id"].decode() if gene >= 0 else "",
+            genome=index,
+        )
+        self.gene_row = gene
+        self._exons = None
+
+    @property
+    def gene(self):
+        return IndexedGene(self.genome, self.contig, self.gene_row)
+
+    @property
+    def gene_name(self):
+        return self.gene.name if self.gene_row >= 0 else ""
+
+    @property
+    def exons(self):
+        # memoized like pyensembl's, as get_exon reads it once per exon
+        if self._exons is None:
+            self._exons = self._read_exons()
+        return self._exons
+
+    def _read_exons(self):
+        first = self.record["first_exon"]
+        records = self.genome.table(self.contig, "exons")[first : first + self.record["exons"]]
+        gene_name = self.gene_name
+        return [
+            Exon(
+                exon_id=r["exon_id"].decode() or "{}_exon_{}".format(self.id, n),
+                contig=self.contig,
+                start=r["start"],
+                end=r["end"],
+                strand=self.strand,
+                gene_name=gene_name,
+                gene_id=self.gene_id,
+            )
+            for n, r in enumerate(records, 1)
+        ]
+
+
+class AnnotationIndex(object):
+    """ Query an annotation index written by build_index like a pyensembl Genome.
+
+    Parameters:
+        path: directory of the index
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        if meta.get("format") != FORMAT:
+            raise ValueError("{} is not a current annotation index, rebuild it".format(path))
+        self.release = meta["release"]
+        self.contigs = meta["contigs"]
+        self.contig_numbers = {c: n for n, c in enumerate(self.contigs)}
+        self.names = np.load(os.path.join(path, "names.npy"), mmap_mode="r")
+        self.transcript_ids = np.load(os.path.join(path, "transcript_ids.npy"), mmap_mode="r")
+        self._tables = {}
+        self._longest = {}
+        # attributes pyensembl Gene and Transcript objects expect of a genome
+        self.db = None
+        self.reference_name = self.release
+        self.annotation_name = "GeneaPy"
+
+    def __repr__(self):
+        return "AnnotationIndex(path={}, release={})".format(self.path, self.release)
+
+    def table(self, contig, label):
+        """ Return the genes, transcripts or exons array of a contig,
+            memory mapping it on first use.
+        """
+        number = self.contig_numbers.get(strip_chr(contig))
+        if number is None:
+            return np.zeros(0, dtype=[("start", np.int64), ("end", np.int64)])
+        key = (number, label)
+        if key not in self._tables:
+            array = np.load(os.path.join(self.path, str(number), label + ".npy"), mmap_mode="r")
+            self._tables[key] = array
+            # a locus query only has to look back this far from its position
+            self._longest[key] = int((array["end"] - array["start"]).max()) if len(array) else 0
+        return self._tables[key]
+
+    def _rows_at_locus(self, contig, position, label):
+        """ Return the rows of a contig's table with start <= position <= end."""
+        array = self.table(contig, label)
+        longest = self._longest.get((self.contig_numbers.get(contig), label), 0)
+        lo = np.searchsorted(array["start"], position - longest, side="left")
+        hi = np.searchsorted(array["start"], position, side="right")
+        return lo + np.flatnonzero(array["end"][lo:hi] >= position)
+
+    def features(self, contig):
+        """ Return the exons and introns of every transcript on a contig.
+
+        Introns lie between consecutive exons in transcription order and
+        are numbered as get_exon numbers them, e.g. intron 2/7 follows
+        exon 2/8.
+
+        Returns:
+            dict of arrays of each feature's start, end, transcript row,
+            exon (False for introns), number, total and exon_id
+        """
+        exons = self.table(contig, "exons")
+        if not len(exons):
+            names = ["start", "end", "transcript", "number", "total"]
+            features = {name: np.zeros(0, dtype=np.int64) for name in names}
+            features.update(exon=np.zeros(0, dtype=bool), exon_id=np.zeros(0, dtype="S1"))
+            return features
+        transcripts = self.table(contig, "transcripts")
+        transcript = exons["transcript"]
+        number = np.arange(len(exons)) - transcripts["first_exon"][transcript] + 1
+        total = transcripts["exons"][transcript]
+        # consecutive exons of a transcript bound an intron, whichever the strand
+        pairs = np.flatnonzero(transcript[1:] == transcript[:-1])
+        before, after = exons[pairs], exons[pairs + 1]
+        intron_start = np.minimum(before["end"], after["end"]) + 1
+        intron_end = np.maximum(before["start"], after["start"]) - 1
+        gap = intron_start <= intron_end
+        pairs = pairs[gap]
+        return {
+            "start": np.concatenate([exons["start"], intron_start[gap]]),
+            "end": np.concatenate([exons["end"], intron_end[gap]]),
+            "transcript": np.concatenate([transcript, transcript[pairs]]),
+            "exon": np.arange(len(exons) + len(pairs)) < len(exons),
+            "number": np.concatenate([number, number[pairs]]),
+            "total": np.concatenate([total, total[pairs] - 1]),
+            "exon_id": np.concatenate([exons["exon_id"], np.zeros(len(pairs), dtype="S1")]),
+        }
+
+    def transcript_coordinates(self, contig, position):
+        """ Return the exon or intron number and HGVS coordinate of a
+            position in every transcript overlapping it.
+
+        An intronic position is numbered from the nearest exon base, e.g.
+        c.88+2 or c.89-7, the upstream exon winning a tie as HGVS has it.
+
+        Returns:
+            list of TranscriptCoordinate, number being e.g. "2/7"
+        """
+        contig = strip_chr(contig)
+        exons = self.table(contig, "exons")
+        transcripts = self.table(contig, "transcripts")
+        genes = self.table(contig, "genes")
+        coordinates = []
+        for row in self._rows_at_locus(contig, position, "transcripts"):
+            record = transcripts[row]
+            block = exons[record["first_exon"] : record["first_exon"] + record["exons"]]
+            if record["strand"] == b"-":
+                # negated, the exons of a - strand transcript run up the contig
+                starts, ends, at = -block["end"], -block["start"], -position
+            else:
+                starts, ends, at = block["start"], block["end"], position
+            exon = np.searchsorted(starts, at, side="right") - 1
+            if exon < 0 or (at > ends[exon] and exon + 1 == len(block)):
+                continue
+            offsets = block["offset"]
+            if at <= ends[exon]:
+                anchor, intronic, total = offsets[exon] + at - starts[exon], "", len(block)
+            elif at - ends[exon] <= starts[exon + 1] - at:
+                anchor = offsets[exon] + ends[exon] - starts[exon]
+                intronic, total = "+{}".format(at - ends[exon]), len(block) - 1
+            else:
+                anchor = offsets[exon + 1]
+                intronic, total = "-{}".format(starts[exon + 1] - at), len(block) - 1
+            hgvs = hgvs_coordinate(anchor, record["coding_first"], record["coding_last"])
+            gene = record["gene"]
+            coordinates.append(
+                TranscriptCoordinate(
+                    transcript_id=record["transcript_id"].decode(),
+                    transcript_name=record["transcript_name"].decode(),
+                    biotype=record["transcript_biotype"].decode(),
+                    gene_name=genes[gene]["gene_name"].decode() if gene >= 0 else "",
+                    exon=not intronic,
+                    number="{}/{}".format(exon + 1, total),
+                    hgvs=hgvs + intronic,
+                )
+            )
+        return coordinates
+
+    def canonical_features(self, contig, positions):
+        """ Return the gene, transcript and exon or intron number of a batch
+            of positions on a contig, picked as LocusMetaData picks them.
+
+        The first named gene overlapping a position is its gene and the
+        gene's longest protein coding transcript its transcript, or the
+        longest transcript overlapping the position if that one does not.
+        Genes and transcripts are found in one sweep of the sorted
+        positions and the exon or intron of every position in one binary
+        search of the exons, keyed on transcript then start.
+
+        Returns:
+            dict of arrays of each position's gene_name, transcript_name,
+            exon (False for introns), number e.g. "2/7" and found (False
+            where no gene or transcript overlaps it)
+        """
+        contig = strip_chr(contig)
+        positions = np.asarray(positions, dtype=np.int64)
+        found = {
+            "gene_name": np.full(len(positions), "", dtype=object),
+            "transcript_name": np.full(len(positions), "", dtype=object),
+            "exon": np.zeros(len(positions), dtype=bool),
+            "number": np.full(len(positions), "", dtype=object),
+            "found": np.zeros(len(positions), dtype=bool),
+        }
+        genes = self.table(contig, "genes")
+        transcripts = self.table(contig, "transcripts")
+        exons = self.table(contig, "exons")
+        if not len(exons):
+            return found
+        last = np.maximum(transcripts["first_exon"] + transcripts["exons"] - 1, 0)
+        length = exons["offset"][last] + exons["end"][last] - exons["start"][last] + 1
+        length = np.where(transcripts["exons"] > 0, length, 0)
+        # the longest protein coding transcript of each gene, the first on a tie
+        coding = np.flatnonzero(
+            (transcripts["transcript_biotype"] == b"protein_coding") & (transcripts["gene"] >= 0)
+        )
+        coding = coding[np.lexsort((coding, -length[coding], transcripts["gene"][coding]))]
+        first = np.r_[True, np.diff(transcripts["gene"][coding]) != 0][: len(coding)]
+        canonical = np.full(len(genes), -1, dtype=np.int64)
+        canonical[transcripts["gene"][coding[first]]] = coding[first]
+        named = (genes["gene_name"] != b"").tolist()
+        gene = np.full(len(positions), -1, dtype=np.int64)
+        transcript = np.full(len(positions), -1, dtype=np.int64)
+        overlaps = zip(
+            sweep_overlaps(positions, positions, genes["start"], genes["end"]),
+            sweep_overlaps(positions, positions, transcripts["start"], transcripts["end"]),
+        )
+        for (query, gene_rows), (_, rows) in overlaps:
+            gene_rows = [row for row in gene_rows if named[row]]
+            if not (gene_rows and rows):
+                continue
+            gene[query] = min(gene_rows)
+            transcript[query] = canonical[gene[query]]
+            if transcript[query] not in rows:
+                rows = sorted(rows)
+                transcript[query] = rows[int(np.argmax(length[rows]))]
+        hit = np.flatnonzero((transcript >= 0) & (transcripts["exons"][transcript] > 0))
+        gene, transcript = gene[hit], transcript[hit]
+        # negated, the exons of a - strand transcript run up the contig
+        exon_minus = transcripts["strand"][exons["transcript"]] == b"-"
+        starts = np.where(exon_minus, -exons["end"], exons["start"])
+        ends = np.where(exon_minus, -exons["start"], exons["end"])
+        at = np.where(transcripts["strand"][transcript] == b"-", -positions[hit], positions[hit])
+        keys = exons["transcript"] * SPAN + starts
+        exon = np.searchsorted(keys, transcript * SPAN + at, side="right") - 1
+        in_exon = at <= ends[exon]
+        number = exon - transcripts["first_exon"][transcript] + 1
+        total = np.where(in_exon, transcripts["exons"][transcript], transcripts["exons"][transcript] - 1)
+        found["gene_name"][hit] = [n.decode() for n in genes["gene_name"][gene]]
+        found["transcript_name"][hit] = [
+            n.decode() for n in transcripts["transcript_name"][transcript]
+        ]
+        found["exon"][hit] = in_exon
+        found["number"][hit] = ["{}/{}".format(n, t) for n, t in zip(number.tolist(), total.tolist())]
+        found["found"][hit] = True
+        return found
+
+    def genes_at_locus(self, contig, position):
+        contig = strip_chr(contig)
+        return [IndexedGene(self, contig, r) for r in self._rows_at_locus(contig, position, "genes")]
+
+    def gene_names_at_locus(self, contig, position):
+        names = []
+        for gene in self.genes_at_locus(contig, position):
+            if gene.name and gene.name not in names:
+                names.append(gene.name)
+        return names
+
+    def transcripts_at_locus(self, contig, position):
+        contig = strip_chr(contig)
+        return [
+            IndexedTranscript(self, contig, r)
+            for r in self._rows_at_locus(contig, position, "transcripts")
+        ]
+
+    def _lookup(self, keys, key):
+        key = str(key).encode()
+        lo = np.searchsorted(keys["key"], key, side="left")
+        hi = np.searchsorted(keys["key"], key, side="right")
+        return [(self.contigs[c], r) for c, r in zip(keys["contig"][lo:hi], keys["row"][lo:hi])]
+
+    def genes_by_name(self, gene_name):
+        genes = [IndexedGene(self, c, r) for c, r in self._lookup(self.names, gene_name)]
+        if not genes:
+            raise ValueError("Gene name not found: {}".format(gene_name))
+        return genes
+
+    def transcript_by_id(self, transcript_id):
+        found = self._lookup(self.transcript_ids, transcript_id)
+        if not found:
+            raise ValueError("Transcript not found: {}".format(transcript_id))
+        return IndexedTranscript(self, *found[0])
@@ -0,0 +1,138 @@
+""" Random access to a bgzipped FASTA (.fa.gz with its .fai and .gzi
+    indexes) keeping recently decompressed BGZF blocks in an LRU cache.
+
+A BGZF file is a series of gzip members each holding up to 64 KB of the
+FASTA. The .fai index gives the uncompressed offset of every base and the
+.gzi index the compressed offset of the block holding each uncompressed
+offset, so a fetch only decompresses the blocks its range overlaps.
+Clustered queries, e.g. the variants of a gene panel, mostly fall in
+blocks already in the cache and skip decompression entirely.
+"""
+import bisect
+import collections
+import os
+import struct
+import zlib
+
+import numpy as np
+
+from GeneaPy.modules import metrics
+
+SETTINGS = {"cache_blocks": int(os.environ.get("GENEAPY_BGZF_CACHE_BLOCKS", 256))}
+CacheInfo = collections.namedtuple("CacheInfo", ["hits", "misses", "maxsize", "currsize"])
+
+
+def read_fai(path):
+    """ Return a dict of each contig's (length, offset, line bases, line width)."""
+    contigs = {}
+    with open(path) as f:
+        for line in f:
+            fields = line.split("\t")
+            contigs[fields[0]] = tuple(int(x) for x in fields[1:5])
+    return contigs
+
+
+def read_gzi(path):
+    """ Return lists of the compressed and uncompressed offsets of each
+        block start, as plain ints which bisect faster than numpy scalars.
+    """
+    with open(path, "rb") as f:
+        (count,) = struct.unpack("<Q", f.read(8))
+        offsets = np.frombuffer(f.read(16 * count), dtype="<u8").reshape(count, 2)
+    # the first block at offset 0 is implicit
+    return [0] + offsets[:, 0].tolist(), [0] + offsets[:, 1].tolist()
+
+
+def block_size(header):
+    """ Return the compressed size of a BGZF block from its gzip header."""
+    extra_length = struct.unpack("<H", header[10:12])[0]
+    extra = header[12 : 12 + extra_length]
+    while extra:
+        si1, si2, length = struct.unpack("<BBH", extra[:4])
+        if (si1, si2) == (66, 67):
+            return struct.unpack("<H", extra[4:6])[0] + 1
+        extra = extra[4 + length :]
+    raise ValueError("not a BGZF block")
+
+
+class BgzfFasta(object):
+    """ Fetch sequences from a bgzipped FASTA like a pysam FastaFile.
+
+    Parameters:
+        path: bgzipped FASTA, indexed by path.fai and path.gzi which are
+              written with pysam if missing
+        cache_blocks: decompressed blocks to keep (default=SETTINGS["cache_blocks"])
+    """
+
+    def __init__(self, path, cache_blocks=None):
+        self.path = path
+        if not (os.path.exists(path + ".fai") and os.path.exists(path + ".gzi")):
+            import pysam
+
+            pysam.faidx(path)
+        self.contigs = read_fai(path + ".fai")
+        self.compressed, self.uncompressed = read_gzi(path + ".gzi")
+        self.maxsize = SETTINGS["cache_blocks"] if cache_blocks is None else cache_blocks
+        self.blocks = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.handle = open(path, "rb")
+
+    @property
+    def references(self):
+        return list(self.contigs)
+
+    def close(self):
+        self.handle.close()
+
+    def cache_info(self):
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self.blocks))
+
+    def hit_rate(self):
+        return self.hits / max(self.hits + self.misses, 1)
+
+    def block(self, number):
+        """ Return the decompressed bytes of a block, from the cache if present."""
+        data = self.blocks.get(number)
+        if data is not None:
+            self.blocks.move_to_end(number)
+            self.hits += 1
+            metrics.count("cache_hits", cache="bgzf_blocks")
+            return data
+        self.misses += 1
+        metrics.count("cache_misses", cache="bgzf_blocks")
+        self.handle.seek(self.compressed[number])
+        header = self.handle.read(18)
+        raw = header + self.handle.read(block_size(header) - 18)
+        data = zlib.decompress(raw, 31)
+        if self.maxsize > 0:
+            self.blocks[number] = data
+            if len(self.blocks) > self.maxsize:
+                self.blocks.popitem(last=False)
+        return data
+
+    def _offset(self, contig, position):
+        """ Return the uncompressed file offset of a 0-based position."""
+        _, offset, line_bases, line_width = contig
+        return offset + (position // line_bases) * line_width + position % line_bases
+
+    def fetch(self, reference, start=None, end=None):
+        """ Return the bases from 0-based start up to end of a contig."""
+        if reference not in self.contigs:
+            raise KeyError("sequence '{}' not present".format(reference))
+        contig = self.contigs[reference]
+        start = max(start or 0, 0)
+        end = contig[0] if end is None else min(end, contig[0])
+        if end <= start:
+            return ""
+        first_byte = self._offset(contig, start)
+        last_byte = self._offset(contig, end - 1) + 1
+        first = bisect.bisect_right(self.uncompressed, first_byte) - 1
+        last = bisect.bisect_right(self.uncompressed, last_byte - 1) - 1
+        if first == last:
+            data = self.block(first)
+        else:
+            data = b"".join(self.block(n) for n in range(first, last + 1))
+        skip = first_byte - self.uncompressed[first]
+        data = data[skip : skip + last_byte - first_byte]
+        return data.replace(b"\n", b"").replace(b"\r", b"").decode()
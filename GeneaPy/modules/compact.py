@@ -0,0 +1,102 @@
+""" Shrink a primer database DataFrame in memory.
+
+Primer sequences are packed two bits per base into a uint64 column with
+a separate uint8 length column, low-cardinality text columns become
+categoricals and numeric columns are downcast to the smallest dtype
+holding their values exactly. Packed sequences are unpacked again with
+expand_database, usually only for the rows being output.
+"""
+import numpy as np
+import pandas as pd
+
+from GeneaPy.modules.primer_properties import encode
+
+BASES = np.frombuffer(b"ACGT", dtype=np.uint8)
+# 2 bits per base in a uint64
+MAX_PACKED = 32
+SEQUENCE_COLUMNS = ["F_Primer", "R_Primer"]
+CATEGORICAL_COLUMNS = ["Genome", "Gene", "Transcript", "Exon", "Intron"]
+
+
+def pack_sequences(seqs):
+    """ Pack uppercase ACGT sequences of up to 32 bases into uint64 values.
+
+    Returns:
+        tuple of the packed values and uint8 lengths, or None if any
+        sequence cannot be packed and unpacked back to itself
+    """
+    seqs = list(seqs)
+    if not seqs or not all(isinstance(s, str) for s in seqs):
+        return None
+    codes, lengths = encode(seqs)
+    if lengths.max() > MAX_PACKED:
+        return None
+    in_seq = np.arange(codes.shape[1]) < lengths[:, None]
+    if (codes[in_seq] == 4).any():
+        return None
+    packed = np.zeros(len(seqs), dtype=np.uint64)
+    for j in range(codes.shape[1]):
+        base = np.where(in_seq[:, j], codes[:, j], 0).astype(np.uint64)
+        packed |= base << np.uint64(2 * j)
+    lengths = lengths.astype(np.uint8)
+    if list(unpack_sequences(packed, lengths)) != seqs:
+        # e.g. lowercase bases, which would come back uppercase
+        return None
+    return packed, lengths
+
+
+def unpack_sequences(packed, lengths):
+    """ Return the sequences of packed uint64 values as an object array."""
+    packed = np.asarray(packed, dtype=np.uint64)
+    lengths = np.asarray(lengths, dtype=np.int64)
+    width = int(lengths.max()) if len(lengths) else 0
+    shifts = (2 * np.arange(width)).astype(np.uint64)
+    codes = (packed[:, None] >> shifts) & np.uint64(3)
+    raw = BASES[codes.astype(np.intp)]
+    raw[np.arange(width) >= lengths[:, None]] = 0
+    seqs = np.ascontiguousarray(raw).view("S{}".format(max(width, 1))).ravel()
+    return np.array([s.decode() for s in seqs], dtype=object)
+
+
+def memory_usage(df):
+    """ Return the bytes used by a DataFrame including the objects it holds."""
+    return int(df.memory_usage(deep=True).sum())
+
+
+def compact_database(db):
+    """ Return a copy of a primer database DataFrame using compact dtypes."""
+    db = db.copy()
+    for c in SEQUENCE_COLUMNS:
+        if c not in db:
+            continue
+        packed = pack_sequences(db[c].values)
+        if packed is not None:
+            db[c], db[c + "_Length"] = packed
+    for c in CATEGORICAL_COLUMNS:
+        if c in db and pd.api.types.is_string_dtype(db[c]):
+            db[c] = db[c].astype("category")
+    for c in db.select_dtypes(include="integer").columns:
+        if c + "_Length" not in db and not c.endswith("_Length"):
+            db[c] = pd.to_numeric(db[c], downcast="integer")
+    for c in db.select_dtypes(include="floating").columns:
+        small = db[c].astype(np.float32)
+        # only where no value changes, as they are written back out as float64
+        if np.array_equal(small.values.astype(db[c].dtype), db[c].values, equal_nan=True):
+            db[c] = small
+    return db
+
+
+def expand_database(db):
+    """ Unpack the sequences of a DataFrame made by compact_database."""
+    db = db.copy()
+    for c in SEQUENCE_COLUMNS:
+        if c + "_Length" in db:
+            db[c] = unpack_sequences(db[c].values, db[c + "_Length"].values)
+            db = db.drop(c + "_Length", axis=1)
+    return db
+
+
+def format_memory(before, after):
+    return "{:.2f} MB -> {:.2f} MB ({:.0%} of the original)".format(
+        before / 2 ** 20, after / 2 ** 20, after / max(before, 1)
+    )
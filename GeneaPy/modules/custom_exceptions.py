@@ -27,12 +27,15 @@ class NoAmplicon(Exception):
 class MultipleAmplicons(Exception):
     """ Raise if multiple amplicons are generated by isPCR"""
 
-    def __init__(self, name, number, msg=None):
+    def __init__(self, name, number, loci=None, msg=None):
         if not msg:
             msg = "The primer pair {} generates {} amplicons".format(name, number)
+            if loci:
+                msg += ": {}".format(", ".join(loci))
         Exception.__init__(self, msg)
         self.name = name
         self.number = number
+        self.loci = loci or []
         self.msg = msg
 
 
@@ -129,3 +132,94 @@ class ExonMismatch(Exception):
         Exception.__init__(self, msg)
         self.pyexon_id = pyexon_id
         self.exon_id = exon_id
+
+
+class NoSeedIndex(Exception):
+    """ Raise if a k-mer seed index has not been built at the given path"""
+
+    def __init__(self, path, msg=None):
+        if not msg:
+            msg = "No seed index found at {}, build one with a genome FASTA".format(
+                path
+            )
+        Exception.__init__(self, msg)
+        self.path = path
+        self.msg = msg
+
+
+class SeedTooLong(Exception):
+    """ Raise if a primer is shorter than the seeds of a seed index"""
+
+    def __init__(self, primer, k, msg=None):
+        if not msg:
+            msg = "{} is shorter than the {}-mer seeds of the index".format(primer, k)
+        Exception.__init__(self, msg)
+        self.primer = primer
+        self.k = k
+        self.msg = msg
+
+
+class RepetitiveSeed(Exception):
+    """ Raise if a seed of a primer has too many hits to check them all"""
+
+    def __init__(self, primer, offset, hits, max_hits, msg=None):
+        if not msg:
+            msg = (
+                "The seed at base {} of {} has {} hits, more than {}, so its "
+                "sites could be missed".format(offset + 1, primer, hits, max_hits)
+            )
+        Exception.__init__(self, msg)
+        self.primer = primer
+        self.offset = offset
+        self.hits = hits
+        self.max_hits = max_hits
+        self.msg = msg
+
+
+class NotRecorded(Exception):
+    """ Raise if a replayed request has no recorded response"""
+
+    def __init__(self, url, archive, msg=None):
+        if not msg:
+            msg = "No response to {} has been recorded in {}".format(url, archive)
+        Exception.__init__(self, msg)
+        self.url = url
+        self.archive = archive
+        self.msg = msg
+
+
+class NoLiftOver(Exception):
+    """ Raise if a position cannot be converted to another genome version"""
+
+    def __init__(self, position, hg_version, msg=None):
+        if not msg:
+            msg = "{} cannot be lifted over to {}".format(position, hg_version)
+        Exception.__init__(self, msg)
+        self.position = position
+        self.hg_version = hg_version
+        self.msg = msg
+
+
+class UnknownChainBuild(Exception):
+    """ Raise if the genome version a chain file converts from is unknown"""
+
+    def __init__(self, chain, msg=None):
+        if not msg:
+            msg = (
+                "Cannot tell which genome version {} converts from, name it "
+                "like hg19ToHg38.over.chain or give the version with --lift_from"
+            ).format(chain)
+        Exception.__init__(self, msg)
+        self.chain = chain
+        self.msg = msg
+
+
+class DatabaseNotLoaded(Exception):
+    """ Raise if a primer database is queried before it could be loaded"""
+
+    def __init__(self, path, msg=None):
+        if not msg:
+            msg = "The primer database {} could not be loaded".format(path)
+        Exception.__init__(self, msg)
+        self.path = path
+        self.msg = msg
@@ -0,0 +1,265 @@
+""" Cache a parsed DataFrame as typed, memory-mappable column files
+    next to the text file it was parsed from.
+
+The sidecar directory (<source>.npcache) holds one .npy file per column
+plus meta.json recording the sources size, mtime and SHA-1. The cache
+is used as long as the source is unchanged and rebuilt otherwise. The
+sidecars are written to the GENEAPY_CACHE_DIR environment variable
+instead when it is set, e.g. when the source directory is read-only.
+
+String columns are read back as a TextArray over the memory-mapped
+fixed-width strings, so only the rows taken from them, e.g. the primers
+being output, are ever decoded to Python strings.
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+from pandas.api.extensions import ExtensionArray, ExtensionDtype
+
+from GeneaPy.modules import metrics
+
+SUFFIX = ".npcache"
+SETTINGS = {"cache_dir": os.environ.get("GENEAPY_CACHE_DIR")}
+
+
+def sidecar(source, suffix=SUFFIX):
+    """ Return the cache path of source, within SETTINGS["cache_dir"] if set."""
+    if not SETTINGS["cache_dir"]:
+        return source + suffix
+    # the absolute path keeps sources of the same name apart
+    name = os.path.abspath(source).strip(os.sep).replace(os.sep, "_")
+    return os.path.join(SETTINGS["cache_dir"], name + suffix)
+
+
+def fingerprint(source):
+    stat = os.stat(source)
+    return {"size": stat.st_size, "mtime": stat.st_mtime_ns}
+
+
+def checksum(source):
+    sha1 = hashlib.sha1()
+    with open(source, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def load(source, parse, version=0, columns=None):
+    """ Return the DataFrame parsed from source, using the cache if it is current.
+
+    Args:
+        source: path to the text file
+        parse: function parsing source into a DataFrame when the
+               cache is missing or out of date
+        version: format of the parsed DataFrame, caches written with
+                 a different version are rebuilt
+        columns: only return these columns, only mapping their files
+                 on a cache hit
+    """
+    cache = sidecar(source)
+    meta = read_meta(cache)
+    if meta and meta.get("version") == version and is_current(source, cache, meta):
+        metrics.count("cache_hits", cache="npcache")
+        return read(cache, meta, columns)
+    metrics.count("cache_misses", cache="npcache")
+    df = parse(source)
+    try:
+        write(df, source, cache, version)
+    except OSError as e:
+        logging.error("Could not cache {}: {}".format(source, e))
+        return df if columns is None else df[columns]
+    # read back so the DataFrame has the same dtypes as on a cache hit
+    return read(cache, read_meta(cache), columns)
+
+
+def read_meta(cache):
+    try:
+        with open(os.path.join(cache, "meta.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def is_current(source, cache, meta):
+    """ Check the source is unchanged since the cache was written, only
+        hashing the source if its size or mtime have changed.
+    """
+    current = fingerprint(source)
+    if current == meta["source"]:
+        return True
+    if current["size"] != meta["source"]["size"] or checksum(source) != meta["sha1"]:
+        return False
+    # same contents, e.g. the file was touched, so keep using the cache
+    meta["source"] = current
+    try:
+        with open(os.path.join(cache, "meta.json"), "w") as f:
+            json.dump(meta, f)
+    except OSError as e:
+        # e.g. a read-only cache, so parse the source rather than fail
+        logging.error("Could not update the cache of {}: {}".format(source, e))
+        return False
+    return True
+
+
+def write(df, source, cache, version=0):
+    """ Write each column of df to its own .npy file."""
+    if os.path.exists(cache):
+        shutil.rmtree(cache)
+    os.makedirs(cache)
+    columns = []
+    for number, name in enumerate(df.columns):
+        values = df[name]
+        column = {"name": name, "file": "col{}.npy".format(number)}
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            # categories are stored once and each row as its category code
+            categories = np.asarray(values.cat.categories, dtype=str)
+            np.save(os.path.join(cache, "cat{}.npy".format(number)), categories)
+            values = values.cat.codes
+            column["categories"] = "cat{}.npy".format(number)
+        elif isinstance(values.dtype, TextDtype):
+            np.save(os.path.join(cache, "null{}.npy".format(number)), values.isnull().values)
+            values = values.values.strings
+            column["nulls"] = "null{}.npy".format(number)
+        elif values.dtype == object:
+            # strings are stored fixed width with a separate null mask
+            nulls = values.isnull().values
+            np.save(os.path.join(cache, "null{}.npy".format(number)), nulls)
+            values = np.asarray(values.where(~nulls, ""), dtype=str)
+            column["nulls"] = "null{}.npy".format(number)
+        np.save(os.path.join(cache, column["file"]), np.asarray(values))
+        columns.append(column)
+    meta = {
+        "version": version,
+        "source": fingerprint(source),
+        "sha1": checksum(source),
+        "columns": columns,
+    }
+    # written last so an interrupted write is never mistaken for a cache
+    with open(os.path.join(cache, "meta.json"), "w") as f:
+        json.dump(meta, f)
+
+
+def read(cache, meta, columns=None):
+    """ Memory-map each column file, or only the given columns, back into a DataFrame."""
+    data = {}
+    meta_columns = [c for c in meta["columns"] if columns is None or c["name"] in columns]
+    for column in meta_columns:
+        values = np.load(os.path.join(cache, column["file"]), mmap_mode="r")
+        if "nulls" in column:
+            nulls = np.load(os.path.join(cache, column["nulls"]), mmap_mode="r")
+            values = TextArray(values, nulls)
+        if "categories" in column:
+            categories = np.load(os.path.join(cache, column["categories"]))
+            values = pd.Categorical.from_codes(values, categories.astype(object))
+        data[column["name"]] = values
+    # not copied, so the columns stay memory-mapped
+    return pd.DataFrame(data, columns=[c["name"] for c in meta_columns], copy=False)
+
+
+class TextDtype(ExtensionDtype):
+    name = "npcache_text"
+    type = str
+    kind = "O"
+    na_value = np.nan
+
+    @classmethod
+    def construct_array_type(cls):
+        return TextArray
+
+
+class TextArray(ExtensionArray):
+    """ A string column held as fixed-width strings and a null mask.
+
+    Taking rows only indexes the two arrays, which stay memory-mapped
+    when read from a cache, so rows are decoded to Python strings one
+    at a time or by decode when they are needed.
+    """
+
+    def __init__(self, strings, nulls):
+        self.strings = strings
+        self.nulls = nulls
+
+    @classmethod
+    def _from_sequence(cls, scalars, dtype=None, copy=False):
+        values = pd.Series(list(scalars), dtype=object)
+        nulls = values.isnull().values
+        return cls(np.asarray(values.where(~nulls, ""), dtype=str), nulls)
+
+    @classmethod
+    def _from_factorized(cls, values, original):
+        return cls._from_sequence(values)
+
+    @classmethod
+    def _concat_same_type(cls, to_concat):
+        return cls(
+            np.concatenate([a.strings for a in to_concat]),
+            np.concatenate([a.nulls for a in to_concat]),
+        )
+
+    @property
+    def dtype(self):
+        return TextDtype()
+
+    @property
+    def nbytes(self):
+        return self.strings.nbytes + self.nulls.nbytes
+
+    def __len__(self):
+        return len(self.strings)
+
+    def __getitem__(self, item):
+        if pd.api.types.is_integer(item):
+            return np.nan if self.nulls[item] else str(self.strings[item])
+        item = pd.api.indexers.check_array_indexer(self, item)
+        return type(self)(self.strings[item], self.nulls[item])
+
+    def __iter__(self):
+        return iter(self.decode())
+
+    def __array__(self, dtype=None, copy=None):
+        # decode always returns a new array, so copy=False cannot be honoured
+        if copy is False:
+            raise ValueError("TextArray cannot be converted to an array without copying")
+        return self.decode() if dtype is None else self.decode().astype(dtype)
+
+    def __eq__(self, other):
+        return self.decode() == other
+
+    def decode(self):
+        """ Return the strings as an object array with NaN for nulls."""
+        values = self.strings.astype(object)
+        values[self.nulls] = np.nan
+        return values
+
+    def isna(self):
+        return np.array(self.nulls)
+
+    def take(self, indices, allow_fill=False, fill_value=None):
+        indices = np.asarray(indices, dtype=np.intp)
+        missing = indices == -1 if allow_fill else np.zeros(len(indices), dtype=bool)
+        if len(self):
+            rows = np.where(missing, 0, indices)
+            strings, nulls = self.strings[rows], self.nulls[rows] | missing
+        elif missing.all():
+            strings, nulls = np.full(len(indices), "", dtype=str), missing
+        else:
+            raise IndexError("cannot take from an empty TextArray")
+        return type(self)(strings, nulls)
+
+    def copy(self):
+        return type(self)(np.array(self.strings), np.array(self.nulls))
+
+    def astype(self, dtype, copy=True):
+        if isinstance(dtype, TextDtype):
+            return self.copy() if copy else self
+        if isinstance(dtype, ExtensionDtype) or dtype == "category":
+            return pd.array(self.decode(), dtype=dtype)
+        return self.decode().astype(dtype)
+
+    def _values_for_factorize(self):
+        return self.decode(), np.nan
@@ -0,0 +1,215 @@
+""" Find the duplicate primers of a primer database.
+
+Two rows of the same genome are duplicates if they hold the same primer
+pair or the same Primer_Range. A pair is canonicalised by replacing each
+primer with the lesser of itself and its reverse complement and then
+ordering the two, so a pair entered with F and R swapped, or with either
+primer written on the other strand, has the same key. Canonical
+sequences are hashed to integer codes and rows grouped by sorting on
+(genome, pair codes) and on (genome, chrom, start, end) and scanning for
+runs of equal keys, so the database is grouped by sorting rather than
+pairwise comparisons.
+
+Duplicates are linked transitively, e.g. a pair renamed and then moved to
+a corrected range is one group, and each group is kept as its first row
+in the database with the rest recorded as aliases of it.
+"""
+import re
+
+import numpy as np
+import pandas as pd
+
+COMPLEMENT = str.maketrans("ACGTNacgtn", "TGCANtgcan")
+RANGE_PATTERN = re.compile(r"^(?:chr)?([^:]+):(\d+)-(\d+)$")
+ALIAS_COLUMNS = ["Alias", "Primer", "Reason"]
+
+
+def reverse_complement(seq):
+    return seq.translate(COMPLEMENT)[::-1]
+
+
+def canonical_sequences(seqs):
+    """ Return the lesser of each uppercased sequence and its reverse
+        complement, or None where the sequence is missing.
+    """
+    canonical = []
+    for seq in seqs:
+        seq = seq.strip().upper() if isinstance(seq, str) else None
+        canonical.append(min(seq, reverse_complement(seq)) if seq else None)
+    return canonical
+
+
+def canonical_pairs(forward, reverse):
+    """ Number each distinct canonical primer pair.
+
+    Each distinct sequence is only canonicalised once, as are the
+    canonical sequences hashed to integer codes, so the pair of a row is
+    the ordered pair of its two codes.
+
+    Returns:
+        array of the pair number of each row, or -1 where a primer is missing
+    """
+    codes, seqs = pd.factorize(np.concatenate([forward, reverse]).astype(object))
+    seq_codes, _ = pd.factorize(pd.Series(canonical_sequences(seqs), dtype=object))
+    # codes of -1 for missing values index -1, which is forced missing below
+    codes = np.append(seq_codes, -1)[codes]
+    f, r = codes[: len(forward)], codes[len(forward) :]
+    low, high = np.minimum(f, r), np.maximum(f, r)
+    pairs, _ = pd.factorize(low * np.int64(len(seqs) + 1) + high)
+    pairs[low < 0] = -1
+    return pairs
+
+
+def parse_ranges(ranges):
+    """ Split Primer_Range strings into chrom, start and end, with NaN
+        starts and ends where a range cannot be parsed. Each distinct range
+        is only parsed once.
+    """
+    codes, unique = pd.factorize(pd.Series(ranges, dtype=object))
+    matches = [RANGE_PATTERN.match(r) if isinstance(r, str) else None for r in unique]
+    # codes of -1 for missing ranges index the appended missing row
+    parts = [m.groups() if m else (np.nan, np.nan, np.nan) for m in matches]
+    parts.append((np.nan, np.nan, np.nan))
+    chrom, start, end = zip(*parts)
+    return (
+        np.array(chrom, dtype=object)[codes],
+        np.array(start, dtype=float)[codes],
+        np.array(end, dtype=float)[codes],
+    )
+
+
+def run_groups(*keys):
+    """ Number the runs of equal keys after sorting on them.
+
+    Args:
+        keys: equal length arrays, the first being the primary sort key
+
+    Returns:
+        array of the group number of each row
+    """
+    order = np.lexsort(keys[::-1])
+    new = np.zeros(len(order), dtype=bool)
+    if len(order):
+        new[0] = True
+    for key in keys:
+        ordered = key[order]
+        new[1:] |= ordered[1:] != ordered[:-1]
+    groups = np.empty(len(order), dtype=np.int64)
+    groups[order] = np.cumsum(new) - 1
+    return groups
+
+
+def link_groups(groupings):
+    """ Return the lowest row linked to each row through any of the
+        groupings, i.e. the connected components of the rows.
+
+    Notes:
+        each row points at a row of its component no higher than itself,
+        the rows pointing at themselves being roots. Each round points
+        the root of every row at the lowest root in its group and then
+        jumps every row straight to its root, so a chain of duplicates is
+        linked in a number of rounds growing with the log of its length
+        rather than one round per link.
+    """
+    n = len(groupings[0]) if groupings else 0
+    labels = np.arange(n)
+    changed = True
+    while changed:
+        changed = False
+        for groups in groupings:
+            lowest = np.full(groups.max() + 1 if n else 0, n, dtype=np.int64)
+            np.minimum.at(lowest, groups, labels)
+            linked = lowest[groups]
+            if (linked != labels).any():
+                np.minimum.at(labels, labels.copy(), linked)
+                changed = True
+        jumped = labels[labels]
+        while (jumped != labels).any():
+            labels, jumped = jumped, jumped[jumped]
+    return labels
+
+
+def find_duplicates(genome, pairs, chrom, start, end):
+    """ Find the duplicate rows of a primer database.
+
+    Args:
+        genome: genome code of each row
+        pairs: canonical pair number of each row, -1 if it has none
+        chrom, start, end: amplicon range of each row, NaN if it has none
+
+    Returns:
+        array of the row each row is kept as, which is itself for kept rows
+    """
+    rows = np.arange(len(genome), dtype=np.int64)
+    # rows without a pair or range are given their own row number as key
+    pair_groups = run_groups(genome, np.where(pairs < 0, rows, -1), pairs)
+    bad = np.isnan(start) | np.isnan(end)
+    range_groups = run_groups(
+        genome,
+        np.where(bad, rows, -1),
+        pd.factorize(chrom)[0],
+        np.nan_to_num(start).astype(np.int64),
+        np.nan_to_num(end).astype(np.int64),
+    )
+    return link_groups([pair_groups, range_groups])
+
+
+def alias_table(db, pairs, kept):
+    """ Return a DataFrame of each duplicate primer, the primer it was
+        merged into and whether they share their pair, range or both.
+    """
+    rows = np.flatnonzero(kept != np.arange(len(db)))
+    targets = kept[rows]
+    ranges = db["Primer_Range"].values
+    same_pair = pairs[rows] == pairs[targets]
+    same_range = ranges[rows] == ranges[targets]
+    reason = np.select(
+        [same_pair & same_range, same_pair, same_range],
+        ["pair+range", "pair", "range"],
+        default="linked",
+    )
+    return pd.DataFrame(
+        {
+            "Alias": db["Primer"].values[rows],
+            "Primer": db["Primer"].values[targets],
+            "Reason": reason,
+        },
+        columns=ALIAS_COLUMNS,
+    )
+
+
+def range_order(genome, chrom, start, end):
+    """ Return the order sorting rows by genome, chrom and amplicon position
+        with numbered chroms in numeric order before the rest.
+    """
+    names, chroms = pd.factorize(chrom, sort=True)
+    number = pd.to_numeric(pd.Series(chroms, dtype=object), errors="coerce").values
+    number = np.append(np.nan_to_num(number, nan=np.inf), np.inf)[names]
+    names = np.where(names < 0, len(chroms), names)
+    return np.lexsort(
+        (
+            np.nan_to_num(end, nan=np.inf),
+            np.nan_to_num(start, nan=np.inf),
+            names,
+            number,
+            genome,
+        )
+    )
+
+
+def deduplicate(db):
+    """ Deduplicate a primer database.
+
+    Returns:
+        tuple of the coordinate sorted database of kept primers and the
+        alias table of the primers merged into them
+    """
+    db = db.reset_index(drop=True)
+    genome = pd.factorize(db["Genome"].astype(object).fillna(""), sort=True)[0]
+    pairs = canonical_pairs(db["F_Primer"].values, db["R_Primer"].values)
+    chrom, start, end = parse_ranges(db["Primer_Range"].values)
+    kept = find_duplicates(genome, pairs, chrom, start, end)
+    aliases = alias_table(db, pairs, kept)
+    order = range_order(genome, chrom, start, end)
+    order = order[kept[order] == order]
+    return db.iloc[order], aliases
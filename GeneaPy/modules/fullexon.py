@@ -22,6 +22,14 @@ class FullExon(Exon):
         self.number = number
         self.exon = exon
 
+    @property
+    def exon_no(self):
+        return self.number if self.exon else "-"
+
+    @property
+    def intron_no(self):
+        return "-" if self.exon else self.number
+
     def __eq__(self, other):
         return self.__dict__ == other.__dict__
 
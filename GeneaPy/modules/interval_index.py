@@ -0,0 +1,113 @@
+""" Index amplicon intervals so the amplicons covering a batch of
+    positions are found with binary searches instead of a join, and
+    sweep sorted intervals for the ones overlapping a batch of ranges.
+"""
+import heapq
+
+import numpy as np
+import pandas as pd
+
+# contig codes are packed above the position bits of each sort key
+SPAN = 2 ** 40
+
+
+class AmpliconIndex(object):
+    """ Amplicons sorted by contig and start position.
+
+    A position is covered by an amplicon if Start < position < End.
+    As no amplicon is longer than the longest one indexed, only the
+    amplicons starting within that distance of a position are checked.
+
+    Parameters:
+        chrom: contig of each amplicon
+        start: start position of each amplicon
+        end: end position of each amplicon
+    """
+
+    def __init__(self, chrom, start, end):
+        start = np.asarray(start, dtype=float)
+        end = np.asarray(end, dtype=float)
+        codes, contigs = pd.factorize(pd.Series(chrom).reset_index(drop=True))
+        self.contigs = pd.Index(contigs)
+        # missing contigs only match each other, as they would in pd.merge
+        codes = np.where(codes == -1, len(contigs), codes)
+        rows = np.flatnonzero(~(np.isnan(start) | np.isnan(end)))
+        order = np.lexsort((start[rows], codes[rows]))
+        self.rows = rows[order]
+        self.keys = codes[self.rows] * SPAN + start[self.rows].astype(np.int64)
+        self.ends = end[self.rows].astype(np.int64)
+        lengths = self.ends - start[self.rows].astype(np.int64)
+        self.max_length = int(lengths.max()) if len(lengths) else 0
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _codes(self, chrom):
+        chrom = pd.Series(chrom).reset_index(drop=True)
+        codes = self.contigs.get_indexer(chrom)
+        codes[chrom.isnull().values] = len(self.contigs)
+        return codes
+
+    def overlaps(self, chrom, pos):
+        """ Find the amplicons covering each position.
+
+        Args:
+            chrom: contig of each position
+            pos: each position
+
+        Returns:
+            tuple of arrays holding the index of each position and the
+            row number of the amplicon covering it, ordered by position
+            index and then amplicon row number
+        """
+        codes = self._codes(chrom)
+        pos = np.asarray(pos, dtype=float)
+        valid = (codes >= 0) & ~np.isnan(pos)
+        pos = np.where(valid, pos, 0).astype(np.int64)
+        base = np.maximum(codes, 0) * SPAN
+        lo = np.searchsorted(self.keys, base + pos - self.max_length, side="right")
+        hi = np.searchsorted(self.keys, base + pos, side="left")
+        counts = np.where(valid, np.maximum(hi - lo, 0), 0)
+
+        # expand each [lo, hi) range into the slots it covers
+        query = np.repeat(np.arange(len(pos)), counts)
+        first = np.repeat(lo - (np.cumsum(counts) - counts), counts)
+        slot = first + np.arange(len(query))
+        covered = self.ends[slot] > pos[query]
+        query, rows = query[covered], self.rows[slot[covered]]
+        order = np.lexsort((rows, query))
+        return query[order], rows[order]
+
+
+def sweep_overlaps(query_starts, query_ends, starts, ends):
+    """ Find the intervals overlapping each query interval in one sweep
+        along both sorted by start. Intervals are closed, [start, end].
+
+    Only the intervals still open at the current query start are held, so
+    long intervals such as introns cost no more than short ones.
+
+    Yields:
+        the index of each query, in order of start, and the row numbers
+        of the intervals overlapping it in order of start
+    """
+    queries = np.lexsort((query_ends, query_starts)).tolist()
+    query_starts = np.asarray(query_starts).tolist()
+    query_ends = np.asarray(query_ends).tolist()
+    order = np.argsort(starts, kind="stable")
+    starts = np.asarray(starts)[order].tolist()
+    ends = np.asarray(ends)[order].tolist()
+    rows = order.tolist()
+    active = {}
+    expiry = []
+    following = 0
+    for query in queries:
+        start, end = query_starts[query], query_ends[query]
+        while following < len(starts) and starts[following] <= end:
+            if ends[following] >= start:
+                active[following] = None
+                heapq.heappush(expiry, (ends[following], following))
+            following += 1
+        # query starts only increase, so an interval ended before this one never reopens
+        while expiry and expiry[0][0] < start:
+            del active[heapq.heappop(expiry)[1]]
+        yield query, [rows[i] for i in active if starts[i] <= end]
@@ -0,0 +1,92 @@
+""" Parse the in-silico PCR results returned by UCSC hgPcr"""
+import html
+import re
+
+PRE_OPEN = re.compile(r"<pre[^>]*>", re.IGNORECASE)
+PRE_CLOSE = re.compile(r"</pre>", re.IGNORECASE)
+TAG = re.compile(r"<[^>]*>")
+HEADER = re.compile(r"^>(\S+):(\d+)([+-])(\d+)")
+
+
+class Amplicon(object):
+    """ Store an in-silico PCR product scraped from hgPcr.
+
+    Parameters:
+        header: FASTA header of the product e.g. >chr15:48755298+48755718 421bp ...
+        seq: DNA sequence of the product
+    """
+
+    def __init__(self, header, seq):
+        chrom, start, strand, end = HEADER.match(header).groups()
+        self.header = header
+        self.seq = seq
+        self.chrom = chrom
+        self.start = int(start)
+        self.end = int(end)
+        self.strand = strand
+
+    @property
+    def locus(self):
+        return "{}:{}-{}".format(self.chrom, self.start, self.end)
+
+    def __len__(self):
+        return len(self.seq)
+
+    def __eq__(self, other):
+        return self.__dict__ == other.__dict__
+
+    def __str__(self):
+        return "{}\n{}".format(self.header, self.seq)
+
+
+def extract_pre(lines):
+    """ Yield the text lines found within the first <pre> element of an
+        HTML page, stopping as soon as the element is closed.
+
+    Args:
+        lines: iterable of HTML lines (str or bytes) e.g. Response.iter_lines()
+    """
+    inside = False
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8", "replace")
+        if not inside:
+            opening = PRE_OPEN.search(line)
+            if not opening:
+                continue
+            inside = True
+            line = line[opening.end() :]
+        closing = PRE_CLOSE.search(line)
+        if closing:
+            line = line[: closing.start()]
+        text = html.unescape(TAG.sub("", line)).strip()
+        if text:
+            yield text
+        if closing:
+            return
+
+
+def parse_amplicons(lines):
+    """ Parse every FASTA record within the first <pre> element of
+        a hgPcr results page into Amplicon objects.
+
+    Args:
+        lines: iterable of HTML lines (str or bytes)
+
+    Returns:
+        list of Amplicon objects, empty if no product was generated
+    """
+    amplicons = []
+    header = None
+    seq = []
+    for text in extract_pre(lines):
+        if text.startswith(">"):
+            if header:
+                amplicons.append(Amplicon(header, "".join(seq)))
+            header = text
+            seq = []
+        elif header:
+            seq.append(text)
+    if header:
+        amplicons.append(Amplicon(header, "".join(seq)))
+    return amplicons
@@ -0,0 +1,183 @@
+""" Convert positions between genome builds with a UCSC chain file.
+
+The aligned blocks of every chain are held in arrays sorted by contig and
+start, so a whole batch of positions is converted with one binary search
+rather than a lookup per position.
+"""
+import gzip
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from GeneaPy.modules.interval_index import SPAN
+
+# UCSC names chain files after the builds they convert, e.g. hg19ToHg38.over.chain.gz
+CHAIN_NAME = re.compile(r"^([A-Za-z]+\d+)To([A-Za-z]+\d+)\.")
+
+
+def strip_chr(contig):
+    """ Return contig as a name without a chr prefix, e.g. chr1, 1 or 1.0 as 1."""
+    if isinstance(contig, float) and contig.is_integer():
+        contig = int(contig)
+    return str(contig).replace("chr", "")
+
+
+def parse_contig(contig):
+    """ Return contig as an int if it is numeric, e.g. chr1 as 1, or else
+        as a name, e.g. chrX as X.
+    """
+    contig = strip_chr(contig)
+    return int(contig) if contig.isdigit() else contig
+
+
+def parse_contigs(contigs):
+    """ Parse each contig with parse_contig, returning an int64 array if all
+        are numeric, or else an object array with NaN for missing contigs.
+    """
+    codes, names = pd.factorize(pd.Series(contigs, dtype=object).reset_index(drop=True))
+    names = [parse_contig(name) for name in names]
+    if (codes >= 0).all() and all(isinstance(name, int) for name in names):
+        return np.array(names, dtype=np.int64)[codes]
+    names = np.array(names + [np.nan], dtype=object)
+    return names[codes]
+
+
+def chain_builds(path):
+    """ Return the lowercase genome versions a chain file converts from and
+        to, e.g. (hg19, hg38), or (None, None) if its name does not say.
+    """
+    match = CHAIN_NAME.match(os.path.basename(path))
+    if not match:
+        return None, None
+    return match.group(1).lower(), match.group(2).lower()
+
+
+def read_chain(path):
+    """ Yield the header fields and blocks of each chain in a chain file.
+
+    Yields:
+        tuple of (target contig, query contig, query size, query strand,
+        list of (target start, query start, size) blocks) with 0-based
+        starts, query starts being on the query strand
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    header = None
+    with opener(path, "rt") as f:
+        for line in f:
+            fields = line.split()
+            if not fields:
+                continue
+            if fields[0] == "chain":
+                if header:
+                    yield header + (blocks,)
+                header = (fields[2], fields[7], int(fields[8]), fields[9])
+                t, q = int(fields[5]), int(fields[10])
+                blocks = []
+            else:
+                size = int(fields[0])
+                blocks.append((t, q, size))
+                if len(fields) == 3:
+                    t += size + int(fields[1])
+                    q += size + int(fields[2])
+    if header:
+        yield header + (blocks,)
+
+
+class ChainFile(object):
+    """ The aligned blocks of a UCSC chain file (e.g. hg19ToHg38.over.chain.gz).
+
+    Contig names are stored without a chr prefix. Where blocks of two
+    chains overlap, a position is converted by the block starting
+    closest before it.
+
+    Parameters:
+        path: chain file, optionally gzipped
+
+    Attributes:
+        source, target: genome versions converted from and to, None when
+                        not named in path as UCSC does
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.source, self.target = chain_builds(path)
+        contigs, t_starts, q_starts, sizes = [], [], [], []
+        q_contigs, q_sizes, q_strands = [], [], []
+        for t_contig, q_contig, q_size, q_strand, blocks in read_chain(path):
+            blocks = np.array(blocks, dtype=np.int64).reshape(-1, 3)
+            contigs.append(np.full(len(blocks), strip_chr(t_contig), dtype=object))
+            t_starts.append(blocks[:, 0])
+            q_starts.append(blocks[:, 1])
+            sizes.append(blocks[:, 2])
+            q_contigs.append(np.full(len(blocks), strip_chr(q_contig), dtype=object))
+            q_sizes.append(np.full(len(blocks), q_size))
+            q_strands.append(np.full(len(blocks), q_strand == "-"))
+        if not contigs:
+            raise ValueError("no chains found in {}".format(path))
+
+        codes, contigs = pd.factorize(np.concatenate(contigs))
+        self.contigs = pd.Index(contigs)
+        t_starts = np.concatenate(t_starts)
+        order = np.lexsort((t_starts, codes))
+        self.keys = codes[order] * SPAN + t_starts[order]
+        self.sizes = np.concatenate(sizes)[order]
+        self.q_starts = np.concatenate(q_starts)[order]
+        self.q_contigs = np.concatenate(q_contigs)[order]
+        self.q_sizes = np.concatenate(q_sizes)[order]
+        self.q_reverse = np.concatenate(q_strands)[order]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def lift(self, contig, position):
+        """ Convert 1-based positions to the query build.
+
+        Args:
+            contig: contig of each position, with or without a chr prefix
+            position: each position
+
+        Returns:
+            tuple of arrays holding the converted contig (None if the
+            position could not be converted), position (NaN if not
+            converted) and strand (+ or -) of each position
+        """
+        contig = pd.Series(contig).reset_index(drop=True)
+        codes = self.contigs.get_indexer(contig.map(strip_chr))
+        position = np.asarray(position, dtype=float)
+        valid = (codes >= 0) & ~np.isnan(position)
+        offset = np.where(valid, position - 1, 0).astype(np.int64)
+        base = np.maximum(codes, 0) * SPAN
+        block = np.maximum(np.searchsorted(self.keys, base + offset, side="right") - 1, 0)
+        start = self.keys[block] - base
+        valid &= (start >= 0) & (offset < start + self.sizes[block])
+
+        q_offset = self.q_starts[block] + offset - start
+        reverse = self.q_reverse[block]
+        lifted = np.where(reverse, self.q_sizes[block] - q_offset, q_offset + 1)
+        lifted = np.where(valid, lifted, np.nan)
+        contigs = np.where(valid, self.q_contigs[block], None)
+        strands = np.where(reverse, "-", "+")
+        return contigs, lifted, strands
+
+    def lift_ranges(self, contig, start, end):
+        """ Convert 1-based ranges, which must map wholly to one contig
+            and strand of the query build.
+
+        Returns:
+            tuple of arrays of the converted contig (None if the range
+            could not be converted), start and end (NaN if not converted)
+        """
+        start_contig, lifted_start, start_strand = self.lift(contig, start)
+        end_contig, lifted_end, end_strand = self.lift(contig, end)
+        valid = (
+            (start_contig == end_contig)
+            & (start_strand == end_strand)
+            & ~np.isnan(lifted_start)
+            & ~np.isnan(lifted_end)
+        )
+        low = np.fmin(lifted_start, lifted_end)
+        high = np.fmax(lifted_start, lifted_end)
+        contigs = np.where(valid, start_contig, None)
+        return contigs, np.where(valid, low, np.nan), np.where(valid, high, np.nan)
@@ -1,9 +1,26 @@
+import functools
+import re
+
 from pyensembl import EnsemblRelease
 
 import GeneaPy.modules.custom_exceptions as ex
 from GeneaPy import get_seq
-from GeneaPy.modules import pyensembl_wrappers
+from GeneaPy.modules import metrics, pyensembl_wrappers
+from GeneaPy.modules.annotation_index import AnnotationIndex
 from GeneaPy.modules.common import correct_hg_version, get_ensembl_release
+from GeneaPy.modules.liftover import ChainFile, parse_contig
+
+
+@functools.lru_cache(maxsize=8)
+def _open_index(path):
+    return AnnotationIndex(path)
+
+
+def open_annotation(annotation):
+    """ Return an AnnotationIndex, opening each index directory only once."""
+    if isinstance(annotation, AnnotationIndex):
+        return annotation
+    return _open_index(annotation)
 
 
 class LocusMetaData(object):
@@ -17,6 +34,8 @@ class LocusMetaData(object):
         genome: path to human genome FASTA file (optional)
         gene_list: preffered gene(s) if position covers more than one gene
         seq: decide whether to scrape sequence from UCSC or not (Boolean)
+        annotation: annotation index directory (or AnnotationIndex) built
+                    by index_gtf to use instead of pyensembl (optional)
     """
 
     def __init__(
@@ -28,6 +47,7 @@ class LocusMetaData(object):
         genome=None,
         gene_list=[],
         seq=True,
+        annotation=None,
     ):
         self.contig = contig
         self.position = position
@@ -36,11 +56,16 @@ class LocusMetaData(object):
         self.genome = genome
         self.gene_list = gene_list
         self.seq = seq
-        self.ensembl = EnsemblRelease(get_ensembl_release(self.hg_version))
+        if annotation is not None:
+            self.ensembl = open_annotation(annotation)
+        else:
+            # cached so every LocusMetaData of a release shares its database connection
+            self.ensembl = EnsemblRelease.cached(release=get_ensembl_release(self.hg_version))
         self.gene = self._get_gene()
         self._transcript = None
         self.sequence = self._sequence()
 
+    @metrics.timed("annotation_lookup")
     def _get_gene(self):
         return pyensembl_wrappers.get_gene_locus(
             data=self.ensembl,
@@ -50,6 +75,7 @@ class LocusMetaData(object):
         )
 
     @property
+    @metrics.timed("annotation_lookup")
     def transcript(self):
         transcript = pyensembl_wrappers.get_transcript(
             data=self.ensembl,
@@ -69,7 +95,9 @@ class LocusMetaData(object):
     def exon(self):
         if not self._transcript:
             self.transcript
-        return pyensembl_wrappers.get_exon(self.position, self._transcript)
+        # the transcript lookup is timed by itself, so only the exon search is timed here
+        with metrics.timer("annotation_lookup"):
+            return pyensembl_wrappers.get_exon(self.position, self._transcript)
 
     def _sequence(self):
         if not self.seq:
@@ -85,18 +113,42 @@ class LocusMetaData(object):
         end = self.position + self.flank
         return "{}:{}-{}".format(self.contig, start, end)
 
+    @property
+    def seq_range(self):
+        return self._get_seq_range()
+
     @classmethod
     def from_position(
-        cls, genomic_position, hg_version, flank=50, genome=None, gene_list=[]
+        cls,
+        genomic_position,
+        hg_version,
+        flank=50,
+        genome=None,
+        gene_list=[],
+        chain=None,
+        lift_to=None,
+        annotation=None,
     ):
-        contig, position = genomic_position.lower().replace("chr", "").split(":")
+        """ Create from a contig:position string, converting it from
+            hg_version to lift_to with a chain file (path or ChainFile)
+            when lift_to is given.
+        """
+        contig, position = genomic_position.split(":")
+        contig = re.sub("^chr", "", contig, flags=re.IGNORECASE)
+        if lift_to:
+            chain = chain if isinstance(chain, ChainFile) else ChainFile(chain)
+            contigs, positions, _ = chain.lift([contig], [int(position)])
+            if contigs[0] is None:
+                raise ex.NoLiftOver(genomic_position, lift_to)
+            contig, position, hg_version = contigs[0], positions[0], lift_to
         return cls(
-            contig=int(contig),
+            contig=parse_contig(contig),
             position=int(position),
             hg_version=hg_version,
             flank=flank,
             genome=genome,
             gene_list=gene_list,
+            annotation=annotation,
         )
 
     def __str__(self):
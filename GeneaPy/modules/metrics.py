@@ -0,0 +1,161 @@
+""" Process wide stage timers and counters which the scripts can dump at
+    the end of a run with --metrics FILE.
+
+Timers accumulate the number of calls and total seconds of a named stage
+(e.g. sequence_fetch, annotation_lookup, html_parse, filtering, write).
+Counters count events such as network requests, cache hits and misses
+and exceptions, optionally split by labels, e.g.
+
+    with metrics.timer("sequence_fetch"):
+        ...
+    metrics.count("network_requests", mode="live")
+
+Files ending in .json are written as JSON and anything else as
+Prometheus text exposition format.
+"""
+import contextlib
+import functools
+import json
+import threading
+import time
+
+PREFIX = "geneapy"
+
+_lock = threading.Lock()
+_timers = {}
+_counters = {}
+
+
+def reset():
+    with _lock:
+        _timers.clear()
+        _counters.clear()
+
+
+def _key(name, labels):
+    return (name, tuple(sorted(labels.items())))
+
+
+def count(name, value=1, **labels):
+    """ Add value to the counter name with the given labels."""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def count_exception(error, **labels):
+    """ Count an exception by its type."""
+    count("exceptions", type=type(error).__name__, **labels)
+
+
+def record(name, seconds, **labels):
+    """ Add a call taking seconds to the timer name."""
+    key = _key(name, labels)
+    with _lock:
+        calls, total = _timers.get(key, (0, 0.0))
+        _timers[key] = (calls + 1, total + seconds)
+
+
+@contextlib.contextmanager
+def timer(name, **labels):
+    """ Time the body of a with statement as a call of the timer name."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start, **labels)
+
+
+def timed(name, **labels):
+    """ Decorate a function so each call is timed as a call of the timer name."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer(name, **labels):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def drain():
+    """ Return the raw timers and counters and reset them, e.g. in a worker
+        process, to be added to those of the parent with merge.
+    """
+    with _lock:
+        drained = {"timers": dict(_timers), "counters": dict(_counters)}
+        _timers.clear()
+        _counters.clear()
+    return drained
+
+
+def merge(drained):
+    """ Add the timers and counters returned by drain to this process's."""
+    with _lock:
+        for key, (calls, total) in drained["timers"].items():
+            old_calls, old_total = _timers.get(key, (0, 0.0))
+            _timers[key] = (old_calls + calls, old_total + total)
+        for key, value in drained["counters"].items():
+            _counters[key] = _counters.get(key, 0) + value
+
+
+def snapshot():
+    """ Return the current timers and counters as a JSON serialisable dict."""
+    with _lock:
+        timers = [
+            {"name": name, "labels": dict(labels), "calls": calls, "seconds": round(total, 6)}
+            for (name, labels), (calls, total) in sorted(_timers.items())
+        ]
+        counters = [
+            {"name": name, "labels": dict(labels), "value": value}
+            for (name, labels), value in sorted(_counters.items())
+        ]
+    return {"timers": timers, "counters": counters}
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    pairs = ('{}="{}"'.format(k, str(v).replace('"', '\\"')) for k, v in sorted(labels.items()))
+    return "{" + ",".join(pairs) + "}"
+
+
+def to_prometheus(snap=None):
+    """ Format a snapshot as Prometheus text exposition format."""
+    snap = snap or snapshot()
+    lines = []
+    if snap["timers"]:
+        name = "{}_stage_seconds_total".format(PREFIX)
+        lines.append("# HELP {} Total seconds spent in each stage.".format(name))
+        lines.append("# TYPE {} counter".format(name))
+        for t in snap["timers"]:
+            labels = _labels(dict(t["labels"], stage=t["name"]))
+            lines.append("{}{} {}".format(name, labels, t["seconds"]))
+        name = "{}_stage_calls_total".format(PREFIX)
+        lines.append("# HELP {} Number of calls of each stage.".format(name))
+        lines.append("# TYPE {} counter".format(name))
+        for t in snap["timers"]:
+            labels = _labels(dict(t["labels"], stage=t["name"]))
+            lines.append("{}{} {}".format(name, labels, t["calls"]))
+    seen = set()
+    for c in snap["counters"]:
+        name = "{}_{}_total".format(PREFIX, c["name"])
+        if name not in seen:
+            seen.add(name)
+            lines.append("# TYPE {} counter".format(name))
+        lines.append("{}{} {}".format(name, _labels(c["labels"]), c["value"]))
+    return "\n".join(lines) + "\n"
+
+
+def write(path):
+    """ Write the current metrics to path, as JSON if it ends in .json
+        and as Prometheus text otherwise.
+    """
+    snap = snapshot()
+    with open(path, "w") as f:
+        if path.endswith(".json"):
+            json.dump(snap, f, indent=2)
+        else:
+            f.write(to_prometheus(snap))
@@ -0,0 +1,179 @@
+""" Run items through a series of stages, each with its own worker threads,
+    joined by bounded queues so network waits overlap with parsing and
+    annotation of other items.
+"""
+import queue
+import threading
+import time
+
+DONE = object()
+
+
+class Stage(object):
+    """ A named step of a Pipeline which records its own throughput.
+
+    Parameters:
+        name: stage name used when reporting statistics
+        func: function applied to each item
+        workers: number of threads running func
+    """
+
+    def __init__(self, name, func, workers=1):
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.items = 0
+        self.busy = 0.0
+        self.started = None
+        self.finished = None
+        self.depth_total = 0
+        self.depth_samples = 0
+        self.max_depth = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, item):
+        start = time.time()
+        try:
+            return self.func(item)
+        finally:
+            end = time.time()
+            with self._lock:
+                self.items += 1
+                self.busy += end - start
+                self.started = start if self.started is None else self.started
+                self.finished = end
+
+    def sample(self, depth):
+        """ Record the number of items waiting in the stages queue."""
+        with self._lock:
+            self.depth_total += depth
+            self.depth_samples += 1
+            self.max_depth = max(self.max_depth, depth)
+
+    def stats(self):
+        wall = (self.finished - self.started) if self.items else 0.0
+        return {
+            "stage": self.name,
+            "workers": self.workers,
+            "items": self.items,
+            "busy_seconds": round(self.busy, 3),
+            "items_per_second": round(self.items / wall, 3) if wall else 0.0,
+            "mean_queue_depth": round(self.depth_total / max(self.depth_samples, 1), 2),
+            "max_queue_depth": self.max_depth,
+        }
+
+
+class Pipeline(object):
+    """ Pass items through a list of Stages joined by bounded queues.
+
+    Every stage but the last runs in its own worker threads, so items can
+    complete out of order. The last stage runs in the calling thread and
+    receives the items in their original input order. Items held back
+    until the ones before them complete count towards the window, so a
+    slow item stops new ones being read rather than the rest piling up.
+
+    Parameters:
+        stages: list of Stage objects
+        maxsize: maximum number of items waiting between two stages
+        window: maximum number of items read but not yet passed to the
+                last stage (default=maxsize * number of stages)
+    """
+
+    def __init__(self, stages, maxsize=16, window=None):
+        self.stages = stages
+        self.maxsize = maxsize
+        self.window = window or maxsize * len(stages)
+
+    def run(self, items, on_error):
+        """ Run every item through the stages.
+
+        Args:
+            items: iterable of input items
+            on_error: called with the input item and the exception raised
+                      by whichever stage failed, the item then skips the
+                      remaining stages
+        """
+        threaded, last = self.stages[:-1], self.stages[-1]
+        queues = [queue.Queue(self.maxsize) for _ in range(len(threaded) + 1)]
+        inputs = {}
+        window = threading.BoundedSemaphore(self.window)
+        threads = [
+            threading.Thread(target=self._feed, args=(items, inputs, queues[0], window))
+        ]
+        for n, stage in enumerate(threaded):
+            remaining = [stage.workers]
+            lock = threading.Lock()
+            for _ in range(stage.workers):
+                threads.append(
+                    threading.Thread(
+                        target=self._work,
+                        args=(stage, queues[n], queues[n + 1], remaining, lock),
+                    )
+                )
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        # restore the input order before handing items to the last stage
+        pending = {}
+        expected = 0
+        while True:
+            last.sample(queues[-1].qsize())
+            got = queues[-1].get()
+            if got is DONE:
+                break
+            index, value, error = got
+            pending[index] = (value, error)
+            while expected in pending:
+                value, error = pending.pop(expected)
+                item = inputs.pop(expected)
+                window.release()
+                expected += 1
+                if error is None:
+                    try:
+                        last(value)
+                    except Exception as e:
+                        error = e
+                if error is not None:
+                    on_error(item, error)
+
+    def _feed(self, items, inputs, outbox, window):
+        try:
+            for index, item in enumerate(items):
+                window.acquire()
+                inputs[index] = item
+                outbox.put((index, item, None))
+        finally:
+            outbox.put(DONE)
+
+    def _work(self, stage, inbox, outbox, remaining, lock):
+        while True:
+            stage.sample(inbox.qsize())
+            got = inbox.get()
+            if got is DONE:
+                # leave the sentinel for the other workers of this stage
+                inbox.put(DONE)
+                with lock:
+                    remaining[0] -= 1
+                    finished = remaining[0] == 0
+                if finished:
+                    outbox.put(DONE)
+                return
+            index, value, error = got
+            if error is None:
+                try:
+                    value = stage(value)
+                except Exception as e:
+                    error = e
+            outbox.put((index, value, error))
+
+    def stats(self):
+        return [stage.stats() for stage in self.stages]
+
+
+def format_stats(stats):
+    """ Format Pipeline.stats() as a tab delimited table."""
+    header = list(stats[0].keys())
+    rows = ["\t".join(header)]
+    rows += ["\t".join(str(s[column]) for column in header) for s in stats]
+    return "\n".join(rows)
@@ -0,0 +1,157 @@
+""" Calculate primer and amplicon properties for batches of sequences.
+
+Sequences are encoded into a padded (sequences x bases) uint8 array so
+every property is calculated for the whole batch at once with NumPy.
+"""
+import numpy as np
+
+# A=0, C=1, G=2, T=3 and anything else (N, padding) is 4
+CODES = np.full(256, 4, dtype=np.uint8)
+for code, bases in enumerate(("Aa", "Cc", "Gg", "Tt")):
+    for base in bases:
+        CODES[ord(base)] = code
+
+# SantaLucia (1998) unified nearest-neighbour parameters indexed by
+# 4 * 5' base + 3' base; enthalpy in kcal/mol and entropy in cal/K/mol
+NN_DH = np.array(
+    [
+        -7.9, -8.4, -7.8, -7.2,
+        -8.5, -8.0, -10.6, -7.8,
+        -8.2, -9.8, -8.0, -8.4,
+        -7.2, -8.2, -8.5, -7.9,
+    ]
+)  # fmt: skip
+NN_DS = np.array(
+    [
+        -22.2, -22.4, -21.0, -20.4,
+        -22.7, -19.9, -27.2, -21.0,
+        -22.2, -24.4, -19.9, -22.4,
+        -21.3, -22.2, -22.7, -22.2,
+    ]
+)  # fmt: skip
+# initiation with a terminal A/T or G/C base, indexed by base code
+INIT_DH = np.array([2.3, 0.1, 0.1, 2.3, 0.0])
+INIT_DS = np.array([4.1, -2.8, -2.8, 4.1, 0.0])
+GAS_CONSTANT = 1.987
+
+
+def encode(seqs):
+    """ Encode a batch of DNA sequences into a padded array of base codes.
+
+    Args:
+        seqs: list of DNA sequences as str or bytes
+
+    Returns:
+        tuple of a (sequences x bases) uint8 array of base codes
+        and an array of the sequence lengths
+    """
+    seqs = [s.encode() if isinstance(s, str) else bytes(s) for s in seqs]
+    lengths = np.array([len(s) for s in seqs], dtype=np.int64)
+    width = max(lengths.max(), 1) if seqs else 1
+    raw = np.array(seqs, dtype="S{}".format(width)).view(np.uint8)
+    return CODES[raw.reshape(len(seqs), width)], lengths
+
+
+def gc_content(seqs):
+    """ Return the fraction of G and C bases in each sequence."""
+    codes, lengths = encode(seqs)
+    gc = ((codes == 1) | (codes == 2)).sum(axis=1)
+    return gc / np.maximum(lengths, 1)
+
+
+def _free_energy(codes, lengths):
+    """ Sum the nearest-neighbour enthalpy and entropy of each sequence."""
+    rows = np.arange(len(codes))
+    five, three = codes[:, :-1], codes[:, 1:]
+    valid = (five < 4) & (three < 4)
+    steps = np.where(valid, five.astype(np.int64) * 4 + three, 0)
+    dh = np.where(valid, NN_DH[steps], 0).sum(axis=1)
+    ds = np.where(valid, NN_DS[steps], 0).sum(axis=1)
+    first = codes[:, 0]
+    last = codes[rows, np.maximum(lengths - 1, 0)]
+    dh = dh + INIT_DH[first] + INIT_DH[last]
+    ds = ds + INIT_DS[first] + INIT_DS[last]
+    return dh, ds
+
+
+def melting_temp(seqs, na=50, dnac=50):
+    """ Return the nearest-neighbour melting temperature (C) of each sequence.
+
+    Args:
+        seqs: list of DNA sequences
+        na: monovalent cation concentration (mM)
+        dnac: primer concentration (nM)
+    """
+    codes, lengths = encode(seqs)
+    dh, ds = _free_energy(codes, lengths)
+    ds = ds + 0.368 * (lengths - 1) * np.log(na / 1000.0)
+    tm = (1000 * dh) / (ds + GAS_CONSTANT * np.log(dnac * 1e-9 / 4)) - 273.15
+    return tm
+
+
+def three_prime(codes, lengths, window=5):
+    """ Return the codes of the last window bases of each sequence, with
+        sequences shorter than the window whole and padded with 4 at the end.
+    """
+    index = np.maximum(lengths[:, None] - window, 0) + np.arange(window)
+    within = index < lengths[:, None]
+    index = np.minimum(index, codes.shape[1] - 1)
+    return np.where(within, np.take_along_axis(codes, index, axis=1), 4).astype(np.uint8)
+
+
+def gc_clamp(seqs, window=5):
+    """ Return the number of G and C bases within the 3' window of each sequence."""
+    codes, lengths = encode(seqs)
+    end = three_prime(codes, lengths, window)
+    return ((end == 1) | (end == 2)).sum(axis=1)
+
+
+def end_stability(seqs, window=5):
+    """ Return the free energy (kcal/mol at 37C) of the 3' window of each sequence.
+
+    Notes:
+        the more negative the value, the more stable the 3' end
+    """
+    codes, lengths = encode(seqs)
+    end = three_prime(codes, lengths, window)
+    dh, ds = _free_energy(end, np.minimum(lengths, window))
+    return dh - 310.15 * ds / 1000
+
+
+def self_complementarity(seqs):
+    """ Return the self-complementarity score of each sequence.
+
+    The score is the largest number of Watson-Crick pairs formed by
+    any ungapped, antiparallel alignment of a sequence against itself.
+    """
+    codes, lengths = encode(seqs)
+    width = codes.shape[1]
+    # reverse each sequence within its own length, keeping the padding at the end
+    rows = np.arange(len(codes))[:, None]
+    index = lengths[:, None] - 1 - np.arange(width)
+    reverse = np.where(index >= 0, codes[rows, np.maximum(index, 0)], 4)
+    score = np.zeros(len(codes), dtype=np.int64)
+    for shift in range(-width + 1, width):
+        top = codes[:, max(shift, 0) : width + min(shift, 0)]
+        bottom = reverse[:, max(-shift, 0) : width - max(shift, 0)]
+        # A+T and C+G are the only valid code pairs that sum to 3
+        pairs = (top.astype(np.int64) + bottom) == 3
+        score = np.maximum(score, pairs.sum(axis=1))
+    return score
+
+
+def primer_properties(primers):
+    """ Calculate the properties of a batch of primers.
+
+    Args:
+        primers: list of primer sequences
+
+    Returns:
+        dict of property name and an array of values in primer order
+    """
+    return {
+        "Tm": melting_temp(primers).round(1),
+        "GC_Clamp": gc_clamp(primers),
+        "End_Stability": end_stability(primers).round(2),
+        "Self_Comp": self_complementarity(primers),
+    }
@@ -0,0 +1,161 @@
+""" Answer primer_finder queries over HTTP with the primer database
+    loaded and indexed once and kept in memory.
+
+POST /query with a JSON object of primer_finder arguments, e.g.
+    {"variant": "15:48787370", "distance": 100}
+    {"variants": [["one", "15:48787380"], ["two", "16:15931964"]], "size": 600}
+    {"variants": [["one", "15:48787380"]], "best": 2}
+returns {"primers": [...], "unmatched": [...]}. GET /health returns the
+database path and number of primer pairs loaded, or 503 if the database
+could not be loaded.
+"""
+import json
+import logging
+import os
+import threading
+import warnings
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+import pandas as pd
+
+import GeneaPy.modules.custom_exceptions as ex
+from GeneaPy import primer_finder
+from GeneaPy.modules.common import correct_hg_version
+
+
+class PrimerDatabase(object):
+    """ A primer database and its amplicon index, reloaded whenever the
+        database file changes. If a reload fails the previous database is
+        kept until the file changes again.
+
+    Parameters:
+        path: primer database (tsv format)
+        cache: load the database from its pre-parsed sidecar cache
+    """
+
+    def __init__(self, path, cache=True):
+        self.path = path
+        self.cache = cache
+        self.mtime = None
+        self.state = None
+        self._lock = threading.Lock()
+        self.current()
+
+    def current(self):
+        """ Return the loaded (DataFrame, AmpliconIndex), reloading if the
+            file changed, or None if no database has been loaded.
+        """
+        with self._lock:
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+                if mtime != self.mtime:
+                    # not retried until the file changes again if loading fails
+                    self.mtime = mtime
+                    logging.info("Loading primer database {}".format(self.path))
+                    db = primer_finder.database2df(self.path, self.cache)
+                    self.state = (db, primer_finder.index_database(db))
+            except Exception as e:
+                logging.error("Could not load primer database {}: {}".format(self.path, e))
+            return self.state
+
+    def query(self, request):
+        """ Filter the primer database with the arguments of a JSON request.
+
+        Returns:
+            tuple of the matching primers DataFrame (or None) and a list
+            of the requested variant names without a matching primer
+
+        Raises:
+            DatabaseNotLoaded: if no database has been loaded
+        """
+        state = self.current()
+        if state is None:
+            raise ex.DatabaseNotLoaded(self.path)
+        db, index = state
+        unmatched = []
+        if request.get("variants"):
+            var_df = primer_finder.variants2df(pd.DataFrame(request["variants"]))
+            primers = primer_finder.get_variant_file_primers(db, var_df, index)
+            unmatched = var_df[~var_df["Variant"].isin(primers["Variant"])]
+            unmatched = unmatched["Variant"].tolist()
+        elif request.get("variant"):
+            primers = primer_finder.get_variant_primers(db, request["variant"], index)
+        else:
+            # a shallow copy so filter columns are never added to the shared db
+            primers = db.copy(deep=False)
+        hg = request.get("genome_version")
+        primers = primer_finder.extra_filters(
+            primers,
+            request.get("size"),
+            request.get("distance"),
+            request.get("gc"),
+            request.get("gene"),
+            request.get("exon"),
+            request.get("intron"),
+            correct_hg_version(hg) if hg else None,
+        )
+        if request.get("best") and primers is not None:
+            primers = primer_finder.best_primers(primers, request["best"])
+        return primers, unmatched
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/health":
+            return self.respond(404, {"error": "unknown path {}".format(self.path)})
+        state = self.server.database.current()
+        if state is None:
+            error = str(ex.DatabaseNotLoaded(self.server.database.path))
+            return self.respond(503, {"database": self.server.database.path, "error": error})
+        self.respond(200, {"database": self.server.database.path, "primers": len(state[0])})
+
+    def do_POST(self):
+        if self.path != "/query":
+            return self.respond(404, {"error": "unknown path {}".format(self.path)})
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length).decode() or "{}")
+            primers, unmatched = self.server.database.query(request)
+        except ex.DatabaseNotLoaded as e:
+            return self.respond(503, {"error": str(e)})
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            return self.respond(400, {"error": str(e)})
+        records = "[]" if primers is None else primers.to_json(orient="records")
+        body = '{{"primers": {}, "unmatched": {}}}'.format(records, json.dumps(unmatched))
+        self.respond(200, body)
+
+    def respond(self, status, body):
+        if not isinstance(body, str):
+            body = json.dumps(body)
+        body = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.info(format % args)
+
+
+class PrimerServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, database):
+        HTTPServer.__init__(self, address, QueryHandler)
+        self.database = database
+
+
+def serve(database, host="127.0.0.1", port=8080, cache=True):
+    """ Serve primer_finder queries against database until interrupted."""
+    # as in primer_finder, silence the SettingWithCopyWarnings
+    warnings.filterwarnings("ignore")
+    server = PrimerServer((host, port), PrimerDatabase(database, cache))
+    print("Serving {} on http://{}:{}".format(database, host, port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
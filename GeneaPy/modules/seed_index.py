@@ -0,0 +1,250 @@
+""" A memory-mapped k-mer seed index of a genome for finding primer binding sites.
+
+The index directory holds the genome as one byte per base (genome.seq),
+the genomic offset of every k-mer sorted by k-mer (positions.npy), the
+start of each k-mer's block within positions (starts.npy) and the contig
+layout (index.json). It is built once per genome build and opened with
+mmap thereafter, so several processes share the same pages.
+
+A primer is seeded by its len // k disjoint k-mers. Rather than
+shortening the seeds until one must match exactly, each seed is looked
+up with up to mismatches // (len // k) substitutions, so by the
+pigeonhole principle at least one seed of every site is found while the
+seeds stay long enough to have few hits in a large genome.
+"""
+import itertools
+import json
+import os
+
+import numpy as np
+
+import GeneaPy.modules.custom_exceptions as ex
+from GeneaPy.modules.primer_properties import CODES
+
+COMPLEMENT = np.array([3, 2, 1, 0, 4], dtype=np.uint8)
+CHUNK = 10000000
+# default seed length of a new index
+SEED_LENGTH = 10
+
+
+def kmers(codes, k):
+    """ Return the integer value of every k-mer in an array of base codes
+        and whether the k-mer is free of non-ACGT bases.
+    """
+    n = len(codes) - k + 1
+    if n <= 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=bool)
+    values = np.zeros(n, dtype=np.int64)
+    for j in range(k):
+        values = (values << 2) | (codes[j : j + n] & 3)
+    ambiguous = np.concatenate(([0], np.cumsum(codes == 4)))
+    valid = (ambiguous[k:] - ambiguous[:n]) == 0
+    return values, valid
+
+
+def mismatch_weights(length, window=5, weight=3):
+    """ Weight each primer base so mismatches closer to the 3' end count more.
+
+    The 3' most base is given the full weight, decreasing linearly to 1
+    at window bases from the 3' end.
+    """
+    distance = np.arange(length)[::-1]
+    return 1 + (weight - 1) * np.maximum(0, window - distance) / window
+
+
+def seed_mismatches(length, k, mismatches):
+    """ Return the mismatches to allow within each of the length // k
+        disjoint k-mer seeds of a primer so that at least one seed of any
+        site with up to mismatches mismatches is within them.
+    """
+    return mismatches // (length // k)
+
+
+def seed_variants(seed, errors):
+    """ Return the k-mer values within errors substitutions of a seed of
+        base codes, substituting any non-ACGT base in every variant.
+    """
+    k = len(seed)
+    ambiguous = [p for p in range(k) if seed[p] == 4]
+    if len(ambiguous) > errors:
+        return np.zeros(0, dtype=np.int64)
+    others = [p for p in range(k) if seed[p] != 4]
+    shifts = [2 * (k - 1 - p) for p in range(k)]
+    base = 0
+    for p in range(k):
+        base |= (int(seed[p]) & 3) << shifts[p]
+    values = []
+    for n in range(errors - len(ambiguous) + 1):
+        for chosen in itertools.combinations(others, n):
+            positions = ambiguous + list(chosen)
+            choices = [[b for b in range(4) if b != seed[p]] for p in positions]
+            for bases in itertools.product(*choices):
+                value = base
+                for p, b in zip(positions, bases):
+                    value += (b - (int(seed[p]) & 3)) << shifts[p]
+                values.append(value)
+    return np.array(values, dtype=np.int64)
+
+
+def read_fasta(genome):
+    """ Yield (contig, sequence bytes) for each record of a FASTA file."""
+    name = None
+    seq = bytearray()
+    with open(genome, "rb") as f:
+        for line in f:
+            if line.startswith(b">"):
+                if name is not None:
+                    yield name, seq
+                name = line[1:].split()[0].decode()
+                seq = bytearray()
+            else:
+                seq.extend(line.rstrip())
+    if name is not None:
+        yield name, seq
+
+
+class SeedIndex(object):
+    """ Open a k-mer seed index previously built with SeedIndex.build.
+
+    Parameters:
+        path: index directory
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "index.json")) as f:
+            layout = json.load(f)
+        self.k = layout["k"]
+        self.contigs = [c["name"] for c in layout["contigs"]]
+        self.offsets = np.array([c["offset"] for c in layout["contigs"]])
+        self.lengths = np.array([c["length"] for c in layout["contigs"]])
+        self.seq = np.memmap(os.path.join(path, "genome.seq"), dtype=np.uint8, mode="r")
+        self.starts = np.load(os.path.join(path, "starts.npy"), mmap_mode="r")
+        self.positions = np.load(os.path.join(path, "positions.npy"), mmap_mode="r")
+
+    @staticmethod
+    def exists(path):
+        return os.path.exists(os.path.join(path, "index.json"))
+
+    @classmethod
+    def build(cls, genome, path, k=SEED_LENGTH):
+        """ Build a seed index from a FASTA genome and return it opened.
+
+        Args:
+            genome: path to genome FASTA file
+            path: directory to write the index to
+            k: seed length
+        """
+        if not 4 <= k <= 13:
+            raise ValueError("seed length must be between 4 and 13")
+        os.makedirs(path, exist_ok=True)
+        counts = np.zeros(4 ** k, dtype=np.int64)
+        contigs = []
+        offset = 0
+        # first pass: store the encoded genome and count every k-mer
+        with open(os.path.join(path, "genome.seq"), "wb") as out:
+            for name, seq in read_fasta(genome):
+                codes = CODES[np.frombuffer(bytes(seq), dtype=np.uint8)]
+                out.write(codes.tobytes())
+                for start in range(0, len(codes), CHUNK):
+                    values, valid = kmers(codes[start : start + CHUNK + k - 1], k)
+                    counts += np.bincount(values[valid], minlength=4 ** k)
+                contigs.append({"name": name, "offset": offset, "length": len(codes)})
+                offset += len(codes)
+        starts = np.concatenate(([0], np.cumsum(counts)))
+        np.save(os.path.join(path, "starts.npy"), starts)
+
+        # second pass: scatter each k-mer's genomic offset into its block
+        dtype = np.uint32 if offset < 2 ** 32 else np.uint64
+        positions = np.lib.format.open_memmap(
+            os.path.join(path, "positions.npy"), mode="w+", dtype=dtype, shape=(starts[-1],)
+        )
+        cursor = starts[:-1].copy()
+        seq = np.memmap(os.path.join(path, "genome.seq"), dtype=np.uint8, mode="r")
+        for contig in contigs:
+            end = contig["offset"] + contig["length"]
+            for start in range(contig["offset"], end, CHUNK):
+                values, valid = kmers(seq[start : min(start + CHUNK + k - 1, end)], k)
+                where = np.flatnonzero(valid)
+                order = np.argsort(values[where], kind="stable")
+                values, where = values[where][order], where[order] + start
+                first = np.searchsorted(values, values, side="left")
+                positions[cursor[values] + np.arange(len(values)) - first] = where
+                cursor += np.bincount(values, minlength=4 ** k)
+        positions.flush()
+        del positions, seq
+
+        with open(os.path.join(path, "index.json"), "w") as f:
+            json.dump({"k": k, "genome": os.path.abspath(genome), "contigs": contigs}, f)
+        return cls(path)
+
+    def _candidates(self, primer, query, errors, max_hits):
+        """ Return the genomic offsets where query could bind, seeded by its
+            disjoint k-mers with up to errors substitutions each.
+
+        Raises:
+            RepetitiveSeed: if a seed has more than max_hits hits, as no
+                            seed can be skipped without missing sites
+        """
+        candidates = [np.zeros(0, dtype=np.int64)]
+        for offset in range(0, len(query) // self.k * self.k, self.k):
+            values = seed_variants(query[offset : offset + self.k], errors)
+            starts, ends = self.starts[values], self.starts[values + 1]
+            hits = int((ends - starts).sum())
+            if hits > max_hits:
+                raise ex.RepetitiveSeed(primer, offset, hits, max_hits)
+            for start, end in zip(starts, ends):
+                hits = np.asarray(self.positions[start:end], dtype=np.int64)
+                candidates.append(hits - offset)
+        return np.unique(np.concatenate(candidates))
+
+    def find_sites(self, primer, max_mismatches=3, max_hits=1000000):
+        """ Find every binding site of a primer on either strand of the genome.
+
+        Args:
+            primer: primer sequence
+            max_mismatches: maximum mismatches allowed at a binding site
+            max_hits: most hits of a seed, counting its variants, to check
+
+        Raises:
+            SeedTooLong: if the primer is shorter than the seeds of the index
+            RepetitiveSeed: if a seed has more than max_hits hits
+
+        Returns:
+            list of (contig, position, strand, mismatches, score) tuples where
+            position is the 1-based start of the site on the forward strand
+            and score weights each mismatch toward the primers 3' end
+        """
+        codes = CODES[np.frombuffer(primer.encode(), dtype=np.uint8)]
+        length = len(codes)
+        if length < self.k:
+            raise ex.SeedTooLong(primer, self.k)
+        errors = seed_mismatches(length, self.k, max_mismatches)
+        weights = mismatch_weights(length)
+        sites = []
+        # a primer on the reverse strand appears as its reverse complement
+        for strand, query, weight in (
+            ("+", codes, weights),
+            ("-", COMPLEMENT[codes][::-1], weights[::-1]),
+        ):
+            candidates = self._candidates(primer, query, errors, max_hits)
+            # drop sites running off the end of a contig
+            contig = np.searchsorted(self.offsets, candidates, side="right") - 1
+            start = self.offsets[contig]
+            inside = (candidates >= start) & (
+                candidates + length <= start + self.lengths[contig]
+            )
+            candidates, contig = candidates[inside], contig[inside]
+            window = np.asarray(self.seq[candidates[:, None] + np.arange(length)])
+            mismatch = window != query
+            counts = mismatch.sum(axis=1)
+            keep = counts <= max_mismatches
+            scores = (mismatch * weight).sum(axis=1)
+            for c, pos, n, score in zip(
+                contig[keep], candidates[keep], counts[keep], scores[keep]
+            ):
+                position = int(pos - self.offsets[c]) + 1
+                sites.append(
+                    (self.contigs[c], position, strand, int(n), round(float(score), 2))
+                )
+        return sites
@@ -0,0 +1,116 @@
+""" Hold a genome FASTA as one memory-mapped byte file per contig so
+    several processes can read it while sharing a single copy in memory.
+
+The sidecar directory (<fasta>.npseq, or within GENEAPY_CACHE_DIR as for
+db_cache) is written once by streaming the FASTA and holds each contig's bases, case preserved and without line
+breaks, plus meta.json recording the FASTA's size, mtime and SHA-1 as
+db_cache does. Worker processes opening the sidecar map the same files
+read-only, so the operating system keeps one copy of the genome in its
+page cache however many workers there are.
+"""
+import gzip
+import json
+import logging
+import os
+import shutil
+
+import numpy as np
+
+from GeneaPy.modules import db_cache
+from GeneaPy.modules.liftover import strip_chr
+
+SUFFIX = ".npseq"
+
+
+def sidecar(fasta):
+    return db_cache.sidecar(fasta, SUFFIX)
+
+
+def write(fasta, output):
+    """ Stream a FASTA (gzipped if it ends in .gz) into a sequence index."""
+    if os.path.exists(output):
+        shutil.rmtree(output)
+    os.makedirs(output)
+    opener = gzip.open if fasta.endswith(".gz") else open
+    contigs = {}
+    out = None
+    try:
+        with opener(fasta, "rb") as f:
+            for line in f:
+                if line.startswith(b">"):
+                    if out:
+                        out.close()
+                    name = strip_chr(line[1:].split()[0].decode())
+                    contigs[name] = "{}.seq".format(len(contigs))
+                    out = open(os.path.join(output, contigs[name]), "wb")
+                elif out:
+                    out.write(line.rstrip())
+    finally:
+        if out:
+            out.close()
+    meta = {
+        "source": db_cache.fingerprint(fasta),
+        "sha1": db_cache.checksum(fasta),
+        "contigs": contigs,
+    }
+    # written last so an interrupted write is never mistaken for an index
+    with open(os.path.join(output, "meta.json"), "w") as f:
+        json.dump(meta, f)
+
+
+def build(fasta):
+    """ Return the sequence index of a FASTA, writing it first if it is
+        missing or the FASTA has changed since it was written.
+    """
+    output = sidecar(fasta)
+    meta = db_cache.read_meta(output)
+    if not (meta and db_cache.is_current(fasta, output, meta)):
+        logging.info("Writing the sequence index of {}".format(fasta))
+        write(fasta, output)
+    return output
+
+
+class SequenceIndex(object):
+    """ Fetch sequences from a sequence index like a pysam FastaFile.
+
+    Parameters:
+        path: sequence index directory
+    """
+
+    def __init__(self, path):
+        self.path = path
+        meta = db_cache.read_meta(path)
+        if meta is None:
+            raise ValueError("{} is not a sequence index".format(path))
+        self.files = meta["contigs"]
+        self._contigs = {}
+
+    @property
+    def references(self):
+        return list(self.files)
+
+    def contig(self, name):
+        """ Return the bases of a contig as a read-only memory-mapped array."""
+        name = strip_chr(name)
+        if name not in self._contigs:
+            if name not in self.files:
+                raise KeyError("sequence '{}' not present".format(name))
+            path = os.path.join(self.path, self.files[name])
+            if os.path.getsize(path):
+                self._contigs[name] = np.memmap(path, dtype=np.uint8, mode="r")
+            else:
+                # an empty file cannot be memory-mapped
+                self._contigs[name] = np.zeros(0, dtype=np.uint8)
+        return self._contigs[name]
+
+    def fetch(self, reference, start=None, end=None):
+        """ Return the bases from 0-based start up to end of a contig,
+            clamped to the contig as BgzfFasta does, so a negative start
+            (e.g. a flank running off the contig) fetches from its first base.
+        """
+        bases = self.contig(reference)
+        start = max(start or 0, 0)
+        end = len(bases) if end is None else min(end, len(bases))
+        if end <= start:
+            return ""
+        return bases[start:end].tobytes().decode()
@@ -0,0 +1,47 @@
+""" Greedy set cover over a sparse item x set coverage matrix."""
+import heapq
+
+import numpy as np
+
+
+def greedy_set_cover(items, sets):
+    """ Choose sets until every coverable item is covered, each time taking
+        the set covering the most items not yet covered.
+
+    The coverage matrix is given sparsely as parallel arrays with one
+    entry per (item, set) pair. Set sizes only shrink as items are
+    covered, so a set popped from the heap is only rescored, not taken,
+    if its size went down since it was pushed (lazy greedy).
+
+    Args:
+        items: integer code of the item in each pair
+        sets: integer code of the set in each pair
+
+    Returns:
+        list of (set code, array of the item codes it newly covers) in the
+        order the sets were chosen, ties going to the lowest set code
+    """
+    items = np.asarray(items, dtype=np.int64)
+    sets = np.asarray(sets, dtype=np.int64)
+    if not len(items):
+        return []
+    order = np.argsort(sets, kind="stable")
+    items, sets = items[order], sets[order]
+    bounds = np.flatnonzero(np.diff(sets)) + 1
+    members = np.split(items, bounds)
+    codes = sets[np.concatenate(([0], bounds))]
+    covered = np.zeros(items.max() + 1, dtype=bool)
+    heap = [(-len(np.unique(m)), int(c), n) for n, (c, m) in enumerate(zip(codes, members))]
+    heapq.heapify(heap)
+    chosen = []
+    while heap:
+        size, code, n = heapq.heappop(heap)
+        new = np.unique(members[n][~covered[members[n]]])
+        if not len(new):
+            continue
+        if len(new) < -size:
+            heapq.heappush(heap, (-len(new), code, n))
+            continue
+        covered[new] = True
+        chosen.append((code, new))
+    return chosen
@@ -0,0 +1,86 @@
+""" Send requests to the UCSC DAS and hgPcr servers, optionally recording
+    the responses to a local archive or replaying them from it offline.
+
+The mode and archive directory default to the GENEAPY_UCSC_MODE
+(live, record or replay) and GENEAPY_UCSC_ARCHIVE environment variables
+and can be changed with configure().
+"""
+import hashlib
+import json
+import os
+
+import requests
+
+import GeneaPy.modules.custom_exceptions as ex
+from GeneaPy.modules import metrics
+
+MODES = ("live", "record", "replay")
+SETTINGS = {
+    "mode": os.environ.get("GENEAPY_UCSC_MODE", "live"),
+    "archive": os.environ.get("GENEAPY_UCSC_ARCHIVE", "ucsc_archive"),
+}
+# one session so connections to UCSC are kept alive and reused
+SESSION = requests.Session()
+
+
+def configure(mode="live", archive=None):
+    """ Set whether UCSC requests are sent live, recorded or replayed.
+
+    Args:
+        mode: live, record or replay
+        archive: directory the responses are recorded to or replayed from
+    """
+    if mode not in MODES:
+        raise ValueError("mode must be one of {}".format(", ".join(MODES)))
+    SETTINGS["mode"] = mode
+    if archive:
+        SETTINGS["archive"] = archive
+
+
+def get(url, stream=False):
+    """ Return the requests.Response of a GET request to url."""
+    mode = SETTINGS["mode"]
+    metrics.count("network_requests", mode=mode)
+    with metrics.timer("network", mode=mode):
+        if mode == "replay":
+            return replay(url)
+        if mode == "record":
+            req = SESSION.get(url)
+            record(url, req)
+            return req
+        return SESSION.get(url, stream=stream)
+
+
+def _paths(url):
+    key = hashlib.sha1(url.encode()).hexdigest()
+    archive = SETTINGS["archive"]
+    return os.path.join(archive, key + ".json"), os.path.join(archive, key + ".body")
+
+
+def record(url, req):
+    """ Store a response in the archive."""
+    meta_path, body_path = _paths(url)
+    os.makedirs(SETTINGS["archive"], exist_ok=True)
+    with open(body_path, "wb") as f:
+        f.write(req.content)
+    with open(meta_path, "w") as f:
+        json.dump(
+            {"url": url, "status_code": req.status_code, "encoding": req.encoding}, f
+        )
+
+
+def replay(url):
+    """ Rebuild a recorded response from the archive."""
+    meta_path, body_path = _paths(url)
+    if not os.path.exists(meta_path):
+        raise ex.NotRecorded(url, SETTINGS["archive"])
+    with open(meta_path) as f:
+        meta = json.load(f)
+    req = requests.Response()
+    with open(body_path, "rb") as f:
+        req._content = f.read()
+    req._content_consumed = True
+    req.status_code = meta["status_code"]
+    req.encoding = meta["encoding"]
+    req.url = url
+    return req
@@ -0,0 +1,201 @@
+import argparse
+import logging
+import multiprocessing
+
+import pandas as pd
+
+import GeneaPy.modules.custom_exceptions as ex
+from GeneaPy.modules.dedup import parse_ranges
+from GeneaPy.modules.liftover import strip_chr
+from GeneaPy.modules.seed_index import SEED_LENGTH, SeedIndex
+
+logging.basicConfig(
+    filename="off_target.error.log", format="%(asctime)s:%(levelname)s:%(message)s"
+)
+
+HEADER = [
+    "Primer",
+    "Orientation",
+    "Chrom",
+    "Position",
+    "Strand",
+    "Mismatches",
+    "Score",
+    "On_Target",
+]
+
+# seed index opened once per worker process
+INDEX = None
+
+
+def off_target(
+    index,
+    database=None,
+    primers=None,
+    genome=None,
+    kmer=SEED_LENGTH,
+    mismatches=3,
+    workers=1,
+    output=None,
+):
+    """ Find every near-match binding site of the given primer pairs.
+
+    Args:
+        index: directory of the k-mer seed index
+        database: a primer database (tsv format)
+        primers: a forward and reverse primer pair
+        genome: FASTA genome to build the index from if it does not exist
+        kmer: seed length used when building the index
+        mismatches: maximum mismatches allowed at a binding site
+        workers: number of processes screening the primer pairs
+        output: output file name
+
+    Returns:
+        a DataFrame containing the binding sites of each primer
+
+    Notes:
+        the Score column sums the mismatches at a site, weighting those
+        near the primers 3' end higher. On_Target is True for sites lying
+        within the primer pairs Primer_Range in the database.
+
+        Raises SeedTooLong if any primer is shorter than the seeds of the
+        index, and RepetitiveSeed if a seed has too many hits to check,
+        rather than missing sites.
+    """
+    if database:
+        columns = ["Primer", "F_Primer", "R_Primer", "Primer_Range"]
+        db = pd.read_csv(database, delimiter="\t", usecols=columns, dtype=str)
+        chrom, start, end = parse_ranges(db.Primer_Range.values)
+        pairs = list(zip(db.Primer, db.F_Primer, db.R_Primer, chrom, start, end))
+    else:
+        pairs = [("query", primers[0], primers[1], None, None, None)]
+    shortest = min((p for pair in pairs for p in pair[1:3]), key=len)
+    open_index(index, genome, kmer)
+    k = SeedIndex(index).k
+    if len(shortest) < k:
+        raise ex.SeedTooLong(shortest, k)
+    jobs = [pair + (mismatches,) for pair in pairs]
+
+    if workers > 1:
+        pool = multiprocessing.Pool(workers, initializer=init_worker, initargs=(index,))
+        try:
+            results = pool.map(screen_pair, jobs, chunksize=max(1, len(jobs) // (workers * 4)))
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        init_worker(index)
+        results = [screen_pair(job) for job in jobs]
+
+    sites = pd.DataFrame([row for rows in results for row in rows], columns=HEADER)
+    if output:
+        sites.to_csv(output, sep="\t", index=False)
+    return sites
+
+
+def open_index(index, genome=None, kmer=SEED_LENGTH):
+    """ Build the seed index from genome unless it already exists."""
+    if SeedIndex.exists(index):
+        return
+    if not genome:
+        raise ex.NoSeedIndex(index)
+    logging.info("Building seed index of {} in {}".format(genome, index))
+    SeedIndex.build(genome, index, kmer)
+
+
+def init_worker(index):
+    global INDEX
+    INDEX = SeedIndex(index)
+
+
+def screen_pair(job):
+    """ Return the binding sites of both primers in a pair."""
+    name, f_primer, r_primer, chrom, start, end, mismatches = job
+    rows = []
+    for orientation, primer in (("F", f_primer), ("R", r_primer)):
+        for contig, position, strand, n, score in INDEX.find_sites(primer, mismatches):
+            contig = strip_chr(contig)
+            on_target = (
+                chrom is not None
+                and contig == strip_chr(chrom)
+                and start <= position
+                and position + len(primer) - 1 <= end
+            )
+            rows.append(
+                (name, orientation, contig, position, strand, n, score, on_target)
+            )
+    return rows
+
+
+def risky_pairs(sites):
+    """ Count the off-target binding sites of each primer pair."""
+    off = sites[~sites["On_Target"]]
+    counts = off.groupby(["Primer", "Orientation"]).size().unstack(fill_value=0)
+    counts = counts.reindex(columns=["F", "R"], fill_value=0)
+    return counts[counts.sum(axis=1) > 0]
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        description="Find off-target binding sites of primer pairs in a genome."
+    )
+    parser.add_argument(
+        "-x", "--index", type=str, required=True, help="k-mer seed index directory"
+    )
+    parser.add_argument(
+        "-g", "--genome", type=str, help="FASTA genome to build the index from"
+    )
+    parser.add_argument("-d", "--database", type=str, help="primer database")
+    parser.add_argument("-p", "--primers", nargs=2, type=str, help="primer pair")
+    parser.add_argument(
+        "-k",
+        "--kmer",
+        type=int,
+        help="seed length of a new index, between 4 and 13 (default=10)",
+        default=SEED_LENGTH,
+    )
+    parser.add_argument(
+        "-m",
+        "--mismatches",
+        type=int,
+        help="maximum mismatches at a binding site (default=3)",
+        default=3,
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        help="number of processes screening primer pairs (default=1)",
+        default=1,
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        help="output the binding sites to file name",
+        default="output_off_target.txt",
+    )
+    return parser
+
+
+def cli():
+    parser = get_parser()
+    args = vars(parser.parse_args())
+    sites = off_target(
+        index=args["index"],
+        database=args["database"],
+        primers=args["primers"],
+        genome=args["genome"],
+        kmer=args["kmer"],
+        mismatches=args["mismatches"],
+        workers=args["workers"],
+        output=args["output"],
+    )
+    if args["database"]:
+        print(risky_pairs(sites).to_string())
+    else:
+        print(sites.to_string(index=False))
+
+
+if __name__ == "__main__":
+    cli()
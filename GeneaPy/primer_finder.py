@@ -1,16 +1,38 @@
 import argparse
 import logging
+import multiprocessing
+import os
+import sys
+import tempfile
 import warnings
 
+import numpy as np
 import pandas as pd
 
 import GeneaPy.modules.custom_exceptions as ex
+from GeneaPy.modules import compact as compact_db
+from GeneaPy.modules import db_cache, metrics
 from GeneaPy.modules.common import correct_hg_version
+from GeneaPy.modules.interval_index import AmpliconIndex
+from GeneaPy.modules.liftover import ChainFile, parse_contigs
+from GeneaPy.modules.set_cover import greedy_set_cover
 
 logging.basicConfig(
     filename="primer_finder.error.log", format="%(asctime)s:%(levelname)s:%(message)s"
 )
 
+# bumped whenever parse_database changes so stale caches are rebuilt
+DATABASE_FORMAT = 3
+# exon/intron numbers split out of the Exon and Intron columns at load time
+FILTER_COLUMNS = ["Exon_No", "Exon_Total", "Intron_No", "Intron_Total"]
+CATEGORICAL_COLUMNS = ["Gene", "Genome", "Transcript"]
+# all the worker processes of sharded_variant_file_primers need to match on
+POSITION_COLUMNS = ["Chrom", "Start", "End"]
+
+# primer database and per chromosome indexes opened once per worker process
+DATABASE = None
+SHARDS = {}
+
 
 def primer_finder(
     db,
@@ -24,6 +46,13 @@ def primer_finder(
     exon=None,
     intron=None,
     output=None,
+    cache=True,
+    workers=1,
+    best=None,
+    lift_to=None,
+    chain=None,
+    compact=False,
+    lift_from=None,
 ):
     """ Find primers which fulfill the parsed conditions.
 
@@ -38,6 +67,16 @@ def primer_finder(
         exon: exon number to filter for
         intron: intron number to filter for
         ouput: output file name
+        cache: load the database from its pre-parsed sidecar cache
+        workers: number of processes matching the variants of input_file,
+                 each given the variants of one chromosome at a time
+        best: only keep the best scoring number of primers for each variant
+        lift_to: genome version to convert the primers of lift_from to, so
+                 variants of one version match them all
+        chain: UCSC chain file converting to lift_to, required with lift_to
+        compact: hold the database with packed sequences and downcast dtypes
+        lift_from: genome version the chain converts from, by default read
+                   from a UCSC chain file name such as hg19ToHg38.over.chain
 
     Returns:
         a DataFrame containing primer pairs which passed
@@ -51,34 +90,254 @@ def primer_finder(
     # Only way to get rid of the SettingWithCopyWarning
     warnings.filterwarnings("ignore")
     hg = correct_hg_version(hg) if hg else None
-    db_df = database2df(db)
-    primers = filter_for_variants(db_df, input_file, variant)
+    db_df = database2df(db, cache, compact)
+    if lift_to:
+        db_df = lift_database(db_df, ChainFile(chain), lift_to, lift_from)
+    if input_file and workers > 1:
+        var_df = input2df(input_file)
+        primers = sharded_variant_file_primers(
+            db, db_df, var_df, workers, cache, lifted=bool(lift_to)
+        )
+        report_unmatched_variants(var_df, primers)
+    else:
+        primers = filter_for_variants(db_df, input_file, variant)
     primers = extra_filters(primers, size, distance, gc, gene, exon, intron, hg)
+    if best and primers is not None:
+        primers = best_primers(primers, best)
+    if compact and primers is not None:
+        primers = compact_db.expand_database(primers)
     if output:
-        primers.to_csv(output, sep="\t", index=False)
+        with metrics.timer("write"):
+            primers.to_csv(output, sep="\t", index=False)
     return primers
 
 
-def database2df(db):
-    """ Transform primer database to a DataFrame."""
-    db = pd.read_csv(db, delimiter="\t")
+def stream_primer_finder(
+    db,
+    input_file,
+    output,
+    chunk_size=100000,
+    size=None,
+    distance=None,
+    gc=None,
+    hg=None,
+    gene=None,
+    exon=None,
+    intron=None,
+    cache=True,
+    best=None,
+    compact=False,
+):
+    """ Find primers for a variant file too large to hold in memory.
+
+    Variants are read chunk_size rows at a time, matched against the
+    indexed database and the passing primers appended to output, so only
+    one chunk of variants and its matches are held at once.
+
+    Args:
+        db: a primer database (tsv format)
+        input_file: variants to find primers for (tsv format)
+        output: output file name
+        chunk_size: number of variants read at a time
+        the remaining arguments filter the primers as in primer_finder
+
+    Returns:
+        dict counting the variants read, the primers written and the
+        variants without any matching primer
+    """
+    warnings.filterwarnings("ignore")
+    hg = correct_hg_version(hg) if hg else None
+    db_df = database2df(db, cache, compact)
+    index = index_database(db_df)
+    counts = {"variants": 0, "primers": 0, "unmatched": 0}
+    chunks = pd.read_csv(input_file, delimiter="\t", header=None, chunksize=chunk_size)
+    with open(output, "w") as out:
+        for number, chunk in enumerate(chunks):
+            var_df = variants2df(chunk)
+            primers = get_variant_file_primers(db_df, var_df, index)
+            counts["unmatched"] += report_unmatched_variants(var_df, primers)
+            primers = apply_filters(primers, size, distance, gc, gene, exon, intron, hg)
+            if best:
+                primers = best_primers(primers, best)
+            if compact:
+                primers = compact_db.expand_database(primers)
+            with metrics.timer("write"):
+                primers.to_csv(out, sep="\t", index=False, header=number == 0)
+            counts["variants"] += len(var_df)
+            counts["primers"] += len(primers)
+    if not counts["primers"]:
+        logging.error("No primers found for the specific filter arguments parsed")
+    return counts
+
+
+def plan_primers(
+    db,
+    input_file,
+    size=None,
+    distance=None,
+    gc=None,
+    hg=None,
+    gene=None,
+    exon=None,
+    intron=None,
+    output=None,
+    cache=True,
+):
+    """ Find a small set of primer pairs which together cover every variant.
+
+    Every primer pair passing the filters is treated as the set of variants
+    it covers, and pairs are chosen greedily by the number of variants
+    they cover which are not yet covered.
+
+    Args:
+        db: a primer database (tsv format)
+        input_file: variants to find primers for (tsv format)
+        output: output file name
+        the remaining arguments filter the primers as in primer_finder
+
+    Returns:
+        tuple of a DataFrame of the chosen primer pairs, in the order they
+        were chosen, with the variants each newly covers, and a list of the
+        variants no primer pair passing the filters covers
+    """
+    warnings.filterwarnings("ignore")
+    hg = correct_hg_version(hg) if hg else None
+    db_df = database2df(db, cache)
+    var_df = input2df(input_file)
+    var_rows, db_rows = index_database(db_df).overlaps(var_df["Chrom"], var_df["Pos"])
+    matches = join_matches(db_df, var_df, var_rows, db_rows)
+    passed = apply_filters(matches, size, distance, gc, gene, exon, intron, hg).index
+    chosen = greedy_set_cover(var_rows[passed], db_rows[passed])
+
+    plan = db_df.iloc[[row for row, _ in chosen]].drop(FILTER_COLUMNS, axis=1)
+    names = var_df["Variant"].astype(str).values
+    plan["Variants"] = [",".join(names[np.sort(covered)]) for _, covered in chosen]
+    plan = plan.reset_index(drop=True)
+    covered = np.concatenate([c for _, c in chosen] + [np.zeros(0, dtype=np.int64)])
+    uncovered = np.setdiff1d(np.arange(len(var_df)), covered)
+    uncovered = var_df["Variant"].iloc[uncovered].tolist()
+    for variant in uncovered:
+        logging.info("No primer pair passing the filters covers {}".format(variant))
+    if output:
+        plan.to_csv(output, sep="\t", index=False)
+    return plan, uncovered
+
+
+def database2df(db, cache=True, compact=False):
+    """ Transform primer database to a DataFrame.
+
+    Notes:
+        with cache the parsed DataFrame is stored in a sidecar directory
+        next to the database and only re-parsed when the database changes.
+        With compact the primer sequences are packed, so must be unpacked
+        with compact.expand_database before output, and the memory used
+        before and after compacting is reported on stderr.
+    """
+    with metrics.timer("database_load"):
+        if cache:
+            df = restore_contigs(db_cache.load(db, parse_database, DATABASE_FORMAT))
+        elif compact:
+            # read the text columns compact_database would convert as
+            # categoricals, so the full object columns are never held
+            df = parse_database(db, compact_db.CATEGORICAL_COLUMNS)
+        else:
+            df = parse_database(db)
+    if compact:
+        before = compact_db.memory_usage(df)
+        df = compact_db.compact_database(df)
+        after = compact_db.memory_usage(df)
+        print(
+            "Primer database memory: {}".format(compact_db.format_memory(before, after)),
+            file=sys.stderr,
+        )
+    return df
+
+
+def parse_database(db, categories=None):
+    """ Parse the primer database tsv into a DataFrame, reading the
+        categories columns (default=CATEGORICAL_COLUMNS) as categoricals.
+    """
+    categories = categories or CATEGORICAL_COLUMNS
+    db = pd.read_csv(db, delimiter="\t", dtype={c: "category" for c in categories})
     db["Chrom"], db["Start"], db["End"] = db.Primer_Range.str.split("[-:]").str
-    db["Chrom"] = db.Chrom.str.replace("chr", "")
+    db["Chrom"] = parse_contigs(db["Chrom"])
     db = db.drop("Primer_Range", axis=1)
     db["Product_Size"] = db["Product_Size"].str.replace("bp", "")
-    nums = ["Chrom", "Start", "End", "Product_Size", "GC%"]
+    nums = ["Start", "End", "Product_Size", "GC%"]
     db = convert2numeric(db, nums)
+    return split_filter_columns(db)
+
+
+def restore_contigs(db):
+    """ Parse the Chrom column of a cached database, which stores it as
+        text unless every contig is numeric.
+    """
+    if not pd.api.types.is_numeric_dtype(db["Chrom"]):
+        db["Chrom"] = parse_contigs(db["Chrom"])
+    return db
+
+
+def lift_database(db, chain, lift_to, lift_from=None):
+    """ Convert the amplicon ranges of primers in the lift_from genome
+        version, by default the chain's source version, with a ChainFile.
+        Primers which cannot be converted, or are in neither version, are
+        dropped.
+    """
+    lift_to = correct_hg_version(lift_to)
+    lift_from = lift_from or chain.source
+    if not lift_from:
+        raise ex.UnknownChainBuild(chain.path)
+    lift_from = correct_hg_version(lift_from)
+    genome = db["Genome"].astype(object).values
+    other = genome == lift_from
+    unknown = np.flatnonzero((genome != lift_to) & ~other)
+    for primer in db["Primer"].values[unknown]:
+        logging.info("Cannot lift {} from {} to {}".format(primer, lift_from, lift_to))
+    if len(unknown):
+        db = db.drop(db.index[unknown])
+        other = np.delete(other, unknown)
+    if not other.any():
+        return db
+    chrom, start, end = chain.lift_ranges(
+        db["Chrom"].values[other], db["Start"].values[other], db["End"].values[other]
+    )
+    db = db.copy()
+    chroms = db["Chrom"].values.astype(object)
+    chroms[other] = chrom
+    db["Chrom"] = chroms
+    db.loc[other, "Start"] = start
+    db.loc[other, "End"] = end
+    genome = db["Genome"].astype(object)
+    genome[other] = lift_to
+    db["Genome"] = genome.astype("category")
+    failed = np.flatnonzero(other)[np.isnan(start)]
+    for primer in db["Primer"].values[failed]:
+        logging.info("Cannot lift {} over to {}".format(primer, lift_to))
+    db = db.drop(db.index[failed])
+    db[["Start", "End"]] = db[["Start", "End"]].astype(np.int64)
+    db["Chrom"] = parse_contigs(db["Chrom"])
     return db
 
 
-def filter_for_variants(db, input_file, variant):
+def split_filter_columns(db):
+    """ Add the exon/intron number and total of each primer as integer
+        columns, 0 where the amplicon is not within an exon/intron.
+    """
+    for c in ["Exon", "Intron"]:
+        numbers = db[c].astype(str).str.extract(r"^(\d+)/(\d+)$")
+        numbers = numbers.apply(pd.to_numeric).fillna(0).astype(np.int64)
+        db[c + "_No"], db[c + "_Total"] = numbers[0], numbers[1]
+    return db
+
+
+def filter_for_variants(db, input_file, variant, index=None):
     """ Filter primer database for given variants"""
     if input_file:
         var_df = input2df(input_file)
-        primers = get_variant_file_primers(db, var_df)
+        primers = get_variant_file_primers(db, var_df, index)
         report_unmatched_variants(var_df, primers)
     elif variant:
-        primers = get_variant_primers(db, variant)
+        primers = get_variant_primers(db, variant, index)
     else:
         primers = db
     return primers
@@ -87,11 +346,16 @@ def filter_for_variants(db, input_file, variant):
 def input2df(input_file):
     """ Transform input file to a DataFrame."""
     df = pd.read_csv(input_file, delimiter="\t", header=None)
+    return variants2df(df)
+
+
+def variants2df(df):
+    """ Split the positions of a variant name/position DataFrame into Chrom and Pos."""
     df.columns = ["Variant", "Variant_Position"]
     df["Chrom"], df["Pos"] = df["Variant_Position"].str.split(":").str
     df = df.drop("Variant_Position", axis=1)
-
-    df = convert2numeric(df, ["Chrom", "Pos"])
+    df["Chrom"] = parse_contigs(df["Chrom"])
+    df = convert2numeric(df, ["Pos"])
     return df
 
 
@@ -103,19 +367,116 @@ def convert2numeric(df, cols):
     return df
 
 
-def get_variant_file_primers(db, var_file):
+def index_database(db):
+    """ Index the primer database amplicons by position."""
+    return AmpliconIndex(db["Chrom"], db["Start"], db["End"])
+
+
+@metrics.timed("variant_match")
+def get_variant_file_primers(db, var_file, index=None):
     """ Returns a DataFrame of variants and their matching primers."""
-    m = pd.merge(var_file, db)
-    within_primers = (m["Start"] < m["Pos"]) & (m["Pos"] < m["End"])
-    output = m[within_primers]
+    if index is None:
+        index = index_database(db)
+    var_rows, db_rows = index.overlaps(var_file["Chrom"], var_file["Pos"])
+    return join_matches(db, var_file, var_rows, db_rows)
+
+
+def join_matches(db, var_file, var_rows, db_rows):
+    """ Join each variant row to the database row of its matching primer."""
+    variants = var_file.iloc[var_rows].reset_index(drop=True)
+    primers = db.drop("Chrom", axis=1).iloc[db_rows].reset_index(drop=True)
+    output = pd.concat([variants, primers], axis=1)
     output["Dist_F"] = output["Pos"] - output["Start"]
     output["Dist_R"] = output["End"] - output["Pos"]
     output = output.drop(["Start", "End"], axis=1)
     return output
 
 
+@metrics.timed("variant_match")
+def sharded_variant_file_primers(db, db_df, var_file, workers, cache=True, lifted=False):
+    """ Match the variants of each chromosome in a separate process.
+
+    The workers only memory-map the Chrom, Start and End columns of the
+    database cache, so only the variant positions and the matching row
+    numbers are passed between processes and the primers of the matches
+    are taken from db_df. When db_df has been lifted over, as the cache
+    holds the unlifted positions, its positions are saved to a temporary
+    file for the workers to memory-map instead. The matches are sorted into the same order as get_variant_file_primers
+    before being joined.
+    """
+    var_file = var_file.reset_index(drop=True)
+    shards = [
+        (chrom, shard["Chrom"].values, shard["Pos"].values, shard.index.values)
+        for chrom, shard in var_file.groupby("Chrom", sort=False, dropna=False)
+    ]
+    with tempfile.TemporaryDirectory() as tmp:
+        positions = save_positions(db_df, tmp) if lifted else None
+        pool = multiprocessing.Pool(
+            workers, initializer=init_worker, initargs=(db, cache, positions)
+        )
+        try:
+            results = pool.map(match_shard, shards)
+        finally:
+            pool.close()
+            pool.join()
+    var_rows = np.concatenate([r[0] for r in results] + [np.zeros(0, dtype=np.int64)])
+    db_rows = np.concatenate([r[1] for r in results] + [np.zeros(0, dtype=np.int64)])
+    order = np.lexsort((db_rows, var_rows))
+    return join_matches(db_df, var_file, var_rows[order], db_rows[order])
+
+
+def save_positions(db, directory):
+    """ Save the contig codes, starts and ends of a database DataFrame to
+        positions.npy in directory, returning its path and the contig of
+        each code for load_positions.
+    """
+    codes, contigs = pd.factorize(db["Chrom"])
+    path = os.path.join(directory, "positions.npy")
+    np.save(path, np.vstack([codes, db["Start"].values, db["End"].values]).astype(np.int64))
+    return path, list(contigs)
+
+
+def load_positions(path, contigs):
+    """ Memory-map the positions saved by save_positions as a DataFrame of
+        the POSITION_COLUMNS, with the contigs as a categorical.
+    """
+    positions = np.load(path, mmap_mode="r")
+    chrom = pd.Categorical.from_codes(positions[0], contigs)
+    return pd.DataFrame(
+        {"Chrom": chrom, "Start": positions[1], "End": positions[2]}, copy=False
+    )
+
+
+def init_worker(db, cache=True, positions=None):
+    global DATABASE
+    if positions is not None:
+        DATABASE = load_positions(*positions)
+    elif cache:
+        DATABASE = restore_contigs(
+            db_cache.load(db, parse_database, DATABASE_FORMAT, POSITION_COLUMNS)
+        )
+    else:
+        DATABASE = parse_database(db)[POSITION_COLUMNS]
+    SHARDS.clear()
+
+
+def match_shard(shard):
+    """ Return the variant and database row numbers of each match
+        between the variants of one chromosome and its primers.
+    """
+    chrom, chroms, positions, var_rows = shard
+    key = "NA" if pd.isnull(chrom) else chrom
+    if key not in SHARDS:
+        on_chrom = DATABASE["Chrom"].isnull() if key == "NA" else DATABASE["Chrom"] == chrom
+        rows = np.flatnonzero(on_chrom.values)
+        SHARDS[key] = rows, index_database(DATABASE.iloc[rows])
+    rows, index = SHARDS[key]
+    query, matched = index.overlaps(chroms, positions)
+    return var_rows[query], rows[matched]
+
+
 def report_unmatched_variants(before, after):
-    """ Report variants which have no primer match"""
+    """ Report variants which have no primer match and return their number."""
     try:
         no_match = before[~before["Variant"].isin(after["Variant"])]["Variant"].tolist()
         if no_match:
@@ -123,49 +484,148 @@ def report_unmatched_variants(before, after):
     except ex.UnmatchedVariants as e:
         for unmatched in e.unmatched:
             logging.info("Cannot find primer for {}".format(unmatched))
+        return len(e.unmatched)
+    return 0
 
 
-def get_variant_primers(db, var):
+@metrics.timed("variant_match")
+def get_variant_primers(db, var, index=None):
     """ Returns a DataFrame of primers matching a given variant """
     chrom, pos = var.replace("chr", "").split(":")
-    within_primers = (db["Start"] < int(pos)) & (int(pos) < db["End"])
-    output = db[within_primers]
+    chrom = pd.to_numeric(chrom, errors="coerce")
+    if index is None:
+        index = index_database(db)
+    var_rows, db_rows = index.overlaps([chrom], [int(pos)])
+    output = db.iloc[db_rows]
     output["Dist_F"] = int(pos) - output["Start"]
     output["Dist_R"] = output["End"] - int(pos)
     return output
 
 
 def extra_filters(primer, size, distance, gc, gene, exon, intron, hg):
-    """ Filter primers on given argument values."""
+    """ Filter primers on given argument values.
+
+    Notes:
+        the filters are combined into one boolean mask, testing the most
+        selective filter first so each later filter only checks the rows
+        which passed the previous ones.
+    """
     try:
-        if size:
-            primer = primer[primer.Product_Size < size]
-        if distance:
-            primer = primer[((primer.Dist_F > distance) & (primer.Dist_R > distance))]
-        if gc:
-            primer = primer[primer["GC%"] < gc]
-        if gene:
-            primer = primer[primer["Gene"] == gene]
-        if exon:
-            exon_prep = primer[primer["Exon"] != "-"]
-            primer["exon_no"], exon_total = exon_prep.Exon.str.split("/").str
-            primer = primer[(primer.exon_no == str(exon))]
-            primer = primer.drop("exon_no", axis=1)
-        if intron:
-            intron_prep = primer[primer["Intron"] != "-"]
-            primer["intron_no"], intron_total = intron_prep.Intron.str.split("/").str
-            primer = primer[(primer.intron_no == str(intron))]
-            primer = primer.drop("intron_no", axis=1)
-        if hg:
-            primer = primer[primer["Genome"] == hg]
+        primer = apply_filters(primer, size, distance, gc, gene, exon, intron, hg)
         if primer.empty:
             raise ex.EmptyDataFrame()
         return primer
 
-    except (ValueError, ex.EmptyDataFrame):
+    except (ValueError, ex.EmptyDataFrame) as e:
+        metrics.count_exception(e)
         logging.error("No primers found for the specific filter arguments parsed")
 
 
+@metrics.timed("filtering")
+def apply_filters(primer, size, distance, gc, gene, exon, intron, hg):
+    """ Return the primers passing the filters, which may be none."""
+    if (exon or intron) and "Exon_No" not in primer:
+        primer = split_filter_columns(primer.copy())
+    tests = filter_tests(primer, size, distance, gc, gene, exon, intron, hg)
+    primer = primer[combined_mask(len(primer), tests)]
+    return primer.drop(FILTER_COLUMNS, axis=1, errors="ignore")
+
+
+def filter_tests(primer, size, distance, gc, gene, exon, intron, hg):
+    """ Return a function for each given filter which takes an array of
+        row numbers and returns whether each row passes the filter.
+    """
+    tests = []
+    if size:
+        product_size = primer["Product_Size"].values
+        tests.append(lambda rows: product_size[rows] < size)
+    if distance:
+        dist_f, dist_r = primer.Dist_F.values, primer.Dist_R.values
+        tests.append(
+            lambda rows: (dist_f[rows] > distance) & (dist_r[rows] > distance)
+        )
+    if gc:
+        gc_content = primer["GC%"].values
+        tests.append(lambda rows: gc_content[rows] < gc)
+    if gene:
+        genes = primer["Gene"].values
+        tests.append(lambda rows: np.asarray(genes[rows] == gene))
+    if exon:
+        exon_no, exon = primer["Exon_No"].values, int(exon)
+        tests.append(lambda rows: exon_no[rows] == exon)
+    if intron:
+        intron_no, intron = primer["Intron_No"].values, int(intron)
+        tests.append(lambda rows: intron_no[rows] == intron)
+    if hg:
+        genomes = primer["Genome"].values
+        tests.append(lambda rows: np.asarray(genomes[rows] == hg))
+    return tests
+
+
+def combined_mask(length, tests, sample_size=1000):
+    """ Combine the row tests into a single boolean mask, ordering them by
+        the fraction of an evenly spaced sample of rows they pass.
+    """
+    rows = np.arange(length)
+    sample = rows[:: max(1, length // sample_size)]
+    if len(sample):
+        tests = sorted(tests, key=lambda test: test(sample).mean())
+    for test in tests:
+        rows = rows[test(rows)]
+    mask = np.zeros(length, dtype=bool)
+    mask[rows] = True
+    return mask
+
+
+def score_primers(primers):
+    """ Score each primer pair between 0 and 1, higher is better.
+
+    The score is the mean of:
+        how central the variant is within the amplicon, so it is far
+        from both primers (only when Dist_F and Dist_R are present)
+        how small the product is relative to the largest candidate of
+        the same variant, so adding other variants does not change it
+        how close the GC% is to 50%
+    """
+    size = primers["Product_Size"].values.astype(float)
+    if "Variant" in primers:
+        largest = primers.groupby("Variant", sort=False, dropna=False)["Product_Size"]
+        largest = largest.transform("max").values.astype(float)
+    else:
+        largest = np.full(len(size), size.max() if len(size) else 0)
+    scores = [
+        1 - size / np.maximum(largest, 1),
+        1 - np.abs(primers["GC%"].values - 50) / 50,
+    ]
+    if "Dist_F" in primers and "Dist_R" in primers:
+        closest = np.minimum(primers["Dist_F"].values, primers["Dist_R"].values)
+        scores.append(np.clip(closest / np.maximum(size / 2, 1), 0, 1))
+    return np.mean(scores, axis=0)
+
+
+def best_primers(primers, k):
+    """ Keep the k highest scoring primer pairs of each variant.
+
+    Notes:
+        the rows are sorted once by variant and descending score and the
+        rank of each row within its variant computed from the position
+        its variant starts at, so no per variant loop is needed. The
+        result is ordered by variant and then by descending score.
+    """
+    scores = score_primers(primers)
+    if "Variant" in primers:
+        groups = pd.factorize(primers["Variant"])[0]
+    else:
+        groups = np.zeros(len(primers), dtype=np.int64)
+    order = np.lexsort((-scores, groups))
+    sorted_groups = groups[order]
+    rank = np.arange(len(order)) - np.searchsorted(sorted_groups, sorted_groups)
+    keep = order[rank < k]
+    primers = primers.iloc[keep]
+    primers["Score"] = np.round(scores[keep], 3)
+    return primers
+
+
 def get_parser():
     parser = argparse.ArgumentParser(
         description="Find primers for a set of given variants."
@@ -219,12 +679,136 @@ def get_parser():
         help="output the results of processing --input",
         default="output_primer_finder.txt",
     )
+    parser.add_argument(
+        "--lift_to",
+        type=str,
+        help="convert primers of other genome versions to this one with --chain",
+    )
+    parser.add_argument(
+        "--chain",
+        type=str,
+        help="UCSC chain file for --lift_to, e.g. hg19ToHg38.over.chain.gz",
+    )
+    parser.add_argument(
+        "--lift_from",
+        type=str,
+        help="genome version --chain converts from, if not named in the file "
+        "name; primers of other versions than this and --lift_to are dropped",
+    )
+    parser.add_argument(
+        "--plan",
+        action="store_true",
+        help="choose a small set of primer pairs covering every --input variant",
+    )
+    parser.add_argument(
+        "--best",
+        type=int,
+        help="only the best scoring number of primer pairs for each variant",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="processes matching --input, sharded by chromosome (default=1)",
+        default=1,
+    )
+    parser.add_argument(
+        "--chunk_size",
+        type=int,
+        help="stream --input this many variants at a time, appending the "
+        "results to --output instead of holding them in memory",
+    )
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="keep the database in memory and answer JSON queries over HTTP",
+    )
+    parser.add_argument(
+        "--host",
+        type=str,
+        help="address to serve on (default=127.0.0.1)",
+        default="127.0.0.1",
+    )
+    parser.add_argument(
+        "--port", type=int, help="port to serve on (default=8080)", default=8080
+    )
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="hold the database with packed sequences and downcast dtypes, "
+        "reporting the memory saved",
+    )
+    parser.add_argument(
+        "--no_cache",
+        action="store_true",
+        help="parse the database without using or writing its .npcache sidecar",
+    )
+    parser.add_argument(
+        "--metrics",
+        type=str,
+        help="write stage timings and counters to this file at the end of the run, "
+        "as JSON if it ends in .json and Prometheus text otherwise",
+    )
     return parser
 
 
 def cli():
     parser = get_parser()
     args = vars(parser.parse_args())
+    if args["lift_to"] and not args["chain"]:
+        parser.error("--lift_to requires --chain")
+    run(args)
+    if args["metrics"]:
+        metrics.write(args["metrics"])
+
+
+def run(args):
+    """ Run the mode chosen by the command line arguments."""
+    if args["serve"]:
+        # imported here as the server module itself uses primer_finder
+        from GeneaPy.modules.primer_server import serve
+
+        serve(args["database"], args["host"], args["port"], not args["no_cache"])
+        return
+    if args["input"] and args["plan"]:
+        plan, uncovered = plan_primers(
+            db=args["database"],
+            input_file=args["input"],
+            size=args["size"],
+            distance=args["distance"],
+            gc=args["gc"],
+            hg=args["genome_version"],
+            gene=args["gene"],
+            exon=args["exon"],
+            intron=args["intron"],
+            output=args["output"],
+            cache=not args["no_cache"],
+        )
+        print(plan.to_string(index=False))
+        if uncovered:
+            print("Uncovered variants: {}".format(", ".join(map(str, uncovered))))
+        return
+    if args["input"] and args["chunk_size"]:
+        counts = stream_primer_finder(
+            db=args["database"],
+            input_file=args["input"],
+            output=args["output"],
+            chunk_size=args["chunk_size"],
+            size=args["size"],
+            distance=args["distance"],
+            gc=args["gc"],
+            hg=args["genome_version"],
+            gene=args["gene"],
+            exon=args["exon"],
+            intron=args["intron"],
+            cache=not args["no_cache"],
+            best=args["best"],
+            compact=args["compact"],
+        )
+        print(
+            "{variants} variants, {primers} primers written to {output}, "
+            "{unmatched} variants unmatched".format(output=args["output"], **counts)
+        )
+        return
     primers = primer_finder(
         db=args["database"],
         variant=args["variant"],
@@ -237,6 +821,13 @@ def cli():
         exon=args["exon"],
         intron=args["intron"],
         output=args["output"],
+        cache=not args["no_cache"],
+        workers=args["workers"],
+        best=args["best"],
+        lift_to=args["lift_to"],
+        chain=args["chain"],
+        compact=args["compact"],
+        lift_from=args["lift_from"],
     )
     print(primers.to_string(index=False))
 
@@ -0,0 +1,123 @@
+import argparse
+import logging
+
+import numpy as np
+import pandas as pd
+
+from GeneaPy.modules import metrics
+from GeneaPy.modules.common import correct_hg_version
+from GeneaPy.modules.dedup import parse_ranges
+from GeneaPy.modules.metadata import open_annotation
+
+logging.basicConfig(
+    filename="reannotate_database.error.log",
+    format="%(asctime)s:%(levelname)s:%(message)s",
+)
+
+ANNOTATION_COLUMNS = ["Gene", "Transcript", "Exon", "Intron"]
+
+
+def reannotate_database(db, annotation, hg_version):
+    """ Annotate the amplicon midpoints of a primer database against an
+        annotation index, as unknown_primer annotates a new primer pair.
+
+    Only the Gene, Transcript, Exon and Intron columns of the primers of
+    hg_version are rewritten, to "-" where no gene or transcript overlaps
+    the midpoint. The midpoints of each contig are annotated in one sorted
+    overlap join, see AnnotationIndex.canonical_features.
+
+    Args:
+        db: primer database DataFrame with the Primer_Range column
+        annotation: annotation index directory (or AnnotationIndex)
+        hg_version: genome version of the annotation index
+
+    Returns:
+        tuple of the re-annotated database, the rows that were re-annotated
+        and the rows whose annotation changed
+    """
+    index = open_annotation(annotation)
+    hg_version = correct_hg_version(hg_version)
+    chrom, start, end = parse_ranges(db["Primer_Range"].values)
+    genome = db["Genome"].astype(object).map(correct_hg_version).values
+    rows = np.flatnonzero((genome == hg_version) & ~np.isnan(start))
+    old = db[ANNOTATION_COLUMNS].values.astype(object)
+    new = old.copy()
+    new[rows] = "-"
+    for contig, contig_rows in pd.Series(rows).groupby(chrom[rows]):
+        contig_rows = contig_rows.values
+        midpoints = ((start[contig_rows] + end[contig_rows]) // 2).astype(np.int64)
+        with metrics.timer("annotation_lookup"):
+            found = index.canonical_features(contig, midpoints)
+        hit = found["found"]
+        exon = found["exon"]
+        annotated = contig_rows[hit]
+        new[annotated, 0] = found["gene_name"][hit]
+        new[annotated, 1] = found["transcript_name"][hit]
+        new[annotated, 2] = np.where(exon[hit], found["number"][hit], "-")
+        new[annotated, 3] = np.where(exon[hit], "-", found["number"][hit])
+        for primer, midpoint in zip(db["Primer"].values[contig_rows[~hit]], midpoints[~hit]):
+            logging.info("No gene at {}:{} for {}".format(contig, midpoint, primer))
+    db = db.copy()
+    db[ANNOTATION_COLUMNS] = new
+    changed = np.flatnonzero((new != old).any(axis=1))
+    return db, rows, changed
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        description="Refresh the Gene, Transcript, Exon and Intron columns of a "
+        "primer database against an annotation index built by index_gtf, e.g. "
+        "of a new Ensembl release, without repeating the in-silico PCR of "
+        "each primer pair. The other columns are left untouched."
+    )
+    parser.add_argument(
+        "-d", "--database", type=str, required=True, help="primer database file"
+    )
+    parser.add_argument(
+        "-a",
+        "--annotation",
+        type=str,
+        required=True,
+        help="annotation index directory built by index_gtf",
+    )
+    parser.add_argument(
+        "-g",
+        "--genome_version",
+        type=str,
+        required=True,
+        help="genome version of the annotation index, only primers of this "
+        "version are re-annotated",
+    )
+    parser.add_argument(
+        "-o", "--output", type=str, required=True, help="re-annotated database file"
+    )
+    parser.add_argument(
+        "--metrics",
+        type=str,
+        help="write stage timings and counters to this file at the end of the run, "
+        "as JSON if it ends in .json and Prometheus text otherwise",
+    )
+    return parser
+
+
+def cli():
+    parser = get_parser()
+    args = vars(parser.parse_args())
+    with metrics.timer("database_load"):
+        db = pd.read_csv(args["database"], delimiter="\t", dtype=str, keep_default_na=False)
+    db, rows, changed = reannotate_database(db, args["annotation"], args["genome_version"])
+    with metrics.timer("write"):
+        db.to_csv(args["output"], sep="\t", index=False)
+    metrics.count("primers_reannotated", len(rows))
+    metrics.count("primers_changed", len(changed))
+    print(
+        "Re-annotated {} of {} primers against {}, {} changed".format(
+            len(rows), len(db), open_annotation(args["annotation"]).release, len(changed)
+        )
+    )
+    if args["metrics"]:
+        metrics.write(args["metrics"])
+
+
+if __name__ == "__main__":
+    cli()
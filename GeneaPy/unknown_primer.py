@@ -1,12 +1,11 @@
 import argparse
+import functools
 import logging
 import re
 
-import bs4
-import requests
-
 import GeneaPy.modules.custom_exceptions as ex
-from GeneaPy.modules import metadata
+from GeneaPy.modules import ispcr, metadata, metrics, primer_properties, ucsc
+from GeneaPy.modules.pipeline import Pipeline, Stage, format_stats
 from GeneaPy.modules.common import correct_hg_version
 
 logging.basicConfig(
@@ -14,8 +13,27 @@ logging.basicConfig(
 )
 
 
+PROPERTY_HEADER = (
+    "F_Tm",
+    "R_Tm",
+    "F_GC_Clamp",
+    "R_GC_Clamp",
+    "F_End_Stability",
+    "R_End_Stability",
+    "F_Self_Comp",
+    "R_Self_Comp",
+)
+
+
 def unknown_primer(
-    f_primer, r_primer, hg_version, primer_name, max_size, min_perfect, min_good
+    f_primer,
+    r_primer,
+    hg_version,
+    primer_name,
+    max_size,
+    min_perfect,
+    min_good,
+    properties=False,
 ):
     """ Use primer pairs to scrape in-silico PCR amplicon sequences
         from UCSC and gene/exon data from Ensembl.
@@ -28,18 +46,20 @@ def unknown_primer(
         max_size: maximum resulting amplicon size
         min_perfect: no. of bases that match exactly on 3' end of primers
         min_good: no. of bases on 3' end of primers where at least 2 out of 3 bases match 
+        properties: add the primers Tm, GC clamp, 3' end stability and self-complementarity
 
     Returns:
         The in-silico generated amplicons metadata.
     """
     hg_version = correct_hg_version(hg_version)
     check_input_errors(primer_name, f_primer, r_primer, hg_version)
-    data = scrape_seq(
+    amplicon = scrape_seq(
         primer_name, f_primer, r_primer, hg_version, max_size, min_perfect, min_good
     )
-    header, seq = seperate_data(data)
-    locus_metadata = get_metadata(header, seq, hg_version)
+    locus_metadata = get_metadata(amplicon.header, amplicon.seq, hg_version)
     all_data = (primer_name, f_primer, r_primer, hg_version) + locus_metadata
+    if properties:
+        all_data += get_primer_properties(f_primer, r_primer)
     return all_data
 
 
@@ -59,7 +79,24 @@ def scrape_seq(
 ):
     """ Use primer pairs to scrape in-silico PCR amplicon sequences
         from UCSC.
+
+    Returns:
+        Amplicon object of the single product generated by the primer pair
     """
+    req = fetch_ispcr(
+        f_primer, r_primer, hg_version, max_size, min_perfect, min_good, stream=True
+    )
+    # only the first <pre> element holds the products, stop reading after it
+    try:
+        return parse_ispcr(primer_name, req.iter_lines(decode_unicode=True))
+    finally:
+        req.close()
+
+
+def fetch_ispcr(
+    f_primer, r_primer, hg_version, max_size, min_perfect, min_good, stream=False
+):
+    """ Request the UCSC in-silico PCR results page for a primer pair."""
     url = (
         "https://genome.ucsc.edu/cgi-bin/hgPcr?hgsid=483"
         "751629_vuLjoO4UVF9h4vF4TEp9U8OQiFd7&"
@@ -68,31 +105,22 @@ def scrape_seq(
         "perfect={}&wp_good={}&boolshad.wp_flipReverse=0"
     )
     link = url.format(hg_version, f_primer, r_primer, max_size, min_perfect, min_good)
-    req = requests.get(link)
+    with metrics.timer("sequence_fetch", source="hgpcr"):
+        req = ucsc.get(link, stream=stream)
     req.raise_for_status()
-
-    entire_url = bs4.BeautifulSoup(req.text, "html.parser")
-    pre_elements = entire_url.select("pre")
-    if not pre_elements:
-        raise ex.NoAmplicon(primer_name)
-
-    html_to_text = pre_elements[0].getText()
-
-    product_number = html_to_text.count(">")
-    if product_number > 1:
-        raise ex.MultipleAmplicons(primer_name, product_number)
-
-    return html_to_text
+    return req
 
 
-def seperate_data(text):
-    """ From scrapped in-silico PCR amplicon information, 
-        seperate the amplicon sequence and its metadata.
-    """
-    split_text = list(filter(None, text.split("\n")))
-    seq = "".join(split_text[1:])
-    header = split_text[0]
-    return (header, seq)
+def parse_ispcr(primer_name, lines):
+    """ Parse the single amplicon from the lines of an in-silico PCR results page."""
+    with metrics.timer("html_parse"):
+        amplicons = ispcr.parse_amplicons(lines)
+    if not amplicons:
+        raise ex.NoAmplicon(primer_name)
+    if len(amplicons) > 1:
+        loci = [amplicon.locus for amplicon in amplicons]
+        raise ex.MultipleAmplicons(primer_name, len(amplicons), loci)
+    return amplicons[0]
 
 
 def get_metadata(header, seq, hg_version):
@@ -100,7 +128,7 @@ def get_metadata(header, seq, hg_version):
     """
     pos_range = header.split(" ")[0]
     pos_range = pos_range[1:].replace("+", "-")
-    gc = (seq.upper().count("C") + seq.upper().count("G")) / len(seq)
+    gc = float(primer_properties.gc_content([seq])[0])
     size = "{}bp".format(len(seq))
     # get gene metadata from the middle of the amplicon
     chrom, start, end = re.split(":|-", pos_range)
@@ -124,47 +152,106 @@ def get_metadata(header, seq, hg_version):
     return gene_metadata
 
 
+def get_primer_properties(f_primer, r_primer):
+    """ Calculate the properties of a primer pair in the order of PROPERTY_HEADER."""
+    props = primer_properties.primer_properties([f_primer, r_primer])
+    columns = ("Tm", "GC_Clamp", "End_Stability", "Self_Comp")
+    return tuple(value for name in columns for value in props[name].tolist())
+
+
 def parse2output(args, header):
     """ Write the results of parsing the input file
         contents through unknown_primer to an output 
         file.
+
+    Notes:
+        each primer pair is passed through fetch, parse, annotate and
+        write stages which run concurrently, each with their own worker
+        threads, and the pairs are written in input file order.
+
+    Returns:
+        list of dicts holding the throughput and queue depth of each stage
     """
     with open(args["output"], "w") as out:
         out.write(header + "\n")
+        pipeline = Pipeline(
+            [
+                Stage(
+                    "fetch",
+                    functools.partial(fetch_stage, args),
+                    args.get("fetch_workers", 4),
+                ),
+                Stage("parse", parse_stage, args.get("parse_workers", 1)),
+                Stage(
+                    "annotate",
+                    functools.partial(annotate_stage, args),
+                    args.get("annotate_workers", 1),
+                ),
+                Stage("write", functools.partial(write_stage, out)),
+            ],
+            maxsize=args.get("queue_size", 16),
+        )
         with open(args["input"], "r") as in_file:
-            for line in in_file:
-                try:
-                    primer_name, f_primer, r_primer, hg_version = line.rstrip(
-                        "\n"
-                    ).split("\t")
-                    logging.info("Processing primer {}....".format(primer_name))
-                    metadata = unknown_primer(
-                        f_primer,
-                        r_primer,
-                        hg_version,
-                        primer_name,
-                        args["max_size"],
-                        args["min_perfect"],
-                        args["min_good"],
-                    )
-                    format_metadata = "\t".join([str(x) for x in metadata])
-                    out.write(format_metadata + "\n")
-
-                except (
-                    ex.MultipleAmplicons,
-                    ex.NoAmplicon,
-                    ex.WrongHG,
-                    ex.AmbigousBase,
-                ) as e:
-                    logging.error(e.msg)
-                    continue
-
-                except ex.NoProteinCodingTranscript as e:
-                    logging.error(
-                        "No protein coding transcript was found within the in-silico amplicon generated by {}".format(
-                            primer_name
-                        )
-                    )
+            pipeline.run(in_file, log_error)
+    return pipeline.stats()
+
+
+def fetch_stage(args, line):
+    """ Check a primer pair from the input file and request its in-silico PCR results."""
+    primer_name, f_primer, r_primer, hg_version = line.rstrip("\n").split("\t")
+    logging.info("Processing primer {}....".format(primer_name))
+    hg_version = correct_hg_version(hg_version)
+    check_input_errors(primer_name, f_primer, r_primer, hg_version)
+    req = fetch_ispcr(
+        f_primer,
+        r_primer,
+        hg_version,
+        args["max_size"],
+        args["min_perfect"],
+        args["min_good"],
+    )
+    return (primer_name, f_primer, r_primer, hg_version, req.text)
+
+
+def parse_stage(fetched):
+    """ Parse the amplicon from a fetched in-silico PCR results page."""
+    primer_name, f_primer, r_primer, hg_version, text = fetched
+    amplicon = parse_ispcr(primer_name, text.splitlines())
+    return (primer_name, f_primer, r_primer, hg_version, amplicon)
+
+
+def annotate_stage(args, parsed):
+    """ Gather the Ensembl metadata of a parsed amplicon."""
+    primer_name, f_primer, r_primer, hg_version, amplicon = parsed
+    locus_metadata = get_metadata(amplicon.header, amplicon.seq, hg_version)
+    all_data = (primer_name, f_primer, r_primer, hg_version) + locus_metadata
+    if args.get("properties", False):
+        all_data += get_primer_properties(f_primer, r_primer)
+    return all_data
+
+
+@metrics.timed("write")
+def write_stage(out, metadata):
+    format_metadata = "\t".join([str(x) for x in metadata])
+    out.write(format_metadata + "\n")
+
+
+def log_error(line, error):
+    """ Log the primer pairs which could not be processed."""
+    metrics.count_exception(error)
+    primer_name = line.split("\t")[0]
+    if isinstance(
+        error, (ex.MultipleAmplicons, ex.NoAmplicon, ex.WrongHG, ex.AmbigousBase)
+    ):
+        logging.error(error.msg)
+    elif isinstance(error, ex.NoProteinCodingTranscript):
+        logging.error(
+            "No protein coding transcript was found within the in-silico amplicon generated by {}".format(
+                primer_name
+            )
+        )
+    else:
+        raise error
 
 
 def print_metadata(args, header):
@@ -179,6 +266,7 @@ def print_metadata(args, header):
         args["max_size"],
         args["min_perfect"],
         args["min_good"],
+        args["properties"],
     )
     print_metadata = "\t".join([str(x) for x in metadata])
     print(header + "\n" + print_metadata)
@@ -220,6 +308,36 @@ def get_parser():
         help="no. of bases on 3end of primers where at least 2/3 bases match (default=15)",
         default=15,
     )
+    parser.add_argument(
+        "-t",
+        "--properties",
+        action="store_true",
+        help="add primer Tm, 3end GC clamp, 3end stability and self-complementarity columns",
+    )
+    parser.add_argument(
+        "--fetch_workers",
+        type=int,
+        help="threads requesting in-silico PCR results with --input (default=4)",
+        default=4,
+    )
+    parser.add_argument(
+        "--parse_workers",
+        type=int,
+        help="threads parsing in-silico PCR results with --input (default=1)",
+        default=1,
+    )
+    parser.add_argument(
+        "--annotate_workers",
+        type=int,
+        help="threads gathering Ensembl metadata with --input (default=1)",
+        default=1,
+    )
+    parser.add_argument(
+        "--queue_size",
+        type=int,
+        help="maximum primer pairs waiting between stages with --input (default=16)",
+        default=16,
+    )
     parser.add_argument(
         "-o",
         "--output",
@@ -227,6 +345,12 @@ def get_parser():
         help="output data to file name",
         default="output_primer_data.txt",
     )
+    parser.add_argument(
+        "--metrics",
+        type=str,
+        help="write stage timings and counters to this file at the end of the run, "
+        "as JSON if it ends in .json and Prometheus text otherwise",
+    )
     return parser
 
 
@@ -248,10 +372,15 @@ def cli():
             "GC%",
         )
     )
+    if args["properties"]:
+        header = "\t".join((header,) + PROPERTY_HEADER)
     if args["input"]:
-        parse2output(args, header)
+        stats = parse2output(args, header)
+        print(format_stats(stats))
     else:
         print_metadata(args, header)
+    if args["metrics"]:
+        metrics.write(args["metrics"])
 
 
 if __name__ == "__main__":
@@ -0,0 +1,166 @@
+""" Generate synthetic genome, annotation, primer database and variant
+    files so the hot paths can be benchmarked offline at any scale.
+
+Every fixture is generated from a seeded random state, so the same scale
+always produces the same files.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+GENE_SPACING = 10000
+EXONS = 8
+EXON_LENGTH = 150
+INTRON_LENGTH = 600
+CONTIGS = 4
+LINE_WIDTH = 60
+
+
+def layout(scale):
+    """ Return the number of genes per contig and contig length for a scale."""
+    genes = max(CONTIGS, scale // 100) // CONTIGS
+    return genes, (genes + 1) * GENE_SPACING
+
+
+def write_genome(path, scale, seed=0):
+    """ Write a random FASTA genome of CONTIGS contigs named chr1, chr2..."""
+    state = np.random.RandomState(seed)
+    genes, length = layout(scale)
+    with open(path, "w") as f:
+        for contig in range(1, CONTIGS + 1):
+            f.write(">chr{}\n".format(contig))
+            seq = np.frombuffer(b"ACGT", dtype=np.uint8)[state.randint(0, 4, length)]
+            # lay the sequence out as rows of LINE_WIDTH bases plus a newline
+            lines = -(-length // LINE_WIDTH)
+            rows = np.full((lines, LINE_WIDTH + 1), ord("\n"), dtype=np.uint8)
+            rows[:, :LINE_WIDTH].flat[:length] = seq
+            text = rows.tobytes()
+            f.write(text[: len(text) - (lines * LINE_WIDTH - length)].decode())
+    return path
+
+
+def gene_exons(gene):
+    """ Return the 1-based (start, end) of each exon of the nth gene on a contig."""
+    start = (gene + 1) * GENE_SPACING
+    step = EXON_LENGTH + INTRON_LENGTH
+    return [(start + n * step, start + n * step + EXON_LENGTH - 1) for n in range(EXONS)]
+
+
+def write_gtf(path, scale):
+    """ Write a GTF annotating one single-transcript protein coding gene
+        every GENE_SPACING bases of every contig.
+    """
+    genes, _ = layout(scale)
+    with open(path, "w") as f:
+        for contig in range(1, CONTIGS + 1):
+            for gene in range(genes):
+                name = "GENE{}_{}".format(contig, gene)
+                exons = gene_exons(gene)
+                attributes = (
+                    'gene_id "G{0}_{1}"; gene_name "{2}"; gene_biotype "protein_coding"; '
+                    'transcript_id "T{0}_{1}"; transcript_name "{2}-001"; '
+                    'transcript_biotype "protein_coding";'
+                ).format(contig, gene, name)
+                span = (exons[0][0], exons[-1][1])
+                for feature in ("gene", "transcript"):
+                    f.write(
+                        "{}\tbenchmark\t{}\t{}\t{}\t.\t+\t.\t{}\n".format(
+                            contig, feature, span[0], span[1], attributes
+                        )
+                    )
+                for number, (start, end) in enumerate(exons, 1):
+                    f.write(
+                        '{}\tbenchmark\texon\t{}\t{}\t.\t+\t.\t{} exon_number "{}"; '
+                        'exon_id "E{}_{}_{}";\n'.format(
+                            contig, start, end, attributes, number, contig, gene, number
+                        )
+                    )
+    return path
+
+
+def primer_database(scale, seed=0):
+    """ Return a DataFrame of scale primer pairs in the primer database format."""
+    state = np.random.RandomState(seed)
+    genes, length = layout(scale)
+    bases = np.array(list("ACGT"))
+    contig = state.randint(1, CONTIGS + 1, scale)
+    size = state.randint(250, 700, scale)
+    start = state.randint(GENE_SPACING, length - 1000, scale)
+    gene = np.minimum((start - GENE_SPACING) // GENE_SPACING, genes - 1)
+    exon = state.randint(0, EXONS, scale)
+    in_exon = state.rand(scale) < 0.5
+    f_primers = ["".join(s) for s in bases[state.randint(0, 4, (scale, 20))]]
+    r_primers = ["".join(s) for s in bases[state.randint(0, 4, (scale, 22))]]
+    numbers = ["{}/{}".format(e + 1, EXONS) for e in exon]
+    return pd.DataFrame(
+        {
+            "Primer": ["BM{}".format(n) for n in range(scale)],
+            "F_Primer": f_primers,
+            "R_Primer": r_primers,
+            "Genome": np.where(state.rand(scale) < 0.8, "hg19", "hg38"),
+            "Gene": ["GENE{}_{}".format(c, g) for c, g in zip(contig, gene)],
+            "Transcript": ["GENE{}_{}-001".format(c, g) for c, g in zip(contig, gene)],
+            "Exon": np.where(in_exon, numbers, "-"),
+            "Intron": np.where(in_exon, "-", numbers),
+            "Product_Size": ["{}bp".format(s) for s in size],
+            "Primer_Range": [
+                "chr{}:{}-{}".format(c, s, s + n - 1) for c, s, n in zip(contig, start, size)
+            ],
+            "GC%": np.round(state.uniform(30, 65, scale), 1),
+        }
+    )
+
+
+def write_primer_database(path, scale, seed=0):
+    primer_database(scale, seed).to_csv(path, sep="\t", index=False)
+    return path
+
+
+def write_variants(path, scale, seed=0):
+    """ Write scale variant positions, most of them within an amplicon of
+        the primer database of the same scale.
+    """
+    state = np.random.RandomState(seed + 1)
+    genes, length = layout(scale)
+    contig = state.randint(1, CONTIGS + 1, scale)
+    position = state.randint(GENE_SPACING, length - 1000, scale)
+    with open(path, "w") as f:
+        for n, (c, p) in enumerate(zip(contig, position)):
+            f.write("var{}\t{}:{}\n".format(n, c, p))
+    return path
+
+
+def exonic_positions(scale, number, seed=0):
+    """ Return (contig, position) pairs lying within annotated exons."""
+    state = np.random.RandomState(seed + 2)
+    genes, _ = layout(scale)
+    positions = []
+    for _ in range(number):
+        contig = int(state.randint(1, CONTIGS + 1))
+        start, end = gene_exons(int(state.randint(0, genes)))[state.randint(0, EXONS)]
+        positions.append((contig, int(state.randint(start, end + 1))))
+    return positions
+
+
+def build(directory, scale, seed=0):
+    """ Write every fixture for a scale into directory, skipping any
+        already written, and return their paths.
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = {
+        "genome": os.path.join(directory, "genome.fa"),
+        "gtf": os.path.join(directory, "annotation.gtf"),
+        "database": os.path.join(directory, "primer_database.txt"),
+        "variants": os.path.join(directory, "variants.txt"),
+    }
+    writers = {
+        "genome": write_genome,
+        "gtf": lambda path, scale, seed: write_gtf(path, scale),
+        "database": write_primer_database,
+        "variants": write_variants,
+    }
+    for name, path in paths.items():
+        if not os.path.exists(path):
+            writers[name](path, scale, seed)
+    return paths
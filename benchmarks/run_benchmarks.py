@@ -0,0 +1,340 @@
+""" Time the hot paths of GeneaPy against synthetic fixtures, without any
+    network access or downloaded Ensembl releases.
+
+Each benchmark is run --repeat times and the fastest time kept, then run
+once more under tracemalloc to record its peak Python memory. Results
+are written as JSON, and a previous results file can be given with
+--compare to print the change of each benchmark, e.g.
+
+    python benchmarks/run_benchmarks.py --scales 1000 100000 --output new.json --compare old.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+import warnings
+
+import pandas as pd
+
+import fixtures
+
+HERE = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from GeneaPy import get_seq, primer_finder, reannotate_database  # noqa: E402
+from GeneaPy.modules import annotation_index, dedup, pyensembl_wrappers  # noqa: E402
+
+# sequence and annotation lookups are one call per query, so at most
+# this many queries are timed regardless of scale
+QUERIES = 1000
+# errors setting up a benchmark which mean it cannot run here, e.g. an
+# optional dependency which is missing, rather than that it is broken
+SKIP_ERRORS = (ImportError,)
+
+
+def measure(func, repeat):
+    """ Return the fastest of repeat timings of func and its peak traced memory."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return min(times), peak
+
+
+def annotation(paths):
+    """ Return a pyensembl Genome of the synthetic GTF, indexed on first use."""
+    import pyensembl
+
+    genome = pyensembl.Genome(
+        reference_name="synthetic",
+        annotation_name="benchmark",
+        gtf_path_or_url=paths["gtf"],
+        cache_directory_path=os.path.join(os.path.dirname(paths["gtf"]), "pyensembl"),
+    )
+    genome.index()
+    return genome
+
+
+def seq_ranges(scale):
+    state = random.Random(scale)
+    genes, length = fixtures.layout(scale)
+    ranges = []
+    for _ in range(min(scale, QUERIES)):
+        start = state.randint(1, length - 200)
+        ranges.append("{}:{}-{}".format(state.randint(1, fixtures.CONTIGS), start, start + 150))
+    return ranges
+
+
+def bench_get_seq(paths, scale):
+    import pysam
+
+    pysam.faidx(paths["genome"])
+    ranges = seq_ranges(scale)
+    return lambda: [get_seq.get_seq(r, genome=paths["genome"]) for r in ranges]
+
+
+def bench_get_seq_bgzf(paths, scale):
+    """ get_seq of clustered ranges from a bgzipped copy of the genome."""
+    import pysam
+
+    bgzf = paths["genome"] + ".gz"
+    if not os.path.exists(bgzf):
+        pysam.tabix_compress(paths["genome"], bgzf)
+    state = random.Random(scale)
+    ranges = []
+    for _ in range(min(scale, QUERIES)):
+        start = state.randint(fixtures.GENE_SPACING, 2 * fixtures.GENE_SPACING)
+        ranges.append("1:{}-{}".format(start, start + 150))
+    get_seq.get_seq(ranges[0], genome=bgzf)
+    return lambda: [get_seq.get_seq(r, genome=bgzf) for r in ranges]
+
+
+def bench_get_exon(paths, scale):
+    genome = annotation(paths)
+    positions = fixtures.exonic_positions(scale, min(scale, QUERIES))
+    transcripts = [genome.transcripts_at_locus(str(c), p)[0] for c, p in positions]
+    return lambda: [
+        pyensembl_wrappers.get_exon(p, t) for (c, p), t in zip(positions, transcripts)
+    ]
+
+
+def bench_locus_metadata(paths, scale):
+    """ The lookups LocusMetaData makes for each position, against the
+        synthetic annotation rather than a downloaded Ensembl release.
+    """
+    import pysam
+
+    pysam.faidx(paths["genome"])
+    genome = annotation(paths)
+    positions = fixtures.exonic_positions(scale, min(scale, QUERIES))
+
+    def run():
+        for contig, position in positions:
+            pyensembl_wrappers.get_gene_locus(genome, str(contig), position)
+            transcript = pyensembl_wrappers.get_transcript(genome, str(contig), position)
+            pyensembl_wrappers.get_exon(position, transcript)
+            get_seq.get_seq(
+                "{}:{}".format(contig, position), genome=paths["genome"],
+                upstream=50, downstream=50, header=False,
+            )
+
+    return run
+
+
+def bench_index_gtf(paths, scale):
+    output = os.path.join(os.path.dirname(paths["gtf"]), "annotation_index")
+    return lambda: annotation_index.build_index(paths["gtf"], output)
+
+
+def bench_indexed_metadata(paths, scale):
+    """ The lookups of bench_locus_metadata against GeneaPy's own
+        annotation index of the synthetic GTF.
+    """
+    output = os.path.join(os.path.dirname(paths["gtf"]), "annotation_index")
+    index = annotation_index.build_index(paths["gtf"], output)
+    positions = fixtures.exonic_positions(scale, min(scale, QUERIES))
+
+    def run():
+        for contig, position in positions:
+            pyensembl_wrappers.get_gene_locus(index, contig, position)
+            transcript = pyensembl_wrappers.get_transcript(index, contig, position)
+            pyensembl_wrappers.get_exon(position, transcript)
+
+    return run
+
+
+def bench_parse_database(paths, scale):
+    return lambda: primer_finder.database2df(paths["database"], cache=False)
+
+
+def bench_cached_database(paths, scale):
+    primer_finder.database2df(paths["database"], cache=True)
+    return lambda: primer_finder.database2df(paths["database"], cache=True)
+
+
+def bench_variant_file(paths, scale):
+    primer_finder.database2df(paths["database"], cache=True)
+    return lambda: primer_finder.primer_finder(
+        paths["database"], input_file=paths["variants"], distance=20
+    )
+
+
+def bench_filters(paths, scale):
+    primer_finder.database2df(paths["database"], cache=True)
+    return lambda: primer_finder.primer_finder(
+        paths["database"], gene="GENE1_0", size=500, gc=60, hg="hg19"
+    )
+
+
+def bench_dedup_database(paths, scale):
+    db = pd.read_csv(paths["database"], delimiter="\t", dtype=str, keep_default_na=False)
+    return lambda: dedup.deduplicate(db)
+
+
+def bench_reannotate_database(paths, scale):
+    output = os.path.join(os.path.dirname(paths["gtf"]), "annotation_index")
+    index = annotation_index.build_index(paths["gtf"], output)
+    db = pd.read_csv(paths["database"], delimiter="\t", dtype=str, keep_default_na=False)
+    return lambda: reannotate_database.reannotate_database(db, index, "hg19")
+
+
+BENCHMARKS = {
+    "get_seq": bench_get_seq,
+    "get_seq_bgzf": bench_get_seq_bgzf,
+    "get_exon": bench_get_exon,
+    "locus_metadata": bench_locus_metadata,
+    "index_gtf": bench_index_gtf,
+    "indexed_metadata": bench_indexed_metadata,
+    "parse_database": bench_parse_database,
+    "cached_database": bench_cached_database,
+    "variant_file": bench_variant_file,
+    "filters": bench_filters,
+    "dedup_database": bench_dedup_database,
+    "reannotate_database": bench_reannotate_database,
+}
+
+
+def run(scales, names, workdir, repeat):
+    """ Run each benchmark at each scale and return a list of results.
+
+    A benchmark which cannot be set up for one of SKIP_ERRORS, e.g. for
+    lack of an optional dependency, is recorded as skipped with the
+    reason. Any other exception is recorded as an error, and the
+    remaining benchmarks are still run.
+    """
+    results = []
+    for scale in scales:
+        paths = fixtures.build(os.path.join(workdir, str(scale)), scale)
+        for name in names:
+            result = {"benchmark": name, "scale": scale}
+            try:
+                func = BENCHMARKS[name](paths, scale)
+            except SKIP_ERRORS as e:
+                result["skipped"] = "{}: {}".format(type(e).__name__, e)
+                func = None
+            except Exception as e:
+                result["error"] = "{}: {}".format(type(e).__name__, e)
+                func = None
+            if func is not None:
+                try:
+                    seconds, peak = measure(func, repeat)
+                    result.update(seconds=round(seconds, 6), peak_mb=round(peak / 2 ** 20, 3))
+                except Exception as e:
+                    result["error"] = "{}: {}".format(type(e).__name__, e)
+            print(format_result(result))
+            results.append(result)
+    return results
+
+
+def format_result(result):
+    if "skipped" in result:
+        return "{benchmark}\t{scale}\tskipped ({skipped})".format(**result)
+    if "error" in result:
+        return "{benchmark}\t{scale}\terror ({error})".format(**result)
+    return "{benchmark}\t{scale}\t{seconds:.4f}s\t{peak_mb:.1f}MB".format(**result)
+
+
+def compare(results, baseline):
+    """ Return lines comparing results with a previous results file."""
+    previous = {(r["benchmark"], r["scale"]): r for r in baseline["results"]}
+    lines = ["benchmark\tscale\tseconds\tbaseline\tchange"]
+    for r in results:
+        old = previous.get((r["benchmark"], r["scale"]))
+        if "seconds" not in r or not old or "seconds" not in old:
+            continue
+        change = (r["seconds"] - old["seconds"]) / max(old["seconds"], 1e-9)
+        lines.append(
+            "{}\t{}\t{:.4f}\t{:.4f}\t{:+.0%}".format(
+                r["benchmark"], r["scale"], r["seconds"], old["seconds"], change
+            )
+        )
+    return lines
+
+
+def git_commit():
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=HERE, capture_output=True, text=True, check=True,
+        )
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        description="Benchmark GeneaPy offline against synthetic fixtures."
+    )
+    parser.add_argument(
+        "-s",
+        "--scales",
+        type=int,
+        nargs="+",
+        help="primer database and variant rows of each run (default=1000 10000)",
+        default=[1000, 10000],
+    )
+    parser.add_argument(
+        "-b",
+        "--benchmarks",
+        nargs="+",
+        choices=sorted(BENCHMARKS),
+        help="benchmarks to run (default=all)",
+        default=list(BENCHMARKS),
+    )
+    parser.add_argument(
+        "-r", "--repeat", type=int, help="timed runs of each benchmark (default=3)", default=3
+    )
+    parser.add_argument(
+        "-w",
+        "--workdir",
+        type=str,
+        help="directory the fixtures are generated in and reused from",
+        default="benchmark_fixtures",
+    )
+    parser.add_argument(
+        "-o", "--output", type=str, help="JSON results file", default="benchmark_results.json"
+    )
+    parser.add_argument(
+        "-c", "--compare", type=str, help="previous JSON results file to compare with"
+    )
+    return parser
+
+
+def cli():
+    parser = get_parser()
+    args = vars(parser.parse_args())
+    warnings.filterwarnings("ignore")
+    results = run(args["scales"], args["benchmarks"], args["workdir"], args["repeat"])
+    report = {
+        "commit": git_commit(),
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    with open(args["output"], "w") as f:
+        json.dump(report, f, indent=2)
+    if args["compare"]:
+        with open(args["compare"]) as f:
+            print("\n".join(compare(results, json.load(f))))
+    errors = [r for r in results if "error" in r]
+    if errors:
+        sys.exit("{} benchmark runs failed".format(len(errors)))
+
+
+if __name__ == "__main__":
+    cli()
@@ -3,8 +3,34 @@ from GeneaPy.modules import pyensembl_wrappers
 from GeneaPy.modules.fullexon import FullExon
 from GeneaPy.modules.metadata import LocusMetaData
 from GeneaPy.modules import common
+from GeneaPy.modules import ispcr
+from GeneaPy.modules import primer_properties
+from GeneaPy.modules.pipeline import Pipeline, Stage
+from GeneaPy.modules import seed_index
+from GeneaPy.modules.seed_index import SeedIndex
+from GeneaPy.modules.interval_index import AmpliconIndex
+from GeneaPy.modules import db_cache
+from GeneaPy.modules.set_cover import greedy_set_cover
+from GeneaPy.modules import liftover
+from GeneaPy.modules.liftover import ChainFile, chain_builds
+from GeneaPy.modules import compact
+from GeneaPy.modules import metrics
+from GeneaPy.modules.annotation_index import build_index
+from GeneaPy.modules import sequence_index
+from GeneaPy.modules.bgzf_fasta import BgzfFasta
+from GeneaPy.modules import dedup
+import numpy as np
+import pandas as pd
+from GeneaPy.modules import ucsc
+import GeneaPy.modules.custom_exceptions as ex
+import requests
 import logging
+import os
+import tempfile
+import threading
+import time
 import unittest
+import unittest.mock
 
 DATA = EnsemblRelease(75)
 
@@ -77,6 +103,557 @@ class TestCommon(unittest.TestCase):
         self.assertEqual(ensembl_release, 83)
 
 
+class TestIsPcr(unittest.TestCase):
+    page = ['<HTML><BODY>',
+            '<PRE><TT><A HREF="../cgi-bin/hgTracks?position=chr15:48755298-48755718">'
+            '&gt;chr15:48755298+48755718</A> 21bp CTGTTCAC CTGGGCAG',
+            'CTGTTCACagg',
+            'gcttCTGCCCAG',
+            '<A HREF="../cgi-bin/hgTracks?position=chr2:100-110">'
+            '&gt;chr2:100-110</A> 11bp CTGTTCAC CTGGGCAG',
+            'CTGTTCACttg</TT></PRE>',
+            '<PRE>&gt;chr1:1+2</PRE>',
+            '</BODY></HTML>']
+
+    def test_parse_amplicons(self):
+        amplicons = ispcr.parse_amplicons(self.page)
+        self.assertEqual(len(amplicons), 2)
+        self.assertEqual(amplicons[0].seq, 'CTGTTCACagggcttCTGCCCAG')
+        self.assertEqual(amplicons[0].locus, 'chr15:48755298-48755718')
+        self.assertEqual(amplicons[1].strand, '-')
+        self.assertEqual(amplicons[1].locus, 'chr2:100-110')
+
+    def test_no_amplicon(self):
+        amplicons = ispcr.parse_amplicons(['<HTML>No matches</HTML>'])
+        self.assertEqual(amplicons, [])
+
+
+class TestPrimerProperties(unittest.TestCase):
+    primers = ['CTGTTCACAGGGCTTGTTCC', b'CTGGGCAGAGAGTCATTTAAAGT', 'gaattc']
+
+    def test_gc_content(self):
+        gc = primer_properties.gc_content(self.primers)
+        self.assertEqual(gc.round(3).tolist(), [0.55, 0.435, 0.333])
+
+    def test_melting_temp(self):
+        tm = primer_properties.melting_temp(self.primers)
+        self.assertEqual(tm.round(1).tolist()[:2], [53.3, 52.5])
+
+    def test_gc_clamp(self):
+        clamp = primer_properties.gc_clamp(self.primers)
+        self.assertEqual(clamp.tolist(), [3, 1, 1])
+
+    def test_short_primers(self):
+        # shorter than the 3' window, so the whole primer is the window
+        self.assertEqual(primer_properties.gc_clamp(['GC', 'AAAAGC']).tolist(), [2, 2])
+        stability = primer_properties.end_stability(['GC', 'AGC', 'AAAGC'])
+        self.assertEqual(stability.round(2).tolist(), [-0.3, -1.52, -3.55])
+
+    def test_self_complementarity(self):
+        self_comp = primer_properties.self_complementarity(self.primers)
+        self.assertEqual(self_comp.tolist(), [8, 6, 6])
+
+
+class TestSeedIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        genome = os.path.join(self.tmp.name, 'genome.fa')
+        with open(genome, 'w') as f:
+            f.write('>chr1\nTTTTTTTTTTCTGTTCACAGGGCTTGTTCCTTTTTTTTTT\n'
+                    '>chr2\nAAAAANNNNNGGAACAAGCCCTGTGAACAGAAAAA\n'
+                    'CTGTTCACAGGGCTTGTTAC\n')
+        self.index = SeedIndex.build(genome, os.path.join(self.tmp.name, 'idx'), k=8)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_find_sites(self):
+        sites = self.index.find_sites('CTGTTCACAGGGCTTGTTCC', max_mismatches=1)
+        correct = [('chr1', 11, '+', 0, 0.0), ('chr2', 36, '+', 1, 2.6),
+                   ('chr2', 11, '-', 0, 0.0)]
+        self.assertEqual(sites, correct)
+
+    def test_spread_mismatches(self):
+        # one mismatch in the first 8-mer seed and two in the second, so the
+        # site is only found by allowing a mismatch within a seed
+        genome = os.path.join(self.tmp.name, 'spread.fa')
+        with open(genome, 'w') as f:
+            f.write('>chr1\nTTTTTCTATTCACATGGCTTATTCCTTTTT\n')
+        index = SeedIndex.build(genome, os.path.join(self.tmp.name, 'spread'), k=8)
+        sites = index.find_sites('CTGTTCACAGGGCTTGTTCC', max_mismatches=3)
+        self.assertEqual([s[:4] for s in sites], [('chr1', 6, '+', 3)])
+        with self.assertRaises(ex.SeedTooLong):
+            self.index.find_sites('CTGTTCA', max_mismatches=0)
+
+    def test_repetitive_seed(self):
+        with self.assertRaises(ex.RepetitiveSeed):
+            self.index.find_sites('TTTTTTTTTTTTTTTT', max_mismatches=0, max_hits=2)
+
+    def test_seed_variants(self):
+        # AC with one substitution, and AN with the N always substituted
+        values = seed_index.seed_variants(np.array([0, 1]), 1)
+        self.assertEqual(sorted(values.tolist()), [0, 1, 2, 3, 5, 9, 13])
+        values = seed_index.seed_variants(np.array([0, 4]), 1)
+        self.assertEqual(sorted(values.tolist()), [0, 1, 2, 3])
+        self.assertEqual(len(seed_index.seed_variants(np.array([4, 4]), 1)), 0)
+
+
+class TestPipeline(unittest.TestCase):
+    def test_pipeline_order(self):
+        written, errors = [], []
+
+        def double(x):
+            if x == 3:
+                raise ValueError(x)
+            return x * 2
+
+        pipeline = Pipeline([Stage('double', double, workers=4),
+                             Stage('add', lambda x: x + 1, workers=2),
+                             Stage('write', written.append)], maxsize=2)
+        pipeline.run(range(10), lambda item, e: errors.append(item))
+        self.assertEqual(written, [1, 3, 5, 9, 11, 13, 15, 17, 19])
+        self.assertEqual(errors, [3])
+        self.assertEqual([s['items'] for s in pipeline.stats()], [10, 9, 9])
+
+    def test_pipeline_window(self):
+        # item 0 is held up, so only window items are fed meanwhile and
+        # one more read while waiting for the window
+        read, written = [], []
+        release = threading.Event()
+
+        def items():
+            for x in range(20):
+                read.append(x)
+                yield x
+
+        def slow(x):
+            if x == 0:
+                release.wait(5)
+            return x
+
+        pipeline = Pipeline([Stage('slow', slow, workers=4), Stage('write', written.append)],
+                            maxsize=8, window=3)
+        thread = threading.Thread(target=pipeline.run, args=(items(), None))
+        thread.start()
+        time.sleep(0.2)
+        self.assertEqual(len(read), 4)
+        release.set()
+        thread.join(5)
+        self.assertEqual(written, list(range(20)))
+
+
+class TestUcscReplay(unittest.TestCase):
+    url = 'https://genome.ucsc.edu/cgi-bin/hgPcr?wp_f=CTGT&wp_r=CTGG'
+
+    def setUp(self):
+        self.settings = dict(ucsc.SETTINGS)
+        self.tmp = tempfile.TemporaryDirectory()
+        ucsc.configure('replay', self.tmp.name)
+        response = requests.Response()
+        response._content = b'<PRE>&gt;chr1:1+8 8bp\nCTGTccag\n</PRE>'
+        response.status_code = 200
+        response.encoding = 'utf-8'
+        ucsc.record(self.url, response)
+
+    def tearDown(self):
+        # restore the mode and archive set by GENEAPY_UCSC_MODE/ARCHIVE
+        ucsc.SETTINGS.update(self.settings)
+        self.tmp.cleanup()
+
+    def test_replay(self):
+        response = ucsc.get(self.url, stream=True)
+        amplicons = ispcr.parse_amplicons(response.iter_lines(decode_unicode=True))
+        self.assertEqual(amplicons[0].seq, 'CTGTccag')
+
+    def test_not_recorded(self):
+        with self.assertRaises(ex.NotRecorded):
+            ucsc.get(self.url + '&wp_size=10')
+
+
+class TestAmpliconIndex(unittest.TestCase):
+    index = AmpliconIndex([15, 15, 1, 15], [100, 150, 100, 400], [300, 200, 300, 900])
+
+    def test_overlaps(self):
+        variants, rows = self.index.overlaps([15, 1, 2, 15], [180, 100, 180, 450])
+        self.assertEqual(variants.tolist(), [0, 0, 3])
+        self.assertEqual(rows.tolist(), [0, 1, 3])
+
+
+class TestDbCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'db.txt')
+        with open(self.path, 'w') as f:
+            f.write('Primer\tGene\tStart\nFRD1\tFBN1\t100\nFRD2\t\t200\n')
+        self.parsed = 0
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def parse(self, path):
+        self.parsed += 1
+        return pd.read_csv(path, delimiter='\t')
+
+    def test_cached(self):
+        first = db_cache.load(self.path, self.parse)
+        second = db_cache.load(self.path, self.parse)
+        pd.testing.assert_frame_equal(first, second)
+        self.assertEqual(self.parsed, 1)
+
+    def test_rebuilt(self):
+        db_cache.load(self.path, self.parse)
+        with open(self.path, 'a') as f:
+            f.write('FRD3\tSMAD4\t300\n')
+        df = db_cache.load(self.path, self.parse)
+        self.assertEqual(self.parsed, 2)
+        self.assertTrue(pd.isnull(df.Gene[1]))
+        self.assertEqual(df.Gene[2], 'SMAD4')
+        self.assertEqual(len(df), 3)
+
+    def test_categorical(self):
+        parse = lambda path: self.parse(path).astype({'Gene': 'category'})
+        first = db_cache.load(self.path, parse)
+        second = db_cache.load(self.path, parse)
+        pd.testing.assert_frame_equal(first, second)
+        self.assertEqual(self.parsed, 1)
+
+    def test_version(self):
+        db_cache.load(self.path, self.parse, version=1)
+        db_cache.load(self.path, self.parse, version=2)
+        self.assertEqual(self.parsed, 2)
+
+    def test_columns(self):
+        for _ in range(2):
+            df = db_cache.load(self.path, self.parse, columns=['Start'])
+            self.assertEqual(list(df.columns), ['Start'])
+            self.assertEqual(df.Start.tolist(), [100, 200])
+        self.assertEqual(self.parsed, 1)
+
+    def test_lazy_text(self):
+        db_cache.load(self.path, self.parse)
+        df = db_cache.load(self.path, self.parse)
+        self.assertIsInstance(df.Gene.values, db_cache.TextArray)
+        self.assertIsInstance(df.Gene.values.strings, np.memmap)
+        taken = df.iloc[[1, 0]]
+        self.assertEqual(taken.Gene.values.strings.tolist(), ['', 'FBN1'])
+        self.assertTrue(pd.isnull(taken.Gene.iloc[0]))
+        self.assertEqual(taken.Gene.iloc[1], 'FBN1')
+        self.assertEqual(taken.Primer.tolist(), ['FRD2', 'FRD1'])
+        self.assertEqual(np.asarray(df.Gene.values, dtype=object)[0], 'FBN1')
+        with self.assertRaises(ValueError):
+            df.Gene.values.__array__(copy=False)
+
+    def test_read_only_cache(self):
+        db_cache.load(self.path, self.parse)
+        os.utime(self.path, (0, 0))
+        # the touched source's cache cannot be updated or rewritten
+        with unittest.mock.patch('json.dump', side_effect=PermissionError):
+            df = db_cache.load(self.path, self.parse)
+        self.assertEqual(self.parsed, 2)
+        self.assertEqual(df.Primer.tolist(), ['FRD1', 'FRD2'])
+
+    def test_cache_dir(self):
+        cache_dir = os.path.join(self.tmp.name, 'caches')
+        settings = dict(db_cache.SETTINGS)
+        db_cache.SETTINGS['cache_dir'] = cache_dir
+        try:
+            db_cache.load(self.path, self.parse)
+            db_cache.load(self.path, self.parse)
+        finally:
+            db_cache.SETTINGS.update(settings)
+        self.assertEqual(self.parsed, 1)
+        self.assertFalse(os.path.exists(self.path + db_cache.SUFFIX))
+        self.assertEqual(len(os.listdir(cache_dir)), 1)
+
+
+class TestSetCover(unittest.TestCase):
+    def test_greedy_set_cover(self):
+        # set 0 covers items 0-2, set 1 items 2-3, set 2 item 3, set 3 item 4
+        items = [0, 1, 2, 2, 3, 3, 4]
+        sets = [0, 0, 0, 1, 1, 2, 3]
+        chosen = greedy_set_cover(items, sets)
+        self.assertEqual([c for c, _ in chosen], [0, 1, 3])
+        self.assertEqual([n.tolist() for _, n in chosen], [[0, 1, 2], [3], [4]])
+
+    def test_empty(self):
+        self.assertEqual(greedy_set_cover([], []), [])
+
+
+class TestLiftOver(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        path = os.path.join(self.tmp.name, 'test.chain')
+        with open(path, 'w') as f:
+            f.write('chain 1000 chr1 1000 + 100 400 chr1 2000 + 500 820 1\n'
+                    '100 20 40\n200\n\n'
+                    'chain 900 chr2 500 + 0 100 chr5 300 - 10 110 2\n100\n\n')
+        self.chain = ChainFile(path)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_lift(self):
+        contigs, positions, strands = self.chain.lift(
+            ['1', 'chr1', '1', 2, '3'], [101, 210, 221, 1, 5])
+        self.assertEqual(contigs.tolist(), ['1', None, '1', '5', None])
+        self.assertEqual(positions[[0, 2, 3]].tolist(), [501, 641, 290])
+        self.assertEqual(strands[[0, 3]].tolist(), ['+', '-'])
+
+    def test_lift_ranges(self):
+        contigs, start, end = self.chain.lift_ranges(['1', '1', '2'], [101, 150, 1], [120, 210, 50])
+        self.assertEqual(contigs.tolist(), ['1', None, '5'])
+        self.assertEqual(start[[0, 2]].tolist(), [501, 241])
+        self.assertEqual(end[[0, 2]].tolist(), [520, 290])
+
+    def test_parse_contigs(self):
+        self.assertEqual(liftover.parse_contigs(['chr1', '2']).tolist(), [1, 2])
+        contigs = liftover.parse_contigs(['chr1', 'X', None, '1_KI270706v1_random'])
+        self.assertEqual(contigs[[0, 1, 3]].tolist(), [1, 'X', '1_KI270706v1_random'])
+        self.assertTrue(pd.isnull(contigs[2]))
+
+    def test_chain_builds(self):
+        self.assertEqual(chain_builds('/data/hg19ToHg38.over.chain.gz'), ('hg19', 'hg38'))
+        self.assertEqual(chain_builds('test.chain'), (None, None))
+        self.assertEqual(self.chain.source, None)
+
+
+class TestCompact(unittest.TestCase):
+    def test_pack_sequences(self):
+        seqs = ['ACGT', 'TTGCAAGGCTTACGATGCATCGACTGCATCGA', 'G']
+        packed, lengths = compact.pack_sequences(seqs)
+        self.assertEqual(packed.dtype, np.uint64)
+        self.assertEqual(compact.unpack_sequences(packed, lengths).tolist(), seqs)
+
+    def test_unpackable(self):
+        self.assertIsNone(compact.pack_sequences(['ACGN']))
+        self.assertIsNone(compact.pack_sequences(['acgt']))
+        self.assertIsNone(compact.pack_sequences(['A' * 33]))
+
+    def test_compact_database(self):
+        db = pd.DataFrame({'F_Primer': ['ACGT', 'GGCC'], 'Gene': ['FBN1', 'FBN1'],
+                           'Start': [48787031, 48787404], 'GC%': [40.4, 55.5],
+                           'Score': [0.5, 0.25]})
+        small = compact.compact_database(db)
+        self.assertEqual(small.Start.dtype, np.int32)
+        # 40.4 is not exactly a float32, so would change when written out
+        self.assertEqual(small['GC%'].dtype, np.float64)
+        self.assertEqual(small.Score.dtype, np.float32)
+        self.assertEqual(small.Gene.dtype, 'category')
+        self.assertEqual(compact.expand_database(small).F_Primer.tolist(), ['ACGT', 'GGCC'])
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        metrics.reset()
+
+    def tearDown(self):
+        metrics.reset()
+
+    def test_snapshot(self):
+        with metrics.timer('write'):
+            pass
+        metrics.count('network_requests', mode='live')
+        metrics.count('network_requests', 2, mode='live')
+        metrics.count_exception(ex.NoAmplicon('FRD1'))
+        snap = metrics.snapshot()
+        self.assertEqual([(t['name'], t['calls']) for t in snap['timers']], [('write', 1)])
+        self.assertEqual(snap['counters'], [
+            {'name': 'exceptions', 'labels': {'type': 'NoAmplicon'}, 'value': 1},
+            {'name': 'network_requests', 'labels': {'mode': 'live'}, 'value': 3}])
+
+    def test_merge(self):
+        with metrics.timer('annotation_lookup'):
+            pass
+        metrics.count('cache_hits', cache='npcache')
+        drained = metrics.drain()
+        self.assertEqual(metrics.snapshot(), {'timers': [], 'counters': []})
+        metrics.count('cache_hits', cache='npcache')
+        metrics.merge(drained)
+        metrics.merge(drained)
+        snap = metrics.snapshot()
+        self.assertEqual([(t['name'], t['calls']) for t in snap['timers']], [('annotation_lookup', 2)])
+        self.assertEqual(snap['counters'][0]['value'], 3)
+
+    def test_prometheus(self):
+        metrics.count('cache_hits', cache='npcache')
+        self.assertEqual(metrics.to_prometheus(),
+                         '# TYPE geneapy_cache_hits_total counter\n'
+                         'geneapy_cache_hits_total{cache="npcache"} 1\n')
+
+
+class TestAnnotationIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        gtf = os.path.join(self.tmp.name, 'test.gtf')
+        with open(gtf, 'w') as f:
+            f.write('#!genome-build test\n'
+                    'chr1\tens\tgene\t100\t1000\t.\t+\t.\tgene_id "G1"; gene_name "AAA"; gene_biotype "protein_coding";\n'
+                    'chr1\tens\ttranscript\t100\t1000\t.\t+\t.\tgene_id "G1"; gene_name "AAA"; gene_biotype "protein_coding"; transcript_id "T1"; transcript_name "AAA-001"; transcript_biotype "protein_coding";\n'
+                    'chr1\tens\texon\t100\t200\t.\t+\t.\tgene_id "G1"; transcript_id "T1"; exon_number "1"; exon_id "E1";\n'
+                    'chr1\tens\texon\t500\t600\t.\t+\t.\tgene_id "G1"; transcript_id "T1"; exon_number "2"; exon_id "E2";\n'
+                    'chr1\tens\texon\t900\t1000\t.\t+\t.\tgene_id "G1"; transcript_id "T1"; exon_number "3"; exon_id "E3";\n'
+                    'chr1\tens\tCDS\t150\t200\t.\t+\t0\tgene_id "G1"; transcript_id "T1";\n'
+                    'chr1\tens\tCDS\t500\t600\t.\t+\t2\tgene_id "G1"; transcript_id "T1";\n'
+                    'chr1\tens\tCDS\t900\t947\t.\t+\t1\tgene_id "G1"; transcript_id "T1";\n'
+                    'chr1\tens\tstop_codon\t948\t950\t.\t+\t0\tgene_id "G1"; transcript_id "T1";\n'
+                    'chr1\tens\ttranscript\t450\t650\t.\t+\t.\tgene_id "G1"; gene_name "AAA"; transcript_id "T2"; transcript_name "AAA-002"; transcript_biotype "retained_intron";\n'
+                    'chr1\tens\texon\t450\t650\t.\t+\t.\tgene_id "G1"; transcript_id "T2"; exon_number "1"; exon_id "E4";\n'
+                    'chr2\tens\texon\t300\t400\t.\t-\t.\tgene_id "G2"; gene_name "BBB"; gene_type "lncRNA"; transcript_id "T3"; transcript_type "lncRNA"; exon_id "E5";\n'
+                    'chr2\tens\texon\t100\t200\t.\t-\t.\tgene_id "G2"; gene_name "BBB"; gene_type "lncRNA"; transcript_id "T3"; transcript_type "lncRNA"; exon_id "E6";\n'
+                    'chr2\tens\tCDS\t100\t200\t.\t-\t.\tgene_id "G2";\n')
+        self.index = build_index(gtf, os.path.join(self.tmp.name, 'index'))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_transcript(self):
+        transcript = pyensembl_wrappers.get_transcript(self.index, 1, 550)
+        self.assertEqual((transcript.id, transcript.canonical, len(transcript)), ('T1', True, 303))
+        self.assertEqual([e.id for e in self.index.transcript_by_id('T2').exons], ['E4'])
+
+    def test_exon(self):
+        transcript = pyensembl_wrappers.get_transcript(self.index, 'chr1', 550)
+        exon = pyensembl_wrappers.get_exon(550, transcript)
+        self.assertEqual((exon.id, exon.number, exon.exon), ('E2', '2/3', True))
+        intron = pyensembl_wrappers.get_exon(300, transcript)
+        self.assertEqual((intron.start, intron.end, intron.number), (201, 499, '1/2'))
+
+    def test_locus_metadata_timers(self):
+        metadata = LocusMetaData(1, 550, 'hg19', seq=False, annotation=self.index)
+        metrics.reset()
+        start = time.perf_counter()
+        self.assertEqual(metadata.exon.number, '2/3')
+        elapsed = time.perf_counter() - start
+        timers = metrics.snapshot()['timers']
+        metrics.reset()
+        # the transcript and exon lookups are timed once each, not one within the other
+        self.assertEqual([(t['name'], t['calls']) for t in timers], [('annotation_lookup', 2)])
+        self.assertLessEqual(timers[0]['seconds'], elapsed + 1e-6)
+
+    def test_hgvs(self):
+        coordinates = {p: [(c.transcript_id, c.number, c.hgvs)
+                           for c in self.index.transcript_coordinates(1, p)]
+                       for p in (100, 150, 210, 490, 960)}
+        self.assertEqual(coordinates, {100: [('T1', '1/3', 'c.-50')],
+                                       150: [('T1', '1/3', 'c.1')],
+                                       210: [('T1', '1/2', 'c.51+10')],
+                                       490: [('T1', '1/2', 'c.52-10'), ('T2', '1/1', 'n.41')],
+                                       960: [('T1', '3/3', 'c.*10')]})
+        # non-coding on the - strand, the tie of an intron midpoint numbered +
+        self.assertEqual([c.hgvs for c in self.index.transcript_coordinates(2, 250)],
+                         ['n.101+50'])
+
+    def test_canonical_features(self):
+        found = self.index.canonical_features('chr1', [550, 1200, 460, 100])
+        self.assertEqual(found['found'].tolist(), [True, False, True, True])
+        self.assertEqual(found['transcript_name'].tolist(), ['AAA-001', '', 'AAA-001', 'AAA-001'])
+        self.assertEqual(found['exon'].tolist(), [True, False, False, True])
+        self.assertEqual(found['number'].tolist(), ['2/3', '', '1/2', '1/3'])
+        found = self.index.canonical_features(2, [350, 250])
+        self.assertEqual(found['gene_name'].tolist(), ['BBB', 'BBB'])
+        self.assertEqual(found['number'].tolist(), ['1/2', '1/1'])
+
+    def test_minus_strand(self):
+        # no gene or transcript records, so both are spanned from the exons
+        gene = pyensembl_wrappers.get_gene_locus(self.index, 2, 350)
+        self.assertEqual((gene.name, gene.biotype, gene.start, gene.end), ('BBB', 'lncRNA', 100, 400))
+        transcript = pyensembl_wrappers.get_transcript(self.index, 2, 350)
+        self.assertFalse(transcript.canonical)
+        self.assertEqual(pyensembl_wrappers.get_exon(350, transcript).number, '1/2')
+        self.assertEqual(self.index.gene_names_at_locus(2, 50), [])
+
+
+class TestSequenceIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.fasta = os.path.join(self.tmp.name, 'test.fa')
+        with open(self.fasta, 'w') as f:
+            f.write('>chr1 test\nACGTacgtNN\nTTGG\n>chr2\nGATTACA\n')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_fetch(self):
+        index = sequence_index.SequenceIndex(sequence_index.build(self.fasta))
+        self.assertEqual(index.references, ['1', '2'])
+        self.assertEqual(index.fetch('chr1', 2, 12), 'GTacgtNNTT')
+        self.assertEqual(index.fetch('2', 3, 7), 'TACA')
+        self.assertEqual(index.fetch('2', -3, 2), 'GA')
+        self.assertEqual(index.fetch('2', 5, 100), 'CA')
+        self.assertEqual(index.fetch('2', -5, -1), '')
+
+    def test_rebuild(self):
+        sequence_index.build(self.fasta)
+        with open(self.fasta, 'a') as f:
+            f.write('>chr3\nCCC\n')
+        index = sequence_index.SequenceIndex(sequence_index.build(self.fasta))
+        self.assertEqual(index.fetch('chr3'), 'CCC')
+
+
+class TestBgzfFasta(unittest.TestCase):
+    def setUp(self):
+        import pysam
+        self.tmp = tempfile.TemporaryDirectory()
+        fasta = os.path.join(self.tmp.name, 'test.fa')
+        state = np.random.RandomState(0)
+        with open(fasta, 'w') as f:
+            for contig in ('chr1', 'chr2'):
+                seq = ''.join(np.array(list('ACGTacgt'))[state.randint(0, 8, 150000)])
+                f.write('>{}\n{}\n'.format(contig, '\n'.join(
+                    seq[i:i + 60] for i in range(0, len(seq), 60))))
+        pysam.tabix_compress(fasta, fasta + '.gz')
+        self.plain = pysam.FastaFile(fasta)
+        self.bgzf = BgzfFasta(fasta + '.gz', cache_blocks=4)
+
+    def tearDown(self):
+        self.bgzf.close()
+        self.plain.close()
+        self.tmp.cleanup()
+
+    def test_fetch(self):
+        # within a block, across blocks and lines, and past the contig end
+        for contig, start, end in [('chr1', 0, 10), ('chr1', 65500, 65600),
+                                   ('chr2', 1000, 140000), ('chr2', 149990, 150100)]:
+            self.assertEqual(self.bgzf.fetch(contig, start, end),
+                             self.plain.fetch(contig, start, end))
+
+    def test_cache(self):
+        for _ in range(3):
+            self.bgzf.fetch('chr1', 100, 200)
+        self.assertEqual(self.bgzf.cache_info(), (2, 1, 4, 1))
+        self.bgzf.fetch('chr2', 0, 149000)
+        self.assertEqual(self.bgzf.cache_info().currsize, 4)
+
+
+class TestDedup(unittest.TestCase):
+    def test_deduplicate(self):
+        db = pd.DataFrame({
+            'Primer': ['A', 'B', 'C', 'D', 'E', 'F', 'G'],
+            'F_Primer': ['AACCG', 'ttcag', 'CGGTT', 'GGGAA', 'GGGAA', 'AACCG', ''],
+            'R_Primer': ['TTCAG', 'AACCG', 'CTGAA', 'CCCTA', 'CCCTA', 'TTCAG', ''],
+            'Genome': ['hg19', 'hg19', 'hg19', 'hg19', 'hg19', 'hg38', 'hg19'],
+            'Primer_Range': ['chr2:500-600', 'chr2:500-600', 'chr2:700-800',
+                             'chr10:100-200', 'chr2:900-990', 'chr2:500-600',
+                             'chr10:100-200']})
+        unique, aliases = dedup.deduplicate(db)
+        # B swaps A's primers and C reverse complements them, E repeats D
+        # on another range and G shares D's range, while F is on hg38
+        self.assertEqual(unique.Primer.tolist(), ['A', 'D', 'F'])
+        self.assertEqual(aliases.values.tolist(),
+                         [['B', 'A', 'pair+range'], ['C', 'A', 'pair'],
+                          ['E', 'D', 'pair'], ['G', 'D', 'range']])
+
+    def test_link_chain(self):
+        # rows of a shuffled chain alternately share a pair and a range
+        order = np.random.RandomState(0).permutation(1001)
+        pairs, ranges = np.empty(1001, dtype=np.int64), np.empty(1001, dtype=np.int64)
+        pairs[order], ranges[order] = np.arange(1001) // 2, (np.arange(1001) + 1) // 2
+        labels = dedup.link_groups([pairs, ranges, np.arange(1001)])
+        self.assertEqual(labels.tolist(), [0] * 1001)
+        self.assertEqual(dedup.link_groups([np.array([1, 0, 1, 2]), np.array([3, 3, 1, 2])]).tolist(),
+                         [0, 0, 0, 3])
+
+
 class TestMetaData(unittest.TestCase):
     correct = {'genome': None, 
                'ensembl': DATA, 
@@ -1,10 +1,29 @@
-from GeneaPy import get_seq, unknown_primer, primer_finder
+from GeneaPy import geneapy, get_locus_metadata, get_seq, unknown_primer, primer_finder
+from GeneaPy import off_target, reannotate_database
+from GeneaPy.modules import db_cache, metrics, sequence_index
+from GeneaPy.modules import custom_exceptions as ex
+from GeneaPy.modules.annotation_index import build_index
+from GeneaPy.modules import primer_server
+from GeneaPy.modules.primer_server import PrimerDatabase
+import json
 import logging
+import numpy as np
+import pandas as pd
+import random
+import shutil
+import tempfile
+import threading
 import unittest
+import urllib.error
+import urllib.request
+import warnings
 import os
 
 HERE = os.path.dirname(os.path.realpath(__file__))
 DATABASE = HERE+'/expected_output/primer_database.txt'
+# keep the database caches out of expected_output
+CACHE_DIR = tempfile.mkdtemp()
+db_cache.SETTINGS['cache_dir'] = CACHE_DIR
 
 log = logging.getLogger()
 log.disabled = True
@@ -128,6 +147,126 @@ class PrimerFinder(unittest.TestCase):
         input_file = open('temp.txt').read()
         self.assertEqual(input_file, correct)
 
+    def test_combined_filters(self):
+        primers = primer_finder.primer_finder(DATABASE, gene='TGFBR1', exon=9, hg='hg19', size=600)
+        self.assertEqual(primers.Primer.tolist(), ['FUK12'])
+
+    def test_streamed_input_file(self):
+        input_file = HERE+'/expected_output/primer_finder_input.txt'
+        primer_finder.primer_finder(DATABASE, input_file=input_file, output='temp.txt')
+        correct = open('temp.txt').read()
+        counts = primer_finder.stream_primer_finder(DATABASE, input_file, 'temp.txt', chunk_size=1)
+        self.assertEqual(open('temp.txt').read(), correct)
+        self.assertEqual(counts, {'variants': 2, 'primers': 7, 'unmatched': 0})
+
+    def test_sharded_input_file(self):
+        input_file = HERE+'/expected_output/primer_finder_input.txt'
+        correct = primer_finder.primer_finder(DATABASE, input_file=input_file)
+        sharded = primer_finder.primer_finder(DATABASE, input_file=input_file, workers=2)
+        self.assertTrue(sharded.equals(correct))
+
+    def test_best_primers(self):
+        input_file = HERE+'/expected_output/primer_finder_input.txt'
+        best = primer_finder.primer_finder(DATABASE, input_file=input_file, best=2)
+        self.assertEqual(best.Variant.tolist(), ['one', 'one', 'two', 'two'])
+        self.assertEqual(best.Primer.tolist(), ['FUK22', 'HX10', 'LX37', 'FRD6'])
+        self.assertEqual(best.Score.tolist(), [0.535, 0.469, 0.657, 0.58])
+
+    def test_scores_per_variant(self):
+        input_file = HERE+'/expected_output/primer_finder_input.txt'
+        primers = primer_finder.primer_finder(DATABASE, input_file=input_file)
+        one = primers[primers.Variant == 'one']
+        # the larger products of variant two do not change the scores of variant one
+        self.assertEqual(primer_finder.score_primers(primers)[:len(one)].tolist(),
+                         primer_finder.score_primers(one).tolist())
+
+    def test_plan_primers(self):
+        input_file = HERE+'/expected_output/primer_finder_input.txt'
+        plan, uncovered = primer_finder.plan_primers(DATABASE, input_file, distance=100)
+        self.assertEqual(plan.Primer.tolist(), ['FRD6', 'HX10'])
+        self.assertEqual(plan.Variants.tolist(), ['two', 'one'])
+        self.assertEqual(uncovered, [])
+        plan, uncovered = primer_finder.plan_primers(DATABASE, input_file, size=450)
+        self.assertEqual(uncovered, ['one'])
+
+    def write_chain(self, path):
+        # shift hg38 chr18:48,500,001-48,600,000 down 2000bp in hg19
+        with open(path, 'w') as f:
+            f.write('chain 1 chr18 80373285 + 48500000 48600000 chr18 78077248 + 48498000 48598000 1\n100000\n')
+
+    def test_lift_to(self):
+        self.write_chain('hg38ToHg19.over.chain')
+        primers = primer_finder.primer_finder(DATABASE, variant='18:48554500', lift_to='hg19',
+                                              chain='hg38ToHg19.over.chain')
+        os.remove('hg38ToHg19.over.chain')
+        fake = primers[primers.Primer == 'FAKE']
+        self.assertEqual(fake[['Genome', 'Start', 'End']].values.tolist(), [['hg19', 48554413, 48555009]])
+
+    def test_lift_to_workers(self):
+        self.write_chain('temp.chain')
+        with open('temp.input.txt', 'w') as f:
+            f.write('lifted\t18:48554500\nfbn1\t15:48787400\n')
+        results = [primer_finder.primer_finder(DATABASE, input_file='temp.input.txt', lift_to='hg19',
+                                               chain='temp.chain', lift_from='hg38', workers=workers)
+                   for workers in (1, 2)]
+        os.remove('temp.chain')
+        os.remove('temp.input.txt')
+        self.assertTrue(results[1].equals(results[0]))
+        lifted = results[1][results[1].Variant == 'lifted']
+        self.assertEqual(lifted.Primer.tolist(), ['FAKE'])
+
+    def test_lift_named_contigs(self):
+        # chrX primers keep their contig through the liftover
+        with open(DATABASE) as f:
+            header = f.readline()
+        with open('temp.db.txt', 'w') as f:
+            f.write(header + 'XPR\tACGT\tTGCA\thg38\tX1\tX1-001\t-\t-\t100bp\t'
+                    'chrX:1100-1199\t50\n')
+        with open('temp.chain', 'w') as f:
+            f.write('chain 1 chrX 10000 + 1000 2000 chrX 10000 + 3000 4000 1\n1000\n')
+        with open('temp.input.txt', 'w') as f:
+            f.write('x\tX:3150\n')
+        results = [primer_finder.primer_finder('temp.db.txt', input_file='temp.input.txt', lift_to='hg19',
+                                               chain='temp.chain', lift_from='hg38', workers=workers)
+                   for workers in (1, 2)]
+        for path in ('temp.db.txt', 'temp.chain', 'temp.input.txt'):
+            os.remove(path)
+        for primers in results:
+            self.assertEqual(primers[['Primer', 'Dist_F', 'Dist_R']].values.tolist(), [['XPR', 50, 49]])
+
+    def test_saved_positions(self):
+        db = pd.DataFrame({'Chrom': [1, 'X', None], 'Start': [10, 20, 30], 'End': [15, 25, 35]})
+        with tempfile.TemporaryDirectory() as tmp:
+            positions = primer_finder.load_positions(*primer_finder.save_positions(db, tmp))
+            self.assertIsInstance(positions.Start.values.base, np.memmap)
+            self.assertEqual(positions.Chrom.tolist()[:2], [1, 'X'])
+            self.assertTrue(pd.isnull(positions.Chrom.iloc[2]))
+            self.assertEqual(positions.End.tolist(), [15, 25, 35])
+            del positions
+
+    def test_lift_from(self):
+        self.write_chain('temp.chain')
+        with self.assertRaises(ex.UnknownChainBuild):
+            primer_finder.primer_finder(DATABASE, variant='18:48554500', lift_to='hg19', chain='temp.chain')
+        # only hg19 primers are converted by a hg19 chain, so FAKE is dropped
+        primers = primer_finder.primer_finder(DATABASE, variant='18:48554500', lift_to='hg38',
+                                              chain='temp.chain', lift_from='hg19')
+        os.remove('temp.chain')
+        self.assertNotIn('FAKE', primers.Primer.tolist())
+
+    def test_compact(self):
+        correct = primer_finder.primer_finder(DATABASE, gene='FBN1', size=500)
+        primers = primer_finder.primer_finder(DATABASE, gene='FBN1', size=500, compact=True)
+        self.assertEqual(primers.F_Primer.tolist(), correct.F_Primer.tolist())
+        self.assertEqual(list(primers.columns), list(correct.columns))
+
+    def test_compact_output(self):
+        for cache in (True, False):
+            primer_finder.primer_finder(DATABASE, gene='FBN1', output='temp.txt', cache=cache)
+            correct = open('temp.txt').read()
+            primer_finder.primer_finder(DATABASE, gene='FBN1', output='temp.txt', cache=cache, compact=True)
+            self.assertEqual(open('temp.txt').read(), correct)
+
     def tearDown(self):
         try:
             os.remove('temp.txt')
@@ -135,5 +274,249 @@ class PrimerFinder(unittest.TestCase):
             pass
 
 
+class PrimerServer(unittest.TestCase):
+    database = PrimerDatabase(DATABASE)
+
+    def test_variant_query(self):
+        correct = primer_finder.primer_finder(DATABASE, variant='15:48787400', distance=50)
+        primers, unmatched = self.database.query({'variant': '15:48787400', 'distance': 50})
+        self.assertTrue(primers.equals(correct))
+
+    def test_variants_query(self):
+        primers, unmatched = self.database.query({'variants': [['one', '15:48787380'],
+                                                               ['none', '3:100']]})
+        self.assertEqual(primers.Primer.tolist(), ['FRD7', 'HX10', 'LX20', 'FUK22'])
+        self.assertEqual(unmatched, ['none'])
+
+    def test_failed_reload(self):
+        path = os.path.join(CACHE_DIR, 'reload.txt')
+        shutil.copy(DATABASE, path)
+        database = PrimerDatabase(path)
+        loaded = database.current()
+        with open(path, 'w') as f:
+            f.write('not a primer database\n')
+        os.utime(path, ns=(0, 0))
+        # the previous database is kept and the broken file not parsed again
+        self.assertIs(database.current(), loaded)
+        self.assertEqual(database.mtime, 0)
+
+    def test_health_not_loaded(self):
+        server = primer_server.PrimerServer(('127.0.0.1', 0), PrimerDatabase('missing.txt'))
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            with self.assertRaises(urllib.error.HTTPError) as cm:
+                urllib.request.urlopen('http://127.0.0.1:{}/health'.format(server.server_port))
+            self.assertEqual(cm.exception.code, 503)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+class LocusMetadata(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.genome = os.path.join(self.tmp, 'genome.fa')
+        with open(self.genome, 'w') as f:
+            f.write('>chr1\n' + ''.join(random.Random(1).choice('acgt') for _ in range(2000)))
+        gtf = os.path.join(self.tmp, 'test.gtf')
+        attributes = 'gene_id "G1"; gene_name "AAA"; transcript_id "T1";'
+        with open(gtf, 'w') as f:
+            for number, (start, end) in enumerate([(100, 200), (500, 600)], 1):
+                f.write('1\tt\texon\t{}\t{}\t.\t+\t.\t{} exon_id "E{}";\n'.format(
+                    start, end, attributes, number))
+        self.annotation = build_index(gtf, os.path.join(self.tmp, 'index')).path
+        self.positions = os.path.join(self.tmp, 'positions.txt')
+        with open(self.positions, 'w') as f:
+            f.write('chr1:150\nchr1:300\nchr1:1500\nchr1:550\n')
+
+    def test_workers(self):
+        outputs = []
+        calls = []
+        for workers in (1, 2):
+            output = os.path.join(self.tmp, 'output{}.txt'.format(workers))
+            metrics.reset()
+            get_locus_metadata.output_all_metadata(self.positions, 10, output, 'hg19',
+                                                   genome=self.genome, annotation=self.annotation,
+                                                   workers=workers)
+            calls.append({t['name']: t['calls'] for t in metrics.snapshot()['timers']})
+            with open(output) as f:
+                outputs.append(f.read())
+        metrics.reset()
+        self.assertEqual(outputs[0], outputs[1])
+        # the lookups made in the workers are merged into this process's metrics
+        self.assertEqual(calls[0], calls[1])
+        self.assertIn('annotation_lookup', calls[1])
+        rows = [line.split('\t') for line in outputs[0].splitlines()[1:]]
+        self.assertEqual([(r[0], r[7], r[8], r[9]) for r in rows],
+                         [('chr1:150', 'E1', '1/2', '-'), ('chr1:300', 'N/A', '-', '1/1'),
+                          ('chr1:550', 'E2', '2/2', '-')])
+        self.assertTrue(os.path.isdir(sequence_index.sidecar(self.genome)))
+
+    def test_workers_bgzf(self):
+        import pysam
+        pysam.tabix_compress(self.genome, self.genome + '.gz')
+        outputs = []
+        for genome, workers in ((self.genome, 1), (self.genome + '.gz', 2)):
+            output = os.path.join(self.tmp, 'output{}.txt'.format(workers))
+            get_locus_metadata.output_all_metadata(self.positions, 10, output, 'hg19', genome=genome,
+                                                   annotation=self.annotation, workers=workers)
+            with open(output) as f:
+                outputs.append(f.read())
+        metrics.reset()
+        self.assertEqual(outputs[0], outputs[1])
+        # the bgzipped genome is read as it is rather than decompressed to an index
+        self.assertFalse(os.path.exists(sequence_index.sidecar(self.genome + '.gz')))
+
+    def test_bed(self):
+        bed = os.path.join(self.tmp, 'targets.bed')
+        with open(bed, 'w') as f:
+            f.write('track name=targets\nchr1\t1000\t1100\tnone\nchr1\t150\t520\tt1\n')
+        output = os.path.join(self.tmp, 'output.txt')
+        get_locus_metadata.output_bed_metadata(bed, output, self.annotation)
+        with open(output) as f:
+            rows = [line.rstrip('\n').split('\t') for line in f][1:]
+        self.assertEqual([(r[0], r[1], r[2], r[8], r[9], r[10], r[11]) for r in rows],
+                         [('chr1:151-520', 't1', 'AAA', '1/2', '-', '1:100-200', '50'),
+                          ('chr1:151-520', 't1', 'AAA', '-', '1/1', '1:201-499', '299'),
+                          ('chr1:151-520', 't1', 'AAA', '2/2', '-', '1:500-600', '21'),
+                          ('chr1:1001-1100', 'none', '-', '-', '-', '-', '-')])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+
+class Geneapy(unittest.TestCase):
+    def test_manifest(self):
+        jobs = [{'command': 'primer_finder',
+                 'args': {'database': DATABASE, 'variant': '15:48787400',
+                          'distance': 50, 'output': 'temp.txt'}},
+                {'name': 'bad', 'command': 'primer_finder', 'args': ['--nope']}]
+        with open('temp.json', 'w') as f:
+            json.dump({'jobs': jobs}, f)
+        results = geneapy.run_manifest('temp.json')
+        self.assertEqual([r['name'] for r in results], ['job 1', 'bad'])
+        self.assertEqual(results[0]['status'], 'ok')
+        self.assertTrue(results[1]['status'].startswith('failed'))
+        correct = primer_finder.primer_finder(DATABASE, variant='15:48787400', distance=50)
+        with open('temp.txt') as f:
+            self.assertEqual(len(f.readlines()), len(correct) + 1)
+
+    def test_manifest_isolation(self):
+        args = {'database': DATABASE, 'variant': '15:48787400', 'output': 'temp.txt'}
+        jobs = [{'command': 'primer_finder', 'args': dict(args, metrics='temp{}.json'.format(n))}
+                for n in (1, 2)]
+        with open('temp.json', 'w') as f:
+            json.dump({'jobs': jobs}, f)
+        # so both jobs find the database cached
+        primer_finder.database2df(DATABASE)
+        filters = warnings.filters[:]
+        handlers = logging.getLogger().handlers[:]
+        geneapy.run_manifest('temp.json')
+        self.assertEqual(warnings.filters, filters)
+        self.assertEqual(logging.getLogger().handlers, handlers)
+        # the metrics of the first job are not added to the second's
+        snapshots = []
+        for n in (1, 2):
+            with open('temp{}.json'.format(n)) as f:
+                snapshots.append(json.load(f)['counters'])
+            os.remove('temp{}.json'.format(n))
+        self.assertEqual(snapshots[0], snapshots[1])
+
+    def test_job_argv(self):
+        argv = geneapy.job_argv({'variant': '15:1', 'plan': True, 'no_cache': False,
+                                 'best': 2})
+        self.assertEqual(argv, ['--variant', '15:1', '--plan', '--best', '2'])
+
+    def tearDown(self):
+        for f in ('temp.txt', 'temp.json'):
+            try:
+                os.remove(f)
+            except FileNotFoundError:
+                pass
+
+
+class DedupDatabase(unittest.TestCase):
+    def test_dedup(self):
+        geneapy.run_command('dedup_database', ['-d', DATABASE, '-o', 'temp.txt'])
+        with open('temp_aliases.txt') as f:
+            aliases = [line.split('\t')[0] for line in f.readlines()[1:]]
+        self.assertEqual(len(aliases), 7)
+        # the deduplicated database finds the same primers less the aliases
+        correct = primer_finder.primer_finder(DATABASE, variant='15:48787400',
+                                              distance=50)
+        found = primer_finder.primer_finder('temp.txt', variant='15:48787400',
+                                            distance=50, cache=False)
+        self.assertEqual(sorted(found.Primer),
+                         sorted(p for p in correct.Primer if p not in aliases))
+
+    def tearDown(self):
+        for f in ('temp.txt', 'temp_aliases.txt'):
+            try:
+                os.remove(f)
+            except FileNotFoundError:
+                pass
+
+
+class OffTarget(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.genome = os.path.join(self.tmp, 'genome.fa')
+        amplicon = 'CTGTTCACAGGGCTTGTTCC' + 'A' * 40 + 'GGAACAAGCCCTGTGAACAG'
+        with open(self.genome, 'w') as f:
+            f.write('>chr7\n{0}\n>chrX\n{0}\n'.format('T' * 10 + amplicon + 'T' * 10))
+        self.database = os.path.join(self.tmp, 'primers.txt')
+        with open(self.database, 'w') as f:
+            f.write('Primer\tF_Primer\tR_Primer\tPrimer_Range\n'
+                    'P7\tCTGTTCACAGGGCTTGTTCC\tCTGTTCACAGGGCTTGTTCC\tchr7:11-90\n'
+                    'PX\tCTGTTCACAGGGCTTGTTCC\tCTGTTCACAGGGCTTGTTCC\tchrX:11-90\n')
+
+    def test_on_target(self):
+        sites = off_target.off_target(os.path.join(self.tmp, 'index'), self.database,
+                                      genome=self.genome, mismatches=1)
+        on_target = sites[sites.On_Target]
+        self.assertEqual(sorted(set(zip(on_target.Primer, on_target.Chrom))),
+                         [('P7', '7'), ('PX', 'X')])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+
+class ReannotateDatabase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        gtf = os.path.join(self.tmp, 'test.gtf')
+        attributes = 'gene_id "G1"; gene_name "NEW"; transcript_id "T1"; transcript_name "NEW-201";'
+        with open(gtf, 'w') as f:
+            for start, end in [(100, 200), (500, 600)]:
+                f.write('7\tt\texon\t{}\t{}\t.\t+\t.\t{}\n'.format(start, end, attributes))
+        self.annotation = build_index(gtf, os.path.join(self.tmp, 'index')).path
+        self.db = pd.DataFrame({
+            'Primer': ['A', 'B', 'C', 'D'],
+            'Genome': ['hg19', 'hg19', 'hg38', 'hg19'],
+            'Gene': ['OLD'] * 4, 'Transcript': ['OLD-001'] * 4,
+            'Exon': ['1/2', '1/2', '1/2', '-'], 'Intron': ['-', '-', '-', '2/3'],
+            'Product_Size': ['101bp', '201bp', '101bp', '101bp'],
+            'Primer_Range': ['chr7:500-600', 'chr7:200-400', 'chr7:500-600', 'chr7:5000-5100']})
+
+    def test_reannotate(self):
+        db, rows, changed = reannotate_database.reannotate_database(
+            self.db, self.annotation, 'GRCh37')
+        self.assertEqual(rows.tolist(), [0, 1, 3])
+        self.assertEqual(changed.tolist(), [0, 1, 3])
+        self.assertEqual(db[['Gene', 'Transcript', 'Exon', 'Intron']].values.tolist(),
+                         [['NEW', 'NEW-201', '2/2', '-'], ['NEW', 'NEW-201', '-', '1/1'],
+                          ['OLD', 'OLD-001', '1/2', '-'], ['-', '-', '-', '-']])
+        self.assertTrue(db[['Primer', 'Genome', 'Product_Size', 'Primer_Range']].equals(
+            self.db[['Primer', 'Genome', 'Product_Size', 'Primer_Range']]))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+
+def tearDownModule():
+    shutil.rmtree(CACHE_DIR)
+
+
 if __name__ == '__main__':
     unittest.main()